@@ -1,24 +1,451 @@
 import paho.mqtt.client as mqtt
 import json
-from datetime import datetime
-import requests
+import math
+import queue
+import re
+import sys
+import threading
 import time
+import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
-import os
 from datetime import datetime
+import os
+
+from spool import Spool, shard_of
 
 # Load environment variables from .env file
 load_dotenv()
 
 # MQTT Broker settings
-BROKER = "broker.hivemq.com"
-PORT = 1883
+BROKER = os.getenv("MQTT_BROKER", "broker.hivemq.com")
+PORT = int(os.getenv("MQTT_PORT", "1883"))
 BASE_TOPIC = "apple/ece140/sensors"  # Load BASE_TOPIC from .env file
 TOPIC = BASE_TOPIC + "/#"
 print("Base topic: ", BASE_TOPIC)
 
 # Web server settings
-WEB_SERVER_URL = "http://localhost:6543/add_temp"  # Replace with your server's URL
+WEB_SERVER_URL = os.getenv("WEB_SERVER_URL", "http://localhost:6543/add_temp")  # Replace with your server's URL
+
+# Forwarding settings
+#   BRIDGE_MODE            "http" POSTs each reading to WEB_SERVER_URL; "direct"
+#                          writes batches straight into MySQL through the app's
+#                          write path (needs the app's requirements.txt and
+#                          database settings)
+#   BRIDGE_WORKERS         concurrent forwarders; readings from one MAC address
+#                          always go to the same worker, so they stay in order
+#   BRIDGE_QUEUE_SIZE      readings held in memory per worker before new ones
+#                          are dropped
+#   BRIDGE_MAX_RETRIES     attempts after the first before a reading is dropped
+#   BRIDGE_RETRY_BACKOFF   seconds before the first retry, doubled each time
+#   BRIDGE_HTTP_TIMEOUT    seconds to wait for the web server
+#   BRIDGE_METRICS_INTERVAL  seconds between metrics log lines
+#   BRIDGE_BATCH_SIZE      direct mode: most readings written per transaction
+#   BRIDGE_BATCH_WINDOW_MS direct mode: longest a worker waits to fill a batch
+BRIDGE_MODE = os.getenv("BRIDGE_MODE", "http")
+BRIDGE_WORKERS = int(os.getenv("BRIDGE_WORKERS", "8"))
+BRIDGE_QUEUE_SIZE = int(os.getenv("BRIDGE_QUEUE_SIZE", "10000"))
+BRIDGE_MAX_RETRIES = int(os.getenv("BRIDGE_MAX_RETRIES", "5"))
+BRIDGE_RETRY_BACKOFF = float(os.getenv("BRIDGE_RETRY_BACKOFF", "0.5"))
+BRIDGE_HTTP_TIMEOUT = float(os.getenv("BRIDGE_HTTP_TIMEOUT", "5"))
+BRIDGE_METRICS_INTERVAL = float(os.getenv("BRIDGE_METRICS_INTERVAL", "30"))
+BRIDGE_BATCH_SIZE = int(os.getenv("BRIDGE_BATCH_SIZE", "500"))
+BRIDGE_BATCH_WINDOW_MS = int(os.getenv("BRIDGE_BATCH_WINDOW_MS", "200"))
+
+# Consumer partition settings, set by supervisor.py when it runs several
+# bridge processes. Every process subscribes to the same topic and keeps only
+# the devices whose MAC address hashes to its index, so each device is
+# handled by exactly one process and its readings stay in order.
+#   BRIDGE_CONSUMERS       number of bridge processes
+#   BRIDGE_CONSUMER_INDEX  which of them this one is
+BRIDGE_CONSUMERS = int(os.getenv("BRIDGE_CONSUMERS", "1"))
+BRIDGE_CONSUMER_INDEX = int(os.getenv("BRIDGE_CONSUMER_INDEX", "0"))
+
+# Every consumer receives the whole fleet's messages, so the owner check runs
+# on the raw payload before anything is decoded
+MAC_PATTERN = re.compile(rb'"mac_address"\s*:\s*"([^"]*)"')
+
+# Spool settings
+#   BRIDGE_SPOOL_PATH          SQLite file holding readings that could not be
+#                              forwarded; empty drops them instead
+#   BRIDGE_SPOOL_SYNC_MS       how often spooled readings are committed to disk
+#   BRIDGE_REPLAY_RATE         readings per second replayed once the target is back
+#   BRIDGE_REPLAY_BACKOFF_MAX  longest pause, in seconds, between replay attempts
+#                              while the target keeps failing
+BRIDGE_SPOOL_PATH = os.getenv("BRIDGE_SPOOL_PATH", "bridge-spool.sqlite3")
+BRIDGE_SPOOL_SYNC_MS = int(os.getenv("BRIDGE_SPOOL_SYNC_MS", "200"))
+BRIDGE_REPLAY_RATE = float(os.getenv("BRIDGE_REPLAY_RATE", "200"))
+BRIDGE_REPLAY_BACKOFF_MAX = float(os.getenv("BRIDGE_REPLAY_BACKOFF_MAX", "30"))
+
+# Seconds an idle worker waits between looks at its spooled readings
+REPLAY_POLL_INTERVAL = 0.05
+
+# Outcomes of a forward attempt
+FORWARDED = "forwarded"
+FAILED = "failed"
+REJECTED = "rejected"
+
+
+class RetryableError(Exception):
+    """A forward that failed in a way worth trying again.
+
+    A forwarder that already wrote part of the batch passes the readings
+    still to send as unsent, and how many it rejected on the way as rejected.
+    """
+
+    def __init__(self, message, retry_after=None, unsent=None, rejected=0):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.unsent = unsent
+        self.rejected = rejected
+
+
+class Metrics:
+    """Counters and forward latency, reported and reset every interval."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {"received": 0, "forwarded": 0, "retried": 0, "dropped_full": 0, "dropped_failed": 0,
+                          "rejected": 0}
+        self._latencies = []
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def observe(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def snapshot(self) -> dict:
+        """Returns the counters so far and latency percentiles since the last snapshot."""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            self._latencies = []
+            counters = dict(self._counters)
+        if latencies:
+            counters["latency_p50_ms"] = round(latencies[len(latencies) // 2] * 1000, 1)
+            counters["latency_p99_ms"] = round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 1)
+            counters["latency_max_ms"] = round(latencies[-1] * 1000, 1)
+        return counters
+
+
+class HttpForwarder:
+    """POSTs readings to /add_temp, one request each, over one keep-alive connection pool."""
+
+    batch_size = 1
+    batch_window = 0.0
+
+    def __init__(self, url, workers, timeout):
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def send(self, batch):
+        received_at, reading = batch[0]
+        # A reading replayed from the spool keeps the time it arrived, not the time it is sent
+        payload = {**reading, "timestamp": received_at.isoformat()}
+        try:
+            response = self.session.post(self.url, json=payload, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            raise RetryableError(str(e))
+        if response.status_code == 429 or response.status_code >= 500:
+            retry_after = response.headers.get("Retry-After")
+            raise RetryableError(
+                f"server answered {response.status_code}",
+                float(retry_after) if retry_after and retry_after.isdigit() else None,
+            )
+        if response.status_code != 200:
+            # The reading itself was rejected; sending it again will not help
+            raise ValueError(f"server rejected reading: {response.status_code} {response.text}")
+
+    def close(self):
+        self.session.close()
+
+
+def reading_row(received_at, reading):
+    """Returns the temperature row for a reading, or None if the database would refuse it.
+
+    Same row layout and limits /add_temp gives the ingest buffer.
+    """
+    try:
+        value = float(reading["value"])
+        unit, mac_address = reading["unit"], reading["mac_address"]
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not math.isfinite(value) or not isinstance(unit, str) or len(unit) > 50:
+        return None
+    if not isinstance(mac_address, str) or not mac_address or len(mac_address) > 255:
+        return None
+    return value, unit, received_at, mac_address
+
+
+class DatabaseWriter:
+    """Writes batches of readings into the temperature table, skipping the HTTP hop.
+
+    Goes through app.readings, so rollups and reading counts stay current,
+    but the web workers' live /stream subscribers do not see these readings.
+    """
+
+    def __init__(self, batch_size, batch_window):
+        # The app package lives next to Server/
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        import mysql.connector
+        from app.readings import write_readings
+
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self._write_readings = write_readings
+        self._errors = mysql.connector.errors
+
+    def send(self, batch):
+        """Writes a batch, dropping the readings the database cannot take; returns how many it dropped.
+
+        Invalid readings are dropped up front. A batch the database refuses
+        with an integrity or data error is split in halves until the offending
+        readings are isolated, so one bad reading does not take the rest of
+        the batch with it.
+        """
+        rejected = 0
+        valid = []
+        for item in batch:
+            if reading_row(*item) is None:
+                print(f"Dropped invalid reading: {item[1]}")
+                rejected += 1
+            else:
+                valid.append(item)
+        parts = [valid] if valid else []
+        while parts:
+            part = parts.pop()
+            try:
+                self._write_readings("temperature", [reading_row(*item) for item in part])
+            except (self._errors.OperationalError, self._errors.InterfaceError, self._errors.PoolError) as e:
+                # Only what is left goes round again; the parts already written stay written
+                raise RetryableError(str(e), unsent=part + [item for rest in reversed(parts) for item in rest],
+                                     rejected=rejected)
+            except (self._errors.IntegrityError, self._errors.DataError) as e:
+                if len(part) == 1:
+                    print(f"Database rejected reading {part[0][1]}: {e}")
+                    rejected += 1
+                else:
+                    middle = len(part) // 2
+                    parts += [part[middle:], part[:middle]]
+            except self._errors.Error as e:
+                raise ValueError(f"database rejected batch: {e}")
+        return rejected
+
+    def close(self):
+        pass
+
+
+class Bridge:
+    """Forwards MQTT readings from bounded per-worker queues.
+
+    on_message only parses and enqueues, so the paho network loop never
+    waits on the web server. Workers hand the forwarder up to its
+    batch_size readings at a time, waiting at most its batch_window seconds
+    for a batch to fill.
+
+    With a spool, readings that cannot be forwarded are written to disk
+    instead of dropped, and while the target is failing new readings go
+    straight there. Each worker replays its shard of the spool at up to
+    replay_rate readings per second, and a device's new readings wait behind
+    its spooled ones so they still arrive in order.
+    """
+
+    def __init__(self, forwarder, workers, queue_size, max_retries, retry_backoff,
+                 spool=None, replay_rate=0.0, replay_backoff_max=30.0, partitions=1):
+        self.forwarder = forwarder
+        self.partitions = partitions
+        self.metrics = Metrics()
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.spool = spool
+        self.replay_rate = replay_rate / workers
+        self.replay_backoff_max = replay_backoff_max
+        self.queues = [queue.Queue(queue_size) for _ in range(workers)]
+        self.threads = [
+            threading.Thread(target=self._work, args=(shard,), name=f"forwarder-{shard}", daemon=True)
+            for shard in range(workers)
+        ]
+        self._stopping = threading.Event()
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+        threading.Thread(target=self._report, name="bridge-metrics", daemon=True).start()
+
+    def submit(self, reading) -> bool:
+        """Queues a reading for its MAC address's worker; returns False if that queue is full."""
+        self.metrics.incr("received")
+        shard = shard_of(reading["mac_address"], len(self.queues), self.partitions)
+        try:
+            self.queues[shard].put_nowait((time.monotonic(), datetime.now(), reading))
+            return True
+        except queue.Full:
+            self.metrics.incr("dropped_full")
+            return False
+
+    def _forward(self, batch, retries):
+        """Sends a batch, retrying transient failures; returns (outcome, unsent).
+
+        outcome is FORWARDED, FAILED or REJECTED, and unsent the readings that
+        were not forwarded: those to spool on FAILED, to drop on REJECTED.
+        Counts the forwarded and individually rejected readings.
+        """
+        pending = batch
+        rejected = 0
+        for attempt in range(retries + 1):
+            try:
+                rejected += self.forwarder.send(pending) or 0
+                pending = []
+                outcome = FORWARDED
+                break
+            except RetryableError as e:
+                if e.unsent is not None:
+                    pending = e.unsent
+                rejected += e.rejected
+                if attempt == retries or self._stopping.is_set():
+                    print(f"Could not forward {len(pending)} readings: {e}")
+                    outcome = FAILED
+                    break
+                self.metrics.incr("retried")
+                time.sleep(e.retry_after or self.retry_backoff * 2 ** attempt)
+            except ValueError as e:
+                print(e)
+                outcome = REJECTED
+                break
+        self.metrics.incr("forwarded", len(batch) - len(pending) - rejected)
+        self.metrics.incr("rejected", rejected)
+        return outcome, pending
+
+    def _next_batch(self, readings, wait):
+        """Returns (items, stop): a batch taken from the queue and whether the stop marker was seen.
+
+        Gives up with an empty batch after wait seconds (None waits for ever).
+        """
+        try:
+            item = readings.get(timeout=wait)
+        except queue.Empty:
+            return [], False
+        if item is None:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.forwarder.batch_window
+        while len(batch) < self.forwarder.batch_size:
+            try:
+                item = readings.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _deliver(self, shard, batch, replay):
+        if self.spool is not None:
+            # Readings of devices that already have spooled ones queue up behind them
+            held, live = [], []
+            for item in batch:
+                (held if self.spool.holds(item[2]["mac_address"]) else live).append(item)
+            if held:
+                self.spool.append(shard, [(received_at, reading) for _, received_at, reading in held])
+            batch = live
+            if not batch:
+                return
+            if time.monotonic() < replay["retry_at"]:
+                # The target is failing; do not hold up the queue retrying
+                self.spool.append(shard, [(received_at, reading) for _, received_at, reading in batch])
+                return
+
+        outcome, unsent = self._forward(
+            [(received_at, reading) for _, received_at, reading in batch], self.max_retries
+        )
+        if outcome == FORWARDED:
+            now = time.monotonic()
+            for queued_at, _, _ in batch:
+                self.metrics.observe(now - queued_at)
+        elif outcome == FAILED and self.spool is not None:
+            self.spool.append(shard, unsent)
+            self._back_off(replay)
+        else:
+            self.metrics.incr("dropped_failed", len(unsent))
+
+    def _back_off(self, replay):
+        replay["backoff"] = min(self.replay_backoff_max, replay["backoff"] * 2 or self.retry_backoff)
+        replay["retry_at"] = time.monotonic() + replay["backoff"]
+
+    def _replay(self, shard, readings, replay):
+        """Forwards spooled readings of this shard while the live queue is idle and the rate allows."""
+        while self.spool.pending(shard) and readings.empty() and not self._stopping.is_set():
+            now = time.monotonic()
+            if now < replay["retry_at"]:
+                return
+            # Token bucket allowing bursts of up to one second's worth
+            replay["tokens"] = min(
+                max(self.replay_rate, 1.0),
+                replay["tokens"] + (now - replay["refilled_at"]) * self.replay_rate,
+            )
+            replay["refilled_at"] = now
+            if replay["tokens"] < 1:
+                return
+            entries = self.spool.peek(shard, int(min(replay["tokens"], self.forwarder.batch_size)))
+            items = [(received_at, reading) for _, received_at, reading in entries]
+            outcome, unsent = self._forward(items, 0)
+            if outcome == FAILED:
+                # Readings written before the failure must not be replayed again
+                left = {id(item) for item in unsent}
+                self.spool.remove(shard, [entry for entry, item in zip(entries, items) if id(item) not in left])
+                self._back_off(replay)
+                return
+            self.spool.remove(shard, entries, replayed=outcome == FORWARDED)
+            replay["tokens"] -= len(entries)
+            replay["backoff"] = 0.0
+
+    def _work(self, shard):
+        readings = self.queues[shard]
+        replay = {"tokens": 0.0, "refilled_at": time.monotonic(), "retry_at": 0.0, "backoff": 0.0}
+        while True:
+            # Wake up now and then to replay the spool when no live readings arrive
+            spooled = self.spool is not None and self.spool.pending(shard)
+            batch, stop = self._next_batch(readings, REPLAY_POLL_INTERVAL if spooled else None)
+            if batch:
+                self._deliver(shard, batch, replay)
+            if self.spool is not None:
+                self._replay(shard, readings, replay)
+            if stop:
+                return
+
+    def queue_depth(self) -> int:
+        return sum(q.qsize() for q in self.queues)
+
+    def _status(self) -> str:
+        spool = self.spool.stats() if self.spool is not None else {}
+        return f"queue_depth={self.queue_depth()} {self.metrics.snapshot()} {spool}"
+
+    def _report(self):
+        while not self._stopping.wait(BRIDGE_METRICS_INTERVAL):
+            print(f"Bridge metrics: {self._status()}")
+
+    def stop(self, timeout=10.0):
+        """Stops the workers once they have drained their queues, waiting at most timeout seconds."""
+        deadline = time.monotonic() + timeout
+        for q in self.queues:
+            try:
+                q.put(None, timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                pass
+        for thread in self.threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        self._stopping.set()
+        self.forwarder.close()
+        print(f"Bridge stopped: {self._status()}")
+        if self.spool is not None:
+            self.spool.close()
+
 
 def on_connect(client, userdata, flags, rc):
     """Callback for when the client connects to the broker."""
@@ -31,43 +458,62 @@ def on_connect(client, userdata, flags, rc):
 
 def on_message(client, userdata, msg):
     """Callback for when a message is received."""
+    bridge = userdata
+    if BRIDGE_CONSUMERS > 1 and msg.topic == BASE_TOPIC + '/readings':
+        match = MAC_PATTERN.search(msg.payload)
+        if match and shard_of(match.group(1).decode(), BRIDGE_CONSUMERS) != BRIDGE_CONSUMER_INDEX:
+            return  # another consumer's device
     try:
         payload = json.loads(msg.payload.decode())
 
-
         if msg.topic == BASE_TOPIC + '/readings':
-            print(f"Payload received: {payload}")
-
+            if shard_of(payload["mac_address"], BRIDGE_CONSUMERS) != BRIDGE_CONSUMER_INDEX:
+                return
             # Extract temperature data
-            temperature = payload["temperature"]
-            mac_address = payload["mac_address"]
-            url = f"http://0.0.0.0:6543/add_temp"
-            data = {"value": temperature, "unit": "celsius", "mac_address": mac_address}
-            print(data)
-            # Send POST request to your web server
-            try:
-                response = requests.post(
-                    WEB_SERVER_URL,
-                    json=data,
-                    timeout=5
-                )
-                if response.status_code == 200:
-                    print("Temperature data sent successfully!")
-                else:
-                    print(f"Failed to send data: {response.status_code}")
-            except requests.exceptions.RequestException as e:
-                print(f"Error sending POST request: {e}")
-
-            # Wait for 5 seconds before sending the next request
-            time.sleep(5)
+            data = {"value": payload["temperature"], "unit": "celsius", "mac_address": payload["mac_address"]}
+            if not bridge.submit(data):
+                print(f"Forward queue full, dropped reading from {data['mac_address']}")
 
     except json.JSONDecodeError:
         print(f"\nReceived non-JSON message on {msg.topic}:")
         print(f"Payload: {msg.payload.decode()}")
+    except KeyError as e:
+        print(f"Reading on {msg.topic} is missing {e}")
+
+def make_forwarder(mode):
+    if mode == "direct":
+        return DatabaseWriter(BRIDGE_BATCH_SIZE, BRIDGE_BATCH_WINDOW_MS / 1000)
+    if mode == "http":
+        return HttpForwarder(WEB_SERVER_URL, BRIDGE_WORKERS, BRIDGE_HTTP_TIMEOUT)
+    raise ValueError(f"Unknown BRIDGE_MODE {mode!r}, expected 'http' or 'direct'")
+
+def spool_path():
+    """Each consumer process gets its own spool file."""
+    if BRIDGE_CONSUMERS == 1:
+        return BRIDGE_SPOOL_PATH
+    root, ext = os.path.splitext(BRIDGE_SPOOL_PATH)
+    return f"{root}-{BRIDGE_CONSUMER_INDEX}{ext}"
 
 def main():
+    print(f"Bridge mode: {BRIDGE_MODE}, consumer {BRIDGE_CONSUMER_INDEX + 1} of {BRIDGE_CONSUMERS}")
+    spool = None
+    if BRIDGE_SPOOL_PATH:
+        spool = Spool(spool_path(), BRIDGE_WORKERS, BRIDGE_SPOOL_SYNC_MS / 1000, stride=BRIDGE_CONSUMERS)
+    bridge = Bridge(
+        make_forwarder(BRIDGE_MODE),
+        workers=BRIDGE_WORKERS,
+        queue_size=BRIDGE_QUEUE_SIZE,
+        max_retries=BRIDGE_MAX_RETRIES,
+        retry_backoff=BRIDGE_RETRY_BACKOFF,
+        spool=spool,
+        replay_rate=BRIDGE_REPLAY_RATE,
+        replay_backoff_max=BRIDGE_REPLAY_BACKOFF_MAX,
+        partitions=BRIDGE_CONSUMERS,
+    )
+    bridge.start()
+
     # Create MQTT client
-    client = mqtt.Client()
+    client = mqtt.Client(userdata=bridge)
     print("Creating MQTT client...")
     client.on_connect = on_connect
     client.on_message = on_message
@@ -83,9 +529,11 @@ def main():
         print("\nDisconnecting from broker...")
         client.loop_stop()
         client.disconnect()
+        bridge.stop()
         print("Exited successfully!!")
     except Exception as e:
         print(f"Error: {e}")
+        bridge.stop()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
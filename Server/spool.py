@@ -0,0 +1,139 @@
+"""Durable on-disk spool for readings the bridge could not forward.
+
+Readings are appended to an SQLite database in WAL mode. Appends are
+committed (and fsynced) together every sync_interval seconds rather than one
+by one, so a crash loses at most that window of spooled readings. Rows
+remember the worker shard of their MAC address, and each worker replays
+only its own shard in append order, which keeps every device's readings in
+order. A reading may be forwarded twice if the bridge dies between a
+successful replay and the commit that removes it.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter
+from datetime import datetime
+
+
+def shard_of(mac_address: str, shards: int, stride: int = 1) -> int:
+    """Maps a MAC address to one of shards buckets.
+
+    A bridge process that only sees the devices of one consumer partition
+    (crc32 % stride) passes stride=consumers, so its own workers still split
+    those devices evenly.
+    """
+    return zlib.crc32(mac_address.encode()) // stride % shards
+
+
+class Spool:
+    def __init__(self, path, shards, sync_interval, stride=1):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS spool (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                shard INTEGER NOT NULL,
+                mac_address TEXT NOT NULL,
+                received_at TEXT NOT NULL,
+                reading TEXT NOT NULL,
+                spooled_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_spool_shard ON spool (shard, seq)")
+
+        # The worker count may have changed since these rows were spooled
+        self._pending = Counter()
+        for mac_address, count in self._conn.execute("SELECT mac_address, COUNT(*) FROM spool GROUP BY mac_address"):
+            self._pending[mac_address] = count
+            self._conn.execute(
+                "UPDATE spool SET shard = ? WHERE mac_address = ?", (shard_of(mac_address, shards, stride), mac_address)
+            )
+        self._conn.commit()
+        self._shard_pending = Counter()
+        for shard, count in self._conn.execute("SELECT shard, COUNT(*) FROM spool GROUP BY shard"):
+            self._shard_pending[shard] = count
+
+        self._stats = {"spooled": 0, "replayed": 0, "discarded": 0}
+        self._sync_interval = sync_interval
+        self._closed = threading.Event()
+        self._syncer = threading.Thread(target=self._sync_loop, name="spool-sync", daemon=True)
+        self._syncer.start()
+
+    def append(self, shard, batch):
+        """Spools (received_at, reading) pairs for a shard, in order."""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO spool (shard, mac_address, received_at, reading, spooled_at) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (shard, reading["mac_address"], received_at.isoformat(), json.dumps(reading), now)
+                    for received_at, reading in batch
+                ],
+            )
+            for _, reading in batch:
+                self._pending[reading["mac_address"]] += 1
+            self._shard_pending[shard] += len(batch)
+            self._stats["spooled"] += len(batch)
+
+    def holds(self, mac_address) -> bool:
+        """True while readings of this MAC address wait in the spool; newer ones must queue behind them."""
+        with self._lock:
+            return self._pending[mac_address] > 0
+
+    def pending(self, shard) -> int:
+        with self._lock:
+            return self._shard_pending[shard]
+
+    def peek(self, shard, limit):
+        """Returns up to limit of the shard's oldest entries as (seq, received_at, reading)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, received_at, reading FROM spool WHERE shard = ? ORDER BY seq LIMIT ?", (shard, limit)
+            ).fetchall()
+        return [(seq, datetime.fromisoformat(received_at), json.loads(reading)) for seq, received_at, reading in rows]
+
+    def remove(self, shard, entries, replayed=True):
+        """Removes entries returned by peek once they were forwarded (or rejected)."""
+        with self._lock:
+            self._conn.executemany("DELETE FROM spool WHERE seq = ?", [(seq,) for seq, _, _ in entries])
+            for _, _, reading in entries:
+                self._pending[reading["mac_address"]] -= 1
+                if not self._pending[reading["mac_address"]]:
+                    del self._pending[reading["mac_address"]]
+            self._shard_pending[shard] -= len(entries)
+            self._stats["replayed" if replayed else "discarded"] += len(entries)
+
+    def sync(self):
+        with self._lock:
+            if self._conn.in_transaction:
+                self._conn.commit()
+
+    def _sync_loop(self):
+        while not self._closed.wait(self._sync_interval):
+            self.sync()
+
+    def stats(self) -> dict:
+        with self._lock:
+            oldest = self._conn.execute("SELECT MIN(spooled_at) FROM spool").fetchone()[0]
+            pending = sum(self._shard_pending.values())
+            stats = dict(self._stats)
+        size = sum(os.path.getsize(path) for path in (self.path, self.path + "-wal") if os.path.exists(path))
+        return {
+            "spool_pending": pending,
+            "spool_bytes": size,
+            "spool_oldest_age_s": round(time.time() - oldest, 1) if oldest is not None else 0.0,
+            **{f"spool_{name}": value for name, value in stats.items()},
+        }
+
+    def close(self):
+        self._closed.set()
+        self._syncer.join()
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
@@ -0,0 +1,125 @@
+"""Runs several bridge processes that split the sensor fleet between them.
+
+Each child runs main.py with BRIDGE_CONSUMERS and BRIDGE_CONSUMER_INDEX set.
+All of them subscribe to the same topic and keep only the devices whose MAC
+address hashes to their index, so a device's readings are always handled by
+one process, in order. Children that exit are restarted with a growing
+delay; SIGINT or SIGTERM stops them all and lets them drain.
+
+Usage: python supervisor.py [--consumers N]
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BRIDGE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+
+# Supervisor settings
+#   BRIDGE_CONSUMERS          bridge processes to run; defaults to one per core
+#   BRIDGE_RESTART_BACKOFF    seconds before restarting a child that exited,
+#                             doubled after every quick exit
+#   BRIDGE_RESTART_MAX        upper bound for that delay
+#   BRIDGE_STOP_TIMEOUT       seconds a child gets to drain before it is killed
+BRIDGE_CONSUMERS = int(os.getenv("BRIDGE_CONSUMERS", str(os.cpu_count() or 1)))
+BRIDGE_RESTART_BACKOFF = float(os.getenv("BRIDGE_RESTART_BACKOFF", "1"))
+BRIDGE_RESTART_MAX = float(os.getenv("BRIDGE_RESTART_MAX", "60"))
+BRIDGE_STOP_TIMEOUT = float(os.getenv("BRIDGE_STOP_TIMEOUT", "30"))
+
+# A child that ran at least this long is considered healthy again
+STABLE_AFTER = 30.0
+POLL_INTERVAL = 0.5
+
+
+class Consumer:
+    """One bridge child process and its restart state."""
+
+    def __init__(self, index, consumers):
+        self.index = index
+        self.consumers = consumers
+        self.process = None
+        self.started_at = 0.0
+        self.restart_at = 0.0
+        self.backoff = BRIDGE_RESTART_BACKOFF
+
+    def start(self):
+        env = dict(os.environ, BRIDGE_CONSUMERS=str(self.consumers), BRIDGE_CONSUMER_INDEX=str(self.index))
+        self.process = subprocess.Popen([sys.executable, BRIDGE_PATH], env=env)
+        self.started_at = time.monotonic()
+        print(f"Consumer {self.index} started (pid {self.process.pid})")
+
+    def check(self):
+        """Restarts the child once it has exited and its backoff has passed."""
+        now = time.monotonic()
+        if self.process is not None:
+            code = self.process.poll()
+            if code is None:
+                return
+            print(f"Consumer {self.index} exited with code {code}")
+            if now - self.started_at >= STABLE_AFTER:
+                self.backoff = BRIDGE_RESTART_BACKOFF
+            self.restart_at = now + self.backoff
+            self.backoff = min(self.backoff * 2, BRIDGE_RESTART_MAX)
+            self.process = None
+        if now >= self.restart_at:
+            self.start()
+
+    def stop(self):
+        # main.py drains its queues on KeyboardInterrupt
+        if self.process is not None and self.process.poll() is None:
+            self.process.send_signal(signal.SIGINT)
+
+    def wait(self, deadline):
+        if self.process is None:
+            return
+        try:
+            self.process.wait(timeout=max(deadline - time.monotonic(), 0))
+        except subprocess.TimeoutExpired:
+            print(f"Consumer {self.index} did not drain in time, killing it")
+            self.process.kill()
+            self.process.wait()
+
+
+def supervise(consumers):
+    stopping = False
+
+    def request_stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    children = [Consumer(index, consumers) for index in range(consumers)]
+    for child in children:
+        child.start()
+    while not stopping:
+        time.sleep(POLL_INTERVAL)
+        for child in children:
+            if not stopping:
+                child.check()
+
+    print("Stopping consumers...")
+    for child in children:
+        child.stop()
+    deadline = time.monotonic() + BRIDGE_STOP_TIMEOUT
+    for child in children:
+        child.wait(deadline)
+    print("All consumers stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--consumers", type=int, default=BRIDGE_CONSUMERS)
+    args = parser.parse_args()
+    supervise(args.consumers)
+
+
+if __name__ == "__main__":
+    main()
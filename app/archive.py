@@ -0,0 +1,403 @@
+"""Parquet archive tier for old sensor readings.
+
+Readings older than ARCHIVE_AFTER_DAYS move out of the sensor tables into
+one Parquet file per device and day:
+
+  {ARCHIVE_DIR}/{sensor_type}/{quoted device_id}/{YYYY-MM-DD}.parquet
+
+Each sensor type has a horizon, the first day that is not archived, kept in
+the archive_horizons table. Queries read rows before the horizon from the
+files and rows from the horizon on from the table, so a reading is never
+returned twice. The rows leave the shared database, so ARCHIVE_DIR must be
+storage that every app host mounts (e.g. NFS); a host that cannot see the
+files would lose the archived readings. An archive pass, run in the
+background by every worker but only by the one holding a database lock:
+
+  - writes every device's whole days before the new horizon, merging rows
+    into a day's existing file by id, so a pass interrupted at any point is
+    simply redone by the next one
+  - moves the horizon forward
+  - deletes the archived rows from the table in primary-key chunks
+
+Readings that arrive for days before the horizon are only returned once the
+next pass has archived them. Archived readings are read-only; their rollups
+are kept, so /api/{sensor_type}/aggregate still covers them, and
+reading_counts keeps counting them. When SENSOR_RETENTION_DAYS is set, day
+files past it are removed by the pass.
+
+Reads memory-map the files and push timestamp filters down to the Parquet
+row group statistics; files outside the requested days are never opened.
+
+Run a single pass with `python -m app.archive`.
+"""
+import os
+import asyncio
+from contextlib import aclosing
+from datetime import date, datetime, timedelta
+from urllib.parse import quote
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyarrow import fs
+
+from .database import fetchone, fetchall, execute, named_lock, transaction
+from .partitions import SENSOR_RETENTION_DAYS, RETENTION_CHUNK_PAUSE_MS
+from .readings import SENSOR_TYPES, parse_timestamp, reconcile_counts
+
+# Archive settings
+#   ARCHIVE_DIR               root directory of the Parquet files, on
+#                             storage shared by every app host
+#   ARCHIVE_AFTER_DAYS        age in days at which readings are archived; 0
+#                             turns the archiver off (existing files are
+#                             still read)
+#   ARCHIVE_CHUNK_ROWS        rows removed from a table per DELETE
+#   ARCHIVE_ROW_GROUP_ROWS    rows per Parquet row group, the unit that
+#                             timestamp filters skip
+#   ARCHIVE_INTERVAL          seconds between archive passes
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "0"))
+ARCHIVE_CHUNK_ROWS = int(os.getenv("ARCHIVE_CHUNK_ROWS", "1000"))
+ARCHIVE_ROW_GROUP_ROWS = int(os.getenv("ARCHIVE_ROW_GROUP_ROWS", "4096"))
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", "3600"))
+
+# Same columns, in the same order, as SELECT * on a sensor table
+SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("value", pa.float64()),
+    ("unit", pa.string()),
+    ("timestamp", pa.timestamp("s")),
+    ("device_id", pa.string()),
+])
+COLUMNS = SCHEMA.names
+SUFFIX = ".parquet"
+LOCK_NAME = "sensor_archive"
+
+# Shared by every read; use_mmap maps the files instead of reading them into buffers
+_filesystem = fs.LocalFileSystem(use_mmap=True)
+
+
+def sensor_dir(sensor_type: str) -> str:
+    return os.path.join(ARCHIVE_DIR, sensor_type)
+
+
+def device_dir(sensor_type: str, device_id: str) -> str:
+    # MAC addresses hold colons, which not every filesystem accepts
+    return os.path.join(sensor_dir(sensor_type), quote(device_id, safe=""))
+
+
+def day_path(sensor_type: str, device_id: str, day: date) -> str:
+    return os.path.join(device_dir(sensor_type, device_id), f"{day.isoformat()}{SUFFIX}")
+
+
+HORIZON_QUERY = "SELECT horizon FROM archive_horizons WHERE sensor_type = %s"
+
+
+def horizon_from(cursor, sensor_type: str):
+    """horizon_start() for code already holding a cursor, e.g. inside a transaction."""
+    cursor.execute(HORIZON_QUERY, (sensor_type,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+async def horizon_start(sensor_type: str):
+    """The horizon as the DATETIME live rows are filtered from, or None if nothing is archived."""
+    row = await fetchone(HORIZON_QUERY, (sensor_type,))
+    return row[0] if row else None
+
+
+def _replace_file(path: str, write):
+    """Writes a file through write(temporary path), then renames it over path."""
+    temporary = path + ".tmp"
+    write(temporary)
+    with open(temporary, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+async def _set_horizon(sensor_type: str, horizon: date):
+    await execute("""
+        INSERT INTO archive_horizons (sensor_type, horizon) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE horizon = VALUES(horizon)
+    """, (sensor_type, datetime.combine(horizon, datetime.min.time())))
+
+
+def day_files(sensor_type: str, device_id: str, first: date = None, last: date = None) -> list:
+    """Returns (day, path) of a device's archived days from first to last inclusive, oldest first."""
+    directory = device_dir(sensor_type, device_id)
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    files = []
+    for name in names:
+        if not name.endswith(SUFFIX):
+            continue
+        day = date.fromisoformat(name[:-len(SUFFIX)])
+        if (first is None or day >= first) and (last is None or day <= last):
+            files.append((day, os.path.join(directory, name)))
+    return sorted(files)
+
+
+def _condition(start=None, end=None, after=None):
+    """Builds the filter pushed down to the Parquet row groups."""
+    timestamp = ds.field("timestamp")
+    conditions = []
+    if start is not None:
+        conditions.append(timestamp >= pa.scalar(start, pa.timestamp("s")))
+    if end is not None:
+        conditions.append(timestamp <= pa.scalar(end, pa.timestamp("s")))
+    if after is not None:
+        after_ts, after_id = after
+        if after_ts is None:
+            conditions.append(ds.field("id") > after_id)
+        else:
+            after_ts = pa.scalar(after_ts, pa.timestamp("s"))
+            conditions.append((timestamp > after_ts) | ((timestamp == after_ts) & (ds.field("id") > after_id)))
+    condition = None
+    for term in conditions:
+        condition = term if condition is None else condition & term
+    return condition
+
+
+def archived_paths(sensor_type: str, device_id: str, horizon, start=None, end=None) -> list:
+    """Returns the day files of a device that may hold readings from start to end, oldest first.
+
+    horizon is the horizon_start() the caller filtered its live rows with,
+    so the two sides of a query split at the same point even if an archive
+    pass moves the horizon in between.
+    """
+    if horizon is None:
+        return []
+    last = horizon.date() - timedelta(days=1)
+    if end is not None:
+        last = min(last, end.date())
+    return [path for _day, path in day_files(sensor_type, device_id, start.date() if start else None, last)]
+
+
+def read_files(paths, start=None, end=None, after=None):
+    """Reads the rows of archived files within a timestamp range as a Table."""
+    dataset = ds.dataset(paths, schema=SCHEMA, format="parquet", filesystem=_filesystem)
+    return dataset.to_table(filter=_condition(start, end, after))
+
+
+def read_archive(sensor_type: str, device_ids, horizon, start=None, end=None, after=None, order_by=None, limit=None):
+    """Reads archived rows of the given devices from before horizon as a pyarrow Table.
+
+    start and end bound the timestamp inclusively; after is (timestamp, id)
+    or (None, id) of the keyset cursor to continue from. Rows come sorted by
+    order_by ("timestamp", "value" or "id"), and only the first limit of
+    them are kept. Returns None when there is nothing archived to read.
+    """
+    paths = [path for device_id in device_ids for path in archived_paths(sensor_type, device_id, horizon, start, end)]
+    if not paths:
+        return None
+    table = read_files(paths, start, end, after)
+    if order_by == "timestamp":
+        table = table.sort_by([("timestamp", "ascending"), ("id", "ascending")])
+    elif order_by == "value":
+        table = table.sort_by([("value", "ascending"), ("id", "ascending")])
+    elif order_by == "id":
+        table = table.sort_by("id")
+    if limit is not None:
+        table = table.slice(0, limit)
+    return table
+
+
+def table_chunks(table, chunk_size: int = 1000):
+    """Yields lists of dict rows from a Table, chunk_size rows at a time."""
+    for batch in table.to_batches(max_chunksize=chunk_size):
+        yield batch.to_pylist()
+
+
+def merge_rows(archived: list, live: list, key=None) -> list:
+    """Combines archived and live rows, each sorted by key; archived first when key is None."""
+    if key is None or not archived or not live:
+        return archived + live
+    return sorted(archived + live, key=key)
+
+
+async def merge_chunks(archived, live_chunks, key=None, chunk_size: int = 1000):
+    """Streams an archived Table and live row chunks, each sorted by key, as one sequence of chunks.
+
+    Without a key the archived rows, which are all older, simply come first.
+    live_chunks is closed however this generator ends.
+    """
+    async with aclosing(live_chunks):
+        if archived is None:
+            async for rows in live_chunks:
+                yield rows
+            return
+        if key is None:
+            for rows in table_chunks(archived, chunk_size):
+                yield rows
+            async for rows in live_chunks:
+                yield rows
+            return
+
+        pending = (row for rows in table_chunks(archived, chunk_size) for row in rows)
+        upcoming = next(pending, None)
+        async for rows in live_chunks:
+            merged = []
+            for row in rows:
+                while upcoming is not None and key(upcoming) <= key(row):
+                    merged.append(upcoming)
+                    upcoming = next(pending, None)
+                merged.append(row)
+            yield merged
+    rest = [] if upcoming is None else [upcoming]
+    for row in pending:
+        rest.append(row)
+        if len(rest) >= chunk_size:
+            yield rest
+            rest = []
+    if rest:
+        yield rest
+
+
+def archived_rows(sensor_type: str, device_id: str, horizon) -> int:
+    """Counts a device's archived readings before horizon from the Parquet footers."""
+    if horizon is None:
+        return 0
+    return sum(
+        pq.read_metadata(path).num_rows
+        for _day, path in day_files(sensor_type, device_id, last=horizon.date() - timedelta(days=1))
+    )
+
+
+def write_day(sensor_type: str, device_id: str, day: date, rows) -> str:
+    """Adds (id, value, unit, timestamp, device_id) rows to a device's day file; returns its path."""
+    table = pa.Table.from_pylist([dict(zip(COLUMNS, row)) for row in rows], schema=SCHEMA)
+    path = day_path(sensor_type, device_id, day)
+    if os.path.exists(path):
+        existing = pq.read_table(path, schema=SCHEMA)
+        kept = pc.invert(pc.is_in(existing["id"], value_set=table["id"]))
+        table = pa.concat_tables([existing.filter(kept), table])
+    table = table.sort_by([("timestamp", "ascending"), ("id", "ascending")])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    _replace_file(path, lambda temporary: pq.write_table(
+        table, temporary, row_group_size=ARCHIVE_ROW_GROUP_ROWS, compression="zstd",
+    ))
+    return path
+
+
+def _read_day(cursor, sensor_type, device_id, day):
+    """Returns a device's rows on a day, and the next day it has readings on (or None)."""
+    following = day + timedelta(days=1)
+    cursor.execute(f"""
+        SELECT id, value, unit, timestamp, device_id FROM {sensor_type}
+        WHERE device_id = %s AND timestamp >= %s AND timestamp < %s
+    """, (device_id, day, following))
+    rows = cursor.fetchall()
+    # Skip straight past days without readings
+    cursor.execute(
+        f"SELECT MIN(timestamp) FROM {sensor_type} WHERE device_id = %s AND timestamp >= %s",
+        (device_id, following),
+    )
+    upcoming = cursor.fetchone()[0]
+    return rows, parse_timestamp(upcoming).date() if upcoming is not None else None
+
+
+async def _archive_device(sensor_type, device_id, cutoff) -> list:
+    """Writes a device's days before cutoff to their files; returns the paths written.
+
+    Each day is read in a transaction of its own that ends before its file
+    is written, so no snapshot stays open across a device's whole history.
+    """
+    written = []
+    oldest = (await fetchone(f"SELECT MIN(timestamp) FROM {sensor_type} WHERE device_id = %s", (device_id,)))[0]
+    day = parse_timestamp(oldest).date() if oldest is not None else None
+    while day is not None and day < cutoff:
+        rows, following = await transaction(_read_day, sensor_type, device_id, day)
+        if rows:
+            written.append(await asyncio.to_thread(write_day, sensor_type, device_id, day, rows))
+        day = following
+    return written
+
+
+def drop_expired_files(sensor_type: str, cutoff: date) -> int:
+    """Removes day files before cutoff; returns how many went."""
+    removed = 0
+    try:
+        devices = os.listdir(sensor_dir(sensor_type))
+    except FileNotFoundError:
+        return 0
+    for name in devices:
+        directory = os.path.join(sensor_dir(sensor_type), name)
+        if not os.path.isdir(directory):
+            continue
+        for entry in os.listdir(directory):
+            if entry.endswith(SUFFIX) and date.fromisoformat(entry[:-len(SUFFIX)]) < cutoff:
+                os.remove(os.path.join(directory, entry))
+                removed += 1
+    return removed
+
+
+async def delete_archived(sensor_type: str, path: str, horizon: date) -> int:
+    """Deletes the rows held in an archived day file from the table, a chunk at a time."""
+    ids = pq.read_table(path, columns=["id"], memory_map=True)["id"].to_pylist()
+    deleted = 0
+    for offset in range(0, len(ids), ARCHIVE_CHUNK_ROWS):
+        chunk = ids[offset:offset + ARCHIVE_CHUNK_ROWS]
+        placeholders = ", ".join(["%s"] * len(chunk))
+        result = await execute(
+            f"DELETE FROM {sensor_type} WHERE id IN ({placeholders}) AND timestamp < %s",
+            chunk + [horizon],
+        )
+        deleted += result.rowcount
+        await asyncio.sleep(RETENTION_CHUNK_PAUSE_MS / 1000)
+    return deleted
+
+
+async def archive_sensor_table(sensor_type: str, cutoff: date) -> dict:
+    """Archives a table's readings from before cutoff and moves its horizon there."""
+    horizon = await horizon_start(sensor_type)
+    if horizon is not None:
+        horizon = horizon.date()
+        # Rows that arrived late for archived days are always picked up
+        cutoff = max(cutoff, horizon)
+    devices = await fetchall("SELECT device_id FROM reading_counts WHERE sensor_type = %s", (sensor_type,))
+    written = []
+    for (device_id,) in devices:
+        written += await _archive_device(sensor_type, device_id, cutoff)
+    if written or horizon is not None:
+        # Only once every file is written do queries switch to them
+        await _set_horizon(sensor_type, cutoff)
+    archived = 0
+    for path in written:
+        archived += await delete_archived(sensor_type, path, cutoff)
+    return {"files_written": len(written), "archived_rows": archived}
+
+
+async def archive_sensor_tables() -> dict:
+    """Runs one archive pass and reports what it did per table."""
+    async with named_lock(LOCK_NAME) as locked:
+        if not locked:
+            # Another worker, here or on another host, is already on it
+            return {}
+        changes = {}
+        cutoff = date.today() - timedelta(days=ARCHIVE_AFTER_DAYS)
+        for sensor_type in SENSOR_TYPES:
+            changes[sensor_type] = await archive_sensor_table(sensor_type, cutoff)
+            if SENSOR_RETENTION_DAYS > 0:
+                expired = date.today() - timedelta(days=SENSOR_RETENTION_DAYS)
+                changes[sensor_type]["expired_files"] = drop_expired_files(sensor_type, expired)
+                if changes[sensor_type]["expired_files"]:
+                    await reconcile_counts([sensor_type])
+        return changes
+
+
+async def archive_loop():
+    """Background task running an archive pass every ARCHIVE_INTERVAL seconds."""
+    while True:
+        try:
+            await archive_sensor_tables()
+        except Exception as e:
+            print(f"Archiving failed: {e}")
+        await asyncio.sleep(ARCHIVE_INTERVAL)
+
+
+if __name__ == "__main__":
+    for table, change in asyncio.run(archive_sensor_tables()).items():
+        print(f"{table}: {change}")
@@ -1,163 +1,445 @@
 import os
+import asyncio
+import fcntl
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from functools import partial
 import mysql.connector
 import pandas as pd
 from dotenv import load_dotenv
-from typing import  Optional
+from typing import  Optional, NamedTuple
 
 # Load environment variables
 load_dotenv()
 
 
+# Storage backend
+#   DB_BACKEND           mysql (default) or sqlite, the embedded single-node
+#                        engine in app.sqlite_backend
+#   SQLITE_PATH          database file used by the sqlite backend
+#   SQLITE_SYNCHRONOUS   PRAGMA synchronous for it; NORMAL only risks the
+#                        last commits on power loss, FULL fsyncs every commit
+DB_BACKEND = os.getenv("DB_BACKEND", "mysql")
+SQLITE_PATH = os.getenv("SQLITE_PATH", "sensors.sqlite3")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+if DB_BACKEND not in ("mysql", "sqlite"):
+    raise ValueError(f"Unknown DB_BACKEND {DB_BACKEND!r}, expected 'mysql' or 'sqlite'")
+
 # MySQL Connection
 db_config = {
    "host": os.getenv("MYSQL_HOST"),
    "user": os.getenv("MYSQL_USER"),
    "password": os.getenv("MYSQL_PASSWORD"),
    "database": os.getenv("MYSQL_DATABASE"),
-   "port": 14786
+   "port": int(os.getenv("MYSQL_PORT", "14786"))
 }
 
 
+# Connection pool settings
+#   DB_POOL_SIZE          connections kept open between requests
+#   DB_POOL_MAX_OVERFLOW  extra connections allowed under burst, closed on return
+#   DB_POOL_TIMEOUT       seconds to wait for a free connection before failing
+#   DB_POOL_RECYCLE       seconds a connection may sit idle before it is reopened
+#   DB_POOL_PRE_PING      ping connections when they are borrowed (1/0)
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+POOL_MAX_OVERFLOW = int(os.getenv("DB_POOL_MAX_OVERFLOW", "10"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+POOL_RECYCLE = float(os.getenv("DB_POOL_RECYCLE", "300"))
+POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+
+
+class PoolTimeout(mysql.connector.errors.PoolError):
+    """Raised when no connection becomes free within DB_POOL_TIMEOUT."""
+
+
+class PooledConnection:
+    """Wraps a pooled connection so that close() hands it back to the pool."""
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+        self._returned = False
+        self._discard = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def invalidate(self):
+        """Marks the connection unusable so close() discards it instead of pooling it."""
+        self._discard = True
+
+    def close(self):
+        if not self._returned:
+            self._returned = True
+            self._pool.release(self._raw, discard=self._discard)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __del__(self):
+        # Safety net for handlers that forget close(): never leak a pool slot.
+        self.close()
+
+
+class ConnectionPool:
+    """Thread-safe pool of database connections with overflow and idle recycling."""
+
+    def __init__(self, factory, size, max_overflow, timeout, recycle, pre_ping):
+        self._factory = factory
+        self._size = size
+        self._max_overflow = max_overflow
+        self._timeout = timeout
+        self._recycle = recycle
+        self._pre_ping = pre_ping
+        self._idle = deque()  # (connection, last_used) pairs, most recent last
+        self._open = 0
+        self._in_use = 0
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._stats = {
+            "checkouts": 0,
+            "created": 0,
+            "recycled": 0,
+            "stale": 0,
+            "timeouts": 0,
+            "wait_total": 0.0,
+            "wait_max": 0.0,
+        }
+
+    def acquire(self):
+        """Borrows a connection, opening a new one if the pool has room."""
+        start = time.monotonic()
+        deadline = start + self._timeout
+        raw = None
+        last_used = None
+        with self._available:
+            while True:
+                if self._idle:
+                    raw, last_used = self._idle.pop()
+                    break
+                if self._open < self._size + self._max_overflow:
+                    # Reserve the slot now, connect outside the lock.
+                    self._open += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout(
+                        f"No database connection available after {self._timeout}s"
+                    )
+                self._available.wait(remaining)
+
+        try:
+            if raw is not None and not self._usable(raw, last_used):
+                raw = None
+            if raw is None:
+                raw = self._factory()
+                with self._lock:
+                    self._stats["created"] += 1
+        except Exception:
+            with self._available:
+                self._open -= 1
+                self._available.notify()
+            raise
+
+        waited = time.monotonic() - start
+        with self._lock:
+            self._in_use += 1
+            self._stats["checkouts"] += 1
+            self._stats["wait_total"] += waited
+            self._stats["wait_max"] = max(self._stats["wait_max"], waited)
+        return PooledConnection(self, raw)
+
+    def release(self, raw, discard=False):
+        """Returns a borrowed connection; broken or surplus ones are closed."""
+        healthy = not discard
+        try:
+            if healthy and raw.in_transaction:
+                raw.rollback()
+        except Exception:
+            healthy = False
+
+        with self._available:
+            self._in_use -= 1
+            keep = healthy and len(self._idle) < self._size
+            if keep:
+                self._idle.append((raw, time.monotonic()))
+            else:
+                self._open -= 1
+            self._available.notify()
+        if not keep:
+            self._close_quietly(raw)
+
+    def _usable(self, raw, last_used):
+        """Checks an idle connection before handing it out."""
+        if self._recycle and time.monotonic() - last_used > self._recycle:
+            with self._lock:
+                self._stats["recycled"] += 1
+            self._close_quietly(raw)
+            return False
+        if self._pre_ping:
+            try:
+                raw.ping(reconnect=False)
+            except Exception:
+                with self._lock:
+                    self._stats["stale"] += 1
+                self._close_quietly(raw)
+                return False
+        return True
+
+    @staticmethod
+    def _close_quietly(raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def stats(self) -> dict:
+        """Snapshot of pool occupancy, checkout counts and wait times."""
+        with self._lock:
+            checkouts = self._stats["checkouts"]
+            return {
+                "size": self._size,
+                "max_overflow": self._max_overflow,
+                "open": self._open,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "checkouts": checkouts,
+                "created": self._stats["created"],
+                "recycled": self._stats["recycled"],
+                "stale": self._stats["stale"],
+                "timeouts": self._stats["timeouts"],
+                "wait_avg_ms": round(self._stats["wait_total"] / checkouts * 1000, 3) if checkouts else 0.0,
+                "wait_max_ms": round(self._stats["wait_max"] * 1000, 3),
+            }
+
+
+def _connect():
+    if DB_BACKEND == "sqlite":
+        from . import sqlite_backend
+        return sqlite_backend.connect(SQLITE_PATH, busy_timeout=POOL_TIMEOUT, synchronous=SQLITE_SYNCHRONOUS)
+    return mysql.connector.connect(**db_config)
+
+
+pool = ConnectionPool(
+    _connect,
+    size=POOL_SIZE,
+    max_overflow=POOL_MAX_OVERFLOW,
+    timeout=POOL_TIMEOUT,
+    recycle=POOL_RECYCLE,
+    pre_ping=POOL_PRE_PING,
+)
+
+
 def get_db_connection():
-   """Creates a new database connection."""
-   return mysql.connector.connect(**db_config)
+   """Borrows a connection from the shared pool; close() returns it."""
+   return pool.acquire()
 
-async def get_session(session_id: str) -> Optional[dict]:
-    """Retrieve session from database."""
-    connection = None
-    cursor = None
+
+@contextmanager
+def db_connection():
+    """Context manager that returns the connection to the pool on exit."""
+    conn = pool.acquire()
     try:
-        connection = get_db_connection()
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute(
-            """
-            SELECT *
-            FROM sessions
-            WHERE id = %s
-        """,
-            (session_id,),
-        )
-        return cursor.fetchone()
+        yield conn
     finally:
+        conn.close()
+
+
+@contextmanager
+def db_cursor(dictionary: bool = False):
+    """Context manager yielding a cursor on a pooled connection."""
+    with db_connection() as conn:
+        cursor = conn.cursor(dictionary=dictionary)
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+
+
+def pool_stats() -> dict:
+    """Returns connection pool statistics for the /metrics endpoint."""
+    return pool.stats()
+
+
+# Async data access
+#   DB_MAX_CONCURRENCY  queries allowed to run at once off the event loop
+# The driver is blocking, so queries run on a bounded thread pool and the
+# handlers await them instead of stalling the event loop.
+DB_MAX_CONCURRENCY = int(os.getenv("DB_MAX_CONCURRENCY", str(POOL_SIZE + POOL_MAX_OVERFLOW)))
+_executor = ThreadPoolExecutor(max_workers=DB_MAX_CONCURRENCY, thread_name_prefix="db")
+
+
+class QueryResult(NamedTuple):
+    rowcount: int
+    lastrowid: Optional[int]
+
+
+async def run_db(func, *args, **kwargs):
+    """Runs a blocking database function on the DB thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, partial(func, *args, **kwargs))
+
+
+def _fetchone(query, params, dictionary):
+    with db_cursor(dictionary=dictionary) as cursor:
+        cursor.execute(query, params)
+        return cursor.fetchone()
+
+
+def _fetchall(query, params, dictionary):
+    with db_cursor(dictionary=dictionary) as cursor:
+        cursor.execute(query, params)
+        return cursor.fetchall()
+
+
+def _execute(query, params, many=False):
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            if many:
+                cursor.executemany(query, params)
+            else:
+                cursor.execute(query, params)
+            conn.commit()
+            return QueryResult(cursor.rowcount, cursor.lastrowid)
+        finally:
             cursor.close()
-            connection.close()
 
-def create_temperatures_table():
-    """Ensures that the temperatures table exists before inserting data."""
+
+def run_transaction(func, *args, dictionary: bool = False):
+    """Blocking form of transaction(), for code running outside the event loop."""
+    with db_connection() as conn:
+        cursor = conn.cursor(dictionary=dictionary)
+        try:
+            result = func(cursor, *args)
+            conn.commit()
+            return result
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+
+async def fetchone(query: str, params=(), dictionary: bool = False):
+    """Runs a query and returns its first row."""
+    return await run_db(_fetchone, query, params, dictionary)
+
+
+async def fetchall(query: str, params=(), dictionary: bool = False) -> list:
+    """Runs a query and returns all rows."""
+    return await run_db(_fetchall, query, params, dictionary)
+
+
+async def execute(query: str, params=()) -> QueryResult:
+    """Runs a single write statement and commits it."""
+    return await run_db(_execute, query, params)
+
+
+async def executemany(query: str, seq_params) -> QueryResult:
+    """Runs a write statement for every parameter set in one commit."""
+    return await run_db(_execute, query, seq_params, True)
+
+
+async def transaction(func, *args, dictionary: bool = False):
+    """Runs func(cursor, *args) on one connection and commits if it succeeds."""
+    return await run_db(run_transaction, func, *args, dictionary=dictionary)
+
+
+def _close_stream(conn, cursor, exhausted):
+    if not exhausted:
+        # Unread rows are still on the wire; drop the connection rather than drain it.
+        conn.invalidate()
+    try:
+        cursor.close()
+    except Exception:
+        conn.invalidate()
+    conn.close()
+
+
+def _get_lock(name):
+    """Takes a named lock on a borrowed connection; returns it, or None if the lock is taken."""
     conn = get_db_connection()
-    if conn is None:
-        raise HTTPException(status_code=500, detail="Database connection error")
-    
     try:
-        connectionCursor = conn.cursor()
-        create_table_query = """
-            CREATE TABLE IF NOT EXISTS temperature (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                temperature FLOAT NOT NULL,
-                unit VARCHAR(10) NOT NULL,
-                mac_address VARCHAR(255) NOT NULL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            );
-        """
-        connectionCursor.execute(create_table_query)
-        conn.commit()
-    except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        print("Database Error:", error_details)  # Log full error details
-        raise HTTPException(status_code=500, detail=f"Error creating table: {e}")
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT GET_LOCK(%s, 0)", (name,))
+            if cursor.fetchone()[0] == 1:
+                return conn
+        finally:
+            cursor.close()
+    except Exception:
+        conn.close()
+        raise
+    conn.close()
+    return None
+
+
+def _release_lock(conn, name):
+    try:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (name,))
+            cursor.fetchall()
+        finally:
+            cursor.close()
     finally:
-        connectionCursor.close()
         conn.close()
 
-   
-
-def create_tables():
-   """Creates all necessary tables if they don't exist."""
-   conn = get_db_connection()
-   cursor = conn.cursor()
-
-   # Create users table
-   cursor.execute('''
-       CREATE TABLE IF NOT EXISTS users (
-           id INT AUTO_INCREMENT PRIMARY KEY,
-           name VARCHAR(255) NOT NULL,
-           email VARCHAR(255) UNIQUE NOT NULL,
-           hashed_password VARCHAR(255) NOT NULL,
-           PID VARCHAR(10) NOT NULL,
-           location VARCHAR(255)
-       )
-   ''')
-   
-   cursor.execute( 
-      """
-            CREATE TABLE IF NOT EXISTS sessions (
-                id VARCHAR(36) PRIMARY KEY,
-                user_id INT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-            )
-        """)
-
-   # Create devices table
-   cursor.execute('''
-       CREATE TABLE IF NOT EXISTS devices (
-           id INT AUTO_INCREMENT PRIMARY KEY,
-           user_id INT NOT NULL,
-           device_id VARCHAR(255) UNIQUE NOT NULL,
-           FOREIGN KEY (user_id) REFERENCES users (id)
-       )
-   ''')
-
-   # Create wardrobe table
-   cursor.execute('''
-       CREATE TABLE IF NOT EXISTS wardrobe (
-           id INT AUTO_INCREMENT PRIMARY KEY,
-           user_id INT NOT NULL,
-           item_name VARCHAR(255) NOT NULL,
-           item_type VARCHAR(255) NOT NULL,
-           FOREIGN KEY (user_id) REFERENCES users (id)
-       )
-   ''')
-
-   # Create sensor tables
-   for sensor_type in ["temperature", "humidity", "light"]:
-       cursor.execute(f'''
-           CREATE TABLE IF NOT EXISTS {sensor_type} (
-               id INT AUTO_INCREMENT PRIMARY KEY,
-               value FLOAT NOT NULL,
-               unit VARCHAR(50) NOT NULL,
-               timestamp DATETIME NOT NULL,
-               device_id VARCHAR(255),
-               FOREIGN KEY (device_id) REFERENCES devices (device_id)
-           )
-       ''')
-       
-
-   conn.commit()
-   cursor.close()
-   conn.close()
-
-
-def seed_database():
-   """Seeds the database with initial data if needed."""
-   conn = get_db_connection()
-   cursor = conn.cursor()
-
-   # Check if we need to seed
-   cursor.execute("SELECT COUNT(*) FROM users")
-   if cursor.fetchone()[0] == 0:
-       # Add a test user
-       cursor.execute('''
-           INSERT INTO users (name, email, hashed_password, location, PID)
-           VALUES (%s, %s, %s, %s, %s)
-       ''', ("Test User", "test@example.com", "test123", "Test Location", "A12345678"))
-       conn.commit()
-
-   cursor.close()
-   conn.close()
-
-
-if __name__ == "__main__":
-   create_tables()
-   seed_database()
+
+@asynccontextmanager
+async def named_lock(name: str):
+    """Yields whether this process got the named lock, held for the block.
+
+    Serializes background jobs across every worker and host sharing the
+    database. GET_LOCK belongs to the connection that took it, so on MySQL
+    that connection stays borrowed until the block ends; the embedded
+    backend, on one host by design, locks a file next to the database.
+    """
+    if DB_BACKEND == "mysql":
+        conn = await run_db(_get_lock, name)
+        try:
+            yield conn is not None
+        finally:
+            if conn is not None:
+                await run_db(_release_lock, conn, name)
+        return
+    with open(f"{SQLITE_PATH}.{name}.lock", "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            locked = True
+        except BlockingIOError:
+            locked = False
+        yield locked
+
+
+async def stream_rows(query: str, params=(), chunk_size: int = 1000, dictionary: bool = True):
+    """Yields lists of rows from an unbuffered, server-side cursor.
+
+    Only chunk_size rows are held in memory at a time. The connection stays
+    checked out until the generator finishes or is closed.
+    """
+    conn = await run_db(pool.acquire)
+    cursor = None
+    exhausted = False
+    try:
+        cursor = conn.cursor(dictionary=dictionary, buffered=False)
+        await run_db(cursor.execute, query, params)
+        while True:
+            rows = await run_db(cursor.fetchmany, chunk_size)
+            if not rows:
+                exhausted = True
+                return
+            yield rows
+    finally:
+        if cursor is None:
+            conn.close()
+        else:
+            await run_db(_close_stream, conn, cursor, exhausted)
@@ -0,0 +1,154 @@
+import os
+import asyncio
+import time
+from collections import deque
+
+import mysql.connector
+
+from .readings import insert_readings
+
+# Write-behind buffer settings
+#   INGEST_BUFFER_SIZE        readings held in memory before requests get 429
+#   INGEST_FLUSH_INTERVAL_MS  longest a reading waits before it is written
+#   INGEST_FLUSH_ROWS         flush early once this many readings are waiting;
+#                             also the largest multi-row INSERT issued
+INGEST_BUFFER_SIZE = int(os.getenv("INGEST_BUFFER_SIZE", "10000"))
+INGEST_FLUSH_INTERVAL_MS = int(os.getenv("INGEST_FLUSH_INTERVAL_MS", "500"))
+INGEST_FLUSH_ROWS = int(os.getenv("INGEST_FLUSH_ROWS", "500"))
+
+# Errors that retrying the same rows cannot fix, from the database or from
+# converting a row; anything else (a lost connection, a lock wait timeout)
+# puts the rows back for the next flush
+PERMANENT_ERRORS = (mysql.connector.errors.IntegrityError, mysql.connector.errors.DataError, ValueError, TypeError)
+
+
+class WriteBehindBuffer:
+    """Queues rows in memory and writes them in batches from a background task.
+
+    Rows are acknowledged before they reach the database, so anything still
+    queued when the process dies without a graceful shutdown is lost.
+    """
+
+    def __init__(self, write_rows, max_size: int, flush_interval: float, flush_rows: int):
+        self._write_rows = write_rows
+        self._max_size = max_size
+        self._flush_interval = flush_interval
+        self._flush_rows = flush_rows
+        self._rows = deque()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task = None
+        self._stats = {
+            "enqueued": 0,
+            "rejected": 0,
+            "flushes": 0,
+            "flushed_rows": 0,
+            "failed_flushes": 0,
+            "dropped": 0,
+            "flush_total": 0.0,
+            "flush_last": 0.0,
+            "flush_max": 0.0,
+        }
+
+    def offer(self, row) -> bool:
+        """Queues a row; returns False when the buffer is full."""
+        if len(self._rows) >= self._max_size:
+            self._stats["rejected"] += 1
+            return False
+        self._rows.append(row)
+        self._stats["enqueued"] += 1
+        if len(self._rows) >= self._flush_rows:
+            self._wakeup.set()
+        return True
+
+    async def flush(self):
+        """Writes queued rows in batches of at most flush_rows.
+
+        A batch the database rejects outright is split in halves until the
+        offending rows are isolated; those are dropped and counted, the rest
+        are written.
+        """
+        while self._rows:
+            batch = [self._rows.popleft() for _ in range(min(self._flush_rows, len(self._rows)))]
+            start = time.perf_counter()
+            parts = [batch]
+            while parts:
+                part = parts.pop()
+                try:
+                    await self._write_rows(part)
+                except PERMANENT_ERRORS as e:
+                    if len(part) == 1:
+                        self._stats["dropped"] += 1
+                        print(f"Ingest dropped a reading the database rejected: {part[0]!r}: {e}")
+                    else:
+                        middle = len(part) // 2
+                        parts += [part[middle:], part[:middle]]
+                    continue
+                except Exception as e:
+                    # Put the unwritten rows back in order and retry on the next tick.
+                    unwritten = part + [row for rest in reversed(parts) for row in rest]
+                    self._rows.extendleft(reversed(unwritten))
+                    self._stats["failed_flushes"] += 1
+                    print(f"Ingest flush failed, {len(self._rows)} readings waiting: {e}")
+                    return
+                self._stats["flushed_rows"] += len(part)
+            elapsed = time.perf_counter() - start
+            self._stats["flushes"] += 1
+            self._stats["flush_total"] += elapsed
+            self._stats["flush_last"] = elapsed
+            self._stats["flush_max"] = max(self._stats["flush_max"], elapsed)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+            if self._stopping:
+                return
+
+    def start(self):
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flushes what is left and stops the background task."""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+        if self._rows:
+            print(f"Ingest buffer stopped with {len(self._rows)} unwritten readings")
+
+    def stats(self) -> dict:
+        flushes = self._stats["flushes"]
+        return {
+            "depth": len(self._rows),
+            "max_size": self._max_size,
+            "enqueued": self._stats["enqueued"],
+            "rejected": self._stats["rejected"],
+            "flushes": flushes,
+            "flushed_rows": self._stats["flushed_rows"],
+            "failed_flushes": self._stats["failed_flushes"],
+            "dropped": self._stats["dropped"],
+            "flush_last_ms": round(self._stats["flush_last"] * 1000, 3),
+            "flush_avg_ms": round(self._stats["flush_total"] / flushes * 1000, 3) if flushes else 0.0,
+            "flush_max_ms": round(self._stats["flush_max"] * 1000, 3),
+        }
+
+
+async def write_temperature_rows(rows):
+    """Writes (value, unit, timestamp, mac_address) rows and their rollups in one transaction."""
+    await insert_readings("temperature", rows)
+
+
+temperature_buffer = WriteBehindBuffer(
+    write_temperature_rows,
+    max_size=INGEST_BUFFER_SIZE,
+    flush_interval=INGEST_FLUSH_INTERVAL_MS / 1000,
+    flush_rows=INGEST_FLUSH_ROWS,
+)
@@ -1,21 +1,35 @@
 from fastapi import FastAPI, HTTPException, Query, Depends, Request, Form, Response, Cookie
-from fastapi.responses import HTMLResponse, FileResponse, RedirectResponse, JSONResponse
+from fastapi.responses import HTMLResponse, FileResponse, RedirectResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from fastapi.exceptions import RequestValidationError
+from fastapi.encoders import jsonable_encoder
+from starlette.requests import ClientDisconnect
+import asyncio
+from contextlib import aclosing
 import httpx
 import mysql.connector
 import os
 from dotenv import load_dotenv
-from pydantic import BaseModel
-from datetime import datetime
-from typing import Optional
+from pydantic import BaseModel, Field, ValidationError
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional, List, Dict, Any
 import hashlib
+import math
 import uuid
 from urllib.request import urlopen
 import json
 
 from .routers import auth, wardrobe, devices
-from .database import get_db_connection, create_tables, seed_database, create_temperatures_table
+from .database import fetchone, fetchall, execute, transaction, run_db, stream_rows, pool_stats
+from .migrations import apply_migrations
+from .sessions import authenticate, session_cache_stats, revocation_sync_loop, SESSION_MODE
+from .ingest import temperature_buffer
+from .pubsub import readings_broker, STREAM_KEEPALIVE
+from .partitions import partition_maintenance_loop
+from .readings import insert_readings, write_readings, update_reading, delete_reading, parse_timestamp, bucket_start, rollup_repair_loop, count_reconcile_loop, ROLLUPS
+from . import archive, queries, streaming
 
 # Load environment variables
 load_dotenv()
@@ -25,10 +39,10 @@ load_dotenv()
 app = FastAPI()
 
 class SensorData(BaseModel):
-   value: float
-   unit: str
+   value: float = Field(allow_inf_nan=False)
+   unit: str = Field(max_length=50)
    timestamp: Optional[str] = None
-   mac_address: str
+   mac_address: str = Field(max_length=255)
 
 class ClothingDelete(BaseModel):
     clothingType: str
@@ -54,10 +68,23 @@ class ClothesUpdate(BaseModel):
     oldClothing: ClothingUpdate
     newClothing: ClothingUpdate
 
+# Bounds match the sensor table columns, so a queued reading cannot fail its flush
 class TemperatureData(BaseModel):
-    value: str
-    unit: str
-    mac_address: str
+    value: float = Field(allow_inf_nan=False)
+    unit: str = Field(max_length=50)
+    mac_address: str = Field(max_length=255)
+    # When the reading was taken; the bridge sends it for readings replayed from its spool
+    timestamp: Optional[str] = None
+
+@app.exception_handler(RequestValidationError)
+async def request_validation_error(request: Request, exc: RequestValidationError):
+    """FastAPI's 422 response, minus echoed inputs that JSON cannot represent (NaN, Infinity)."""
+    errors = [
+        {key: value for key, value in error.items()
+         if not (key == "input" and isinstance(value, float) and not math.isfinite(value))}
+        for error in exc.errors()
+    ]
+    return JSONResponse(status_code=422, content={"detail": jsonable_encoder(errors)})
 
 # Mount static files
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
@@ -73,17 +100,47 @@ templates = Jinja2Templates(directory="app/templates")
 def hash_password(password: str) -> str:
     return hashlib.sha256(password.encode()).hexdigest()
 
+# Apply pending schema migrations when a worker starts (set to 0 to run
+# `python -m app.migrations` as a separate deploy step instead)
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "1") == "1"
+
 @app.on_event("startup")
 def startup_event():
-    """Runs at startup to seed the database."""
-    create_tables()
-    print("temperature database initialized")
-    seed_database()
+    """Runs at startup to bring the database schema up to date."""
+    if MIGRATE_ON_STARTUP:
+        apply_migrations()
+
+@app.on_event("startup")
+async def start_background_tasks():
+    """Starts the periodic jobs that run inside each worker."""
+    if SESSION_MODE == "signed":
+        app.state.revocation_sync = asyncio.create_task(revocation_sync_loop())
+    app.state.rollup_repair = asyncio.create_task(rollup_repair_loop())
+    app.state.count_reconcile = asyncio.create_task(count_reconcile_loop())
+    app.state.partition_maintenance = asyncio.create_task(partition_maintenance_loop())
+    if archive.ARCHIVE_AFTER_DAYS > 0:
+        app.state.archiver = asyncio.create_task(archive.archive_loop())
+    temperature_buffer.start()
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    """Flushes buffered readings before the worker exits."""
+    await temperature_buffer.stop()
 
 @app.get("/", response_class=HTMLResponse)
 async def read_index(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
+@app.get("/metrics")
+async def get_metrics():
+    """Runtime statistics for the connection pool, session cache, ingest buffer and live streams."""
+    return {
+        "db_pool": pool_stats(),
+        "session_cache": session_cache_stats(),
+        "ingest_buffer": temperature_buffer.stats(),
+        "streams": readings_broker.stats(),
+    }
+
 AITEXT_API_URL = "https://ece140-wi25-api.frosty-sky-f43d.workers.dev/api/v1/ai/complete"
 
 def hash_password(password: str) -> str:
@@ -95,11 +152,9 @@ async def update_clothes(request: Request, update: ClothesUpdate):
     if user_id is None:
         return RedirectResponse(url="/login", status_code=302)
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
         # Update the clothes record for the authenticated user that matches the old clothing details.
-        cursor.execute("""
+        result = await execute("""
             UPDATE clothes
             SET clothing_name = %s, clothing_color = %s, clothing_type = %s
             WHERE user_id = %s 
@@ -115,47 +170,31 @@ async def update_clothes(request: Request, update: ClothesUpdate):
             update.oldClothing.clothingColor,
             update.oldClothing.clothingSize       # old clothing type
         ))
-        conn.commit()
-        if cursor.rowcount == 0:
+        if result.rowcount == 0:
             raise HTTPException(status_code=404, detail="Clothing item not found")
         return JSONResponse(content={"message": "Clothing updated successfully"})
     except Exception as e:
         print(f"❌ Error updating clothing: {e}")
         raise HTTPException(status_code=400, detail=str(e))
-    finally:
-        cursor.close()
-        conn.close()
 
 
 @app.post("/update_temperature_reading")
 async def update_temp(data: SensorData):
-    create_temperatures_table()
-    conn = get_db_connection()
-    if conn is None:
-        return "Database connection error"
     try:
-        connectionCursor = conn.cursor()
-        timestamp = data.timestamp if data.timestamp else datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        query = f"INSERT INTO temperature (temperature, unit, mac_address, timestamp) VALUES (%s, %s, %s, %s)"
-        connectionCursor.execute(query, (data.value, data.unit, data.mac_address, timestamp))
-        conn.commit()
-    except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        print("Database Error:", error_details)  # Log full error details
-        raise HTTPException(status_code=500, detail=f"Error during database operation: {e}")
+        timestamp = parse_timestamp(data.timestamp) if data.timestamp else datetime.now()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid timestamp")
+    # Written to the database by the ingest buffer's background flusher
+    if not temperature_buffer.offer((data.value, data.unit, timestamp, data.mac_address)):
+        raise HTTPException(status_code=429, detail="Ingest buffer full, retry later", headers={"Retry-After": "1"})
+    return {"message": "Temperature reading queued."}
 
 @app.post("/getairesponse")
 async def getAIResponse(request: Request, prompt: str = Form(...)):
     user_id = await authenticate(request)
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-
-
 
     try:
-        cursor.execute("SELECT email, PID FROM users WHERE id = %s", (user_id,))
-        user_data = cursor.fetchone()
+        user_data = await fetchone("SELECT email, PID FROM users WHERE id = %s", (user_id,), dictionary=True)
         if not user_data:
             raise HTTPException(status_code=404, detail="User not found")
         
@@ -195,59 +234,11 @@ async def getAIResponse(request: Request, prompt: str = Form(...)):
         )
 
 
-async def get_session(session_id: str) -> Optional[dict]:
-    """Retrieve session from database."""
-    connection = None
-    cursor = None
-    try:
-        connection = get_db_connection()
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute(
-            """
-            SELECT *
-            FROM sessions
-            WHERE id = %s
-            """,
-            (session_id,),
-        )
-        return cursor.fetchone()
-    finally:
-        if cursor:
-            cursor.close()
-        if connection:
-            connection.close()
-
-
-async def authenticate(request: Request):
-    session_id = request.cookies.get("session_id")
-    if not session_id:
-        return RedirectResponse(url="/login", status_code=302)
-
-    conn = get_db_connection()
-    if conn is None:
-        raise HTTPException(status_code=401, detail="Unauthorized: No session ID provided")
-
-    session = await get_session(session_id)
-    if not session:
-        return RedirectResponse(url="/login", status_code=302)
-
-    try:
-        cursor = conn.cursor()
-        cursor.execute("SELECT user_id FROM sessions WHERE id = %s", (session_id,))
-        valid_session = cursor.fetchone()
-        if not valid_session:
-            return None
-        user_id = valid_session[0]
-        return user_id
-    finally: 
-        cursor.close()
-        conn.close()
-
 class SensorData(BaseModel):
-    value: float
-    unit: str
+    value: float = Field(allow_inf_nan=False)
+    unit: str = Field(max_length=50)
     timestamp: Optional[str] = None
-    device_id: Optional[str] = None
+    device_id: Optional[str] = Field(None, max_length=255)
 class DeviceUpdate(BaseModel):
     new_mac_address: str
 
@@ -257,23 +248,17 @@ async def update_device(mac_address: str, request: Request, update: DeviceUpdate
     if user_id is None:
         return RedirectResponse(url="/login", status_code=302)
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute("""
+        result = await execute("""
             UPDATE devices
             SET device_id = %s
             WHERE device_id = %s AND user_id = %s
         """, (update.new_mac_address, mac_address, user_id))
-        conn.commit()
-        if cursor.rowcount == 0:
+        if result.rowcount == 0:
             raise HTTPException(status_code=404, detail="Device not found")
         return JSONResponse(content={"message": "Device updated successfully"})
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
-    finally:
-        cursor.close()
-        conn.close()
 
 @app.delete("/devices/{mac_address}")
 async def delete_device(mac_address: str, request: Request):
@@ -281,22 +266,16 @@ async def delete_device(mac_address: str, request: Request):
     if user_id is None:
         return RedirectResponse(url="/login", status_code=302)
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute("""
+        result = await execute("""
             DELETE FROM devices
             WHERE device_id = %s AND user_id = %s
         """, (mac_address, user_id))
-        conn.commit()
-        if cursor.rowcount == 0:
+        if result.rowcount == 0:
             raise HTTPException(status_code=404, detail="Device not found")
         return JSONResponse(content={"message": "Device deleted successfully"})
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
-    finally:
-        cursor.close()
-        conn.close()
 
 
 @app.delete("/wardrobe")
@@ -305,25 +284,15 @@ async def delete_clothing(request: Request, item: ClothingDelete):
     if user_id is None:
         return RedirectResponse(url="/login", status_code=302)
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute("""
-            DELETE FROM clothes
-            WHERE user_id = %s 
-              AND clothing_name = %s 
-              AND clothing_color = %s 
-              AND clothing_type = %s
-        """, (user_id, item.clothingType, item.clothingColor, item.clothingSize))
-        conn.commit()
-        if cursor.rowcount == 0:
+        result = await execute(
+            queries.DELETE_CLOTHING, (user_id, item.clothingType, item.clothingColor, item.clothingSize),
+        )
+        if result.rowcount == 0:
             raise HTTPException(status_code=404, detail="Clothing item not found")
         return JSONResponse(content={"message": "Clothing item deleted successfully!"})
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
-    finally:
-        cursor.close()
-        conn.close()
 
 
 @app.get("/api/{sensor_type}/count")
@@ -335,21 +304,127 @@ async def get_sensor_count(request: Request, sensor_type: str):
     if sensor_type not in ["temperature", "humidity", "light"]:
         raise HTTPException(status_code=404, detail="Invalid sensor type")
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    count = (await fetchone(queries.SENSOR_COUNT, (user_id, sensor_type)))[0]
+    return count
+
+# Bucket width in seconds, and the rollup table each bucket size is summed from
+AGGREGATE_BUCKETS = {"1m": 60, "5m": 300, "1h": 3600, "1d": 86400}
+AGGREGATE_SOURCES = {"1m": "1m", "5m": "1m", "1h": "1h", "1d": "1h"}
+# Each aggregate is computed from a bucket's [min, max, sum, count] totals
+AGGREGATE_FUNCTIONS = {
+    "avg": lambda totals: totals[2] / totals[3],
+    "min": lambda totals: totals[0],
+    "max": lambda totals: totals[1],
+    "count": lambda totals: totals[3],
+}
+
+def aggregate_windows(start, end, width):
+    """Splits an inclusive start-end range into whole rollup buckets and raw edges.
+
+    Returns (from, until) of the rollup buckets lying entirely inside the
+    range, or None if there are none, and the [from, until) windows at
+    either end that have to be summed from raw readings. None stands for
+    an open end.
+    """
+    step = timedelta(seconds=width)
+    full_from = None
+    if start is not None:
+        full_from = bucket_start(start, width)
+        if full_from < start:
+            full_from += step
+    # Stored timestamps are whole seconds, so end is followed by end + 1s
+    until = end + timedelta(seconds=1) if end is not None else None
+    full_until = bucket_start(until, width) if until is not None else None
+    if full_from is not None and full_until is not None and full_from >= full_until:
+        return None, [(start, until)]
+    edges = []
+    if start is not None and start < full_from:
+        edges.append((start, full_from))
+    if until is not None and full_until < until:
+        edges.append((full_until, until))
+    return (full_from, full_until), edges
+
+def add_totals(buckets, device_id, bucket, low, high, total, count):
+    key = (device_id, parse_timestamp(bucket))
+    totals = buckets.get(key)
+    if totals is None:
+        buckets[key] = [float(low), float(high), float(total), int(count)]
+    else:
+        totals[0] = min(totals[0], float(low))
+        totals[1] = max(totals[1], float(high))
+        totals[2] += float(total)
+        totals[3] += int(count)
+
+@app.get("/api/{sensor_type}/aggregate")
+async def get_sensor_aggregate(
+    request: Request,
+    sensor_type: str,
+    bucket: str = "1h",
+    agg: str = "avg,min,max,count",
+    start_date: Optional[str] = Query(None, alias="start-date"),
+    end_date: Optional[str] = Query(None, alias="end-date"),
+):
+    """Returns one row per device and time bucket, aggregated in the database.
 
+    Buckets are aligned to whole minutes/hours/days of the stored timestamps,
+    so charts get a few hundred points instead of every raw reading. The
+    per-minute or per-hour rollups supply every rollup bucket that lies
+    inside start-date to end-date; the partial ones at either end are summed
+    from the raw readings, so the range is honoured exactly.
+    """
+    user_id = await authenticate(request)
+    if user_id is None:
+        return RedirectResponse(url="/login", status_code=302)
+    if sensor_type not in ["temperature", "humidity", "light"]:
+        raise HTTPException(status_code=404, detail="Invalid sensor type")
+    if bucket not in AGGREGATE_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of {', '.join(AGGREGATE_BUCKETS)}")
+    aggregates = [name.strip() for name in agg.split(",") if name.strip()]
+    unknown = [name for name in aggregates if name not in AGGREGATE_FUNCTIONS]
+    if not aggregates or unknown:
+        raise HTTPException(status_code=400, detail=f"agg must be a comma-separated list of {', '.join(AGGREGATE_FUNCTIONS)}")
     try:
-        query = f"""
-            SELECT COUNT(*) FROM {sensor_type} s
-            JOIN devices d ON s.device_id = d.mac_address
-            WHERE d.user_id = %s
-        """
-        cursor.execute(query, (user_id,))
-        count = cursor.fetchone()[0]
-        return count
-    finally:
-        cursor.close()
-        conn.close()
+        start = parse_timestamp(start_date) if start_date else None
+        end = parse_timestamp(end_date) if end_date else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be ISO 8601")
+
+    source = AGGREGATE_SOURCES[bucket]
+    seconds = AGGREGATE_BUCKETS[bucket]
+    full, edges = aggregate_windows(start, end, ROLLUPS[source])
+    buckets = {}
+
+    if full is not None:
+        query, params = queries.rollup_aggregate(sensor_type, source, seconds, user_id, *full)
+        for row in await fetchall(query, params):
+            add_totals(buckets, *row)
+
+    # Days before the archive horizon are only in the Parquet files
+    horizon = await archive.horizon_start(sensor_type)
+    device_ids = None
+    for since, until in edges:
+        query, params = queries.raw_aggregate(sensor_type, seconds, user_id, since, until, horizon)
+        for row in await fetchall(query, params):
+            add_totals(buckets, *row)
+
+        if horizon is not None and since < horizon:
+            if device_ids is None:
+                devices = await fetchall(queries.USER_DEVICES, (user_id,))
+                device_ids = [device_id for (device_id,) in devices]
+            archived = await asyncio.to_thread(
+                archive.read_archive, sensor_type, device_ids, horizon, since, min(until, horizon) - timedelta(seconds=1),
+            )
+            if archived is not None:
+                for row in archived.to_pylist():
+                    value = row["value"]
+                    add_totals(buckets, row["device_id"], bucket_start(row["timestamp"], seconds), value, value, value, 1)
+
+    names = list(dict.fromkeys(aggregates))
+    rows = [
+        {"device_id": device_id, "bucket": start_of_bucket, **{name: AGGREGATE_FUNCTIONS[name](totals) for name in names}}
+        for (device_id, start_of_bucket), totals in sorted(buckets.items())
+    ]
+    return [streaming.format_row(row) for row in rows]
 
 @app.get("/clothes")
 async def get_clothes(request: Request):
@@ -362,14 +437,8 @@ async def get_clothes(request: Request):
     user_id = await authenticate(request)     # authenticate user first
     if user_id is None:
         return RedirectResponse(url="/login", status_code = 302)
-    conn = get_db_connection()
-    if conn is None:
-        raise HTTPException(status_code=500, detail="Database connection error")
     try:
-        cursor = conn.cursor(dictionary=True)  # Ensures results are returned as dictionaries
-        query = "SELECT * FROM clothes WHERE user_id = %s"
-        cursor.execute(query, (user_id,))
-        clothes = cursor.fetchall()
+        clothes = await fetchall(queries.USER_CLOTHES, (user_id,), dictionary=True)  # Rows come back as dictionaries
         if clothes:  # Check if clothes is not empty
             print("Clothes retrieved successfully:", clothes)
         else:
@@ -380,11 +449,6 @@ async def get_clothes(request: Request):
         error_details = traceback.format_exc()
         print("Database Error:", error_details)  # Log full error details
         raise HTTPException(status_code=500, detail=f"Database error: {e}")
-    
-
-    finally:
-        cursor.close()
-        conn.close()
 
 
 @app.post("/wardrobe")
@@ -392,53 +456,29 @@ async def add_to_wardrobe(request: Request, item: ClothingItem):
     user_id = await authenticate(request)
     if user_id is None:
         return RedirectResponse(url="/login", status_code=302)
-    conn = get_db_connection()
-    if conn is None:
-        raise HTTPException(status_code=500, detail="Database connection error")
     try:
-        cursor = conn.cursor()
-
-        # Ensure the table exists, and add a primary key if needed.
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS clothes (
-            clothing_id INT AUTO_INCREMENT PRIMARY KEY,
-            user_id INT NOT NULL,
-            clothing_name VARCHAR(255) NOT NULL,
-            clothing_color CHAR(7) NOT NULL,
-            clothing_type VARCHAR(10) NOT NULL,
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        );
-        """)
-        conn.commit()
-
         # Insert new clothing item with exactly four placeholders.
-        cursor.execute("""
+        inserted = await execute("""
         INSERT INTO clothes (clothing_name, clothing_color, clothing_type, user_id)
         VALUES (%s, %s, %s, %s);
         """, (item.clothingName, item.clothingColor, item.clothingType, user_id))
-        conn.commit()
 
         # Retrieve the inserted item using the auto-incremented clothing_id.
-        clothing_id = cursor.lastrowid
-        cursor.execute("""
+        clothing_id = inserted.lastrowid
+        result = await fetchone("""
         SELECT * FROM clothes 
         WHERE clothing_id = %s
-        """, (clothing_id,))
-        result = cursor.fetchone()  # Store the fetched result
+        """, (clothing_id,))  # Store the fetched result
         if result:
             print("Insertion successful")
             return RedirectResponse(url="/wardrobe", status_code=201)
         else:
             print("Insertion failed")
-        cursor.close()
     except mysql.connector.errors.InternalError as e:
         return JSONResponse(content={"error": "Unread result found. Please check query execution order."}, status_code=500)
     except Exception as e:
         print(f"❌ Error updating clothing: {e}")
         return JSONResponse(content={"error": f"Database error: {str(e)}"}, status_code=500)
-    finally:
-        if conn:
-            conn.close()
 
 
 
@@ -452,21 +492,13 @@ async def get_session_id_by_user_id(user_id: int) -> Optional[str]:
     Returns:
         The session ID as a string if a session exists, otherwise None.
     """
-    connection = None
-    cursor = None
-    try:
-        connection = get_db_connection()
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute("SELECT id FROM sessions WHERE user_id = %s", (user_id,))
-        result = cursor.fetchone()
-        if result:
-            return result.get("id")
-        return None
-    finally:
-        if cursor:
-            cursor.close()
-        if connection and connection.is_connected():
-            connection.close()
+    result = await fetchone(queries.USER_SESSION, (user_id,), dictionary=True)
+    if result:
+        return result.get("id")
+    return None
+
+# Largest page size accepted by GET /api/{sensor_type}?limit=
+SENSOR_PAGE_MAX = int(os.getenv("SENSOR_PAGE_MAX", "5000"))
 
 @app.get("/api/{sensor_type}")
 async def get_all_sensor_data(
@@ -474,65 +506,101 @@ async def get_all_sensor_data(
     sensor_type: str,
     order_by: Optional[str] = Query(None, alias="order-by"),
     start_date: Optional[str] = Query(None, alias="start-date"),
-    end_date: Optional[str] = Query(None, alias="end-date")
+    end_date: Optional[str] = Query(None, alias="end-date"),
+    limit: Optional[int] = Query(None, ge=1, le=SENSOR_PAGE_MAX),
+    after_id: Optional[int] = None,
+    after_ts: Optional[str] = None,
+    output_format: Optional[str] = Query(None, alias="format"),
 ):
-    """Fetch sensor data with optional filtering and sorting."""
+    """Fetch sensor data with optional filtering and sorting.
+
+    With limit, returns one page plus a next_cursor (after_id, and after_ts
+    when ordered by timestamp) to pass back for the following page. With
+    format=ndjson or format=csv, which are not paginated, every matching row
+    is streamed from the database instead of being collected in memory first. Readings moved to the Parquet archive
+    (see app.archive) are read from there and merged in.
+    """
+    user_id = await authenticate(request)
+    if user_id is None:
+        return RedirectResponse(url="/login", status_code=302)
     if sensor_type not in ["temperature", "humidity", "light"]:
         raise HTTPException(status_code=404, detail="Invalid sensor type")
-
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-
+    if output_format not in (None, "json", "ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be json, ndjson or csv")
+    paginated = limit is not None or after_id is not None or after_ts is not None
+    if paginated and output_format in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="limit, after_id and after_ts only apply to JSON pages; streaming formats return every row")
+    if paginated and order_by == "value":
+        raise HTTPException(status_code=400, detail="Pagination supports ordering by timestamp or id only")
+    if after_ts is not None and order_by != "timestamp":
+        raise HTTPException(status_code=400, detail="after_ts is only valid with order-by=timestamp")
+    if order_by == "timestamp" and (after_id is None) != (after_ts is None):
+        raise HTTPException(status_code=400, detail="Timestamp-ordered pages need both after_ts and after_id")
     try:
-        query = f"""
-            SELECT s.* FROM {sensor_type} s
-            JOIN devices d ON s.device_id = d.device_id
-            WHERE d.user_id = %s
-        """
-        params = [user_id]
+        start = parse_timestamp(start_date) if start_date else None
+        end = parse_timestamp(end_date) if end_date else None
+        after_at = parse_timestamp(after_ts) if after_ts is not None else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be ISO 8601")
+
+    # Days before the horizon are read from the Parquet archive instead
+    horizon = await archive.horizon_start(sensor_type)
+    # One extra row tells us whether another page exists
+    query, params = queries.sensor_rows(
+        sensor_type, user_id, horizon, start, end, order_by,
+        after_id, after_at, limit + 1 if limit is not None else None, paginated,
+    )
 
-        if start_date:
-            query += " AND s.timestamp >= %s"
-            params.append(start_date)
+    archived, key = None, None
+    if horizon is not None and (start is None or start < horizon):
+        archived, key = await read_archived_rows(
+            user_id, sensor_type, horizon, order_by, start, end,
+            after_id, after_at, limit + 1 if limit is not None else None, paginated,
+        )
 
-        if end_date:
-            query += " AND s.timestamp <= %s"
-            params.append(end_date)
+    if output_format in ("ndjson", "csv"):
+        rows = archive.merge_chunks(archived, stream_rows(query, params), key)
+        return streaming.ClosingStreamingResponse(
+            streaming.encode(rows, output_format), media_type=streaming.MEDIA_TYPES[output_format],
+        )
 
-        if order_by in ["value", "timestamp"]:
-            query += f" ORDER BY s.{order_by} ASC"
+    data = await fetchall(query, params, dictionary=True)
+    if archived is not None:
+        data = archive.merge_rows(archived.to_pylist(), data, key)
+    data = [streaming.format_row(record) for record in data]
 
-        cursor.execute(query, params)
-        data = cursor.fetchall()
+    if limit is None:
+        return data
 
-        # Convert timestamp fields to the expected format
-        for record in data:
-            ts = record.get("timestamp")
-            if ts and isinstance(ts, datetime):
-                record["timestamp"] = ts.strftime("%Y-%m-%d %H:%M:%S")
+    next_cursor = None
+    if len(data) > limit:
+        data = data[:limit]
+        last = data[-1]
+        next_cursor = {"after_id": last["id"]}
+        if order_by == "timestamp":
+            next_cursor["after_ts"] = last["timestamp"]
+    return {"data": data, "next_cursor": next_cursor}
 
-        return data
-    finally:
-        cursor.close()
-        conn.close()
-
-async def delete_session(session_id: str) -> bool:
-    """Delete a session from the database."""
-    connection = None
-    cursor = None
-    try:
-        connection = get_db_connection()
-        cursor = connection.cursor()
-        cursor.execute("DELETE FROM sessions WHERE id = %s", (session_id,))
-        connection.commit()
-        return True
-    finally:
-        if cursor:
-            cursor.close()
-        if connection and connection.is_connected():
-            connection.close()
 
+async def read_archived_rows(user_id, sensor_type, horizon, order_by, start, end, after_id, after_at, limit, paginated):
+    """Reads the user's readings from before horizon matching a GET /api/{sensor_type} request.
 
+    start, end and after_at are the request's parsed dates. Returns the rows
+    as a pyarrow Table, or None, and the sort key the live rows are merged in by.
+    """
+    if paginated:
+        order = "timestamp" if order_by == "timestamp" else "id"
+        key = (lambda row: (row["timestamp"], row["id"])) if order == "timestamp" else (lambda row: row["id"])
+    else:
+        order = order_by if order_by in ("value", "timestamp") else None
+        key = (lambda row: row[order]) if order is not None else None
+    after = (after_at, after_id) if after_id is not None else None
+    devices = await fetchall(queries.USER_DEVICES, (user_id,))
+    archived = await asyncio.to_thread(
+        archive.read_archive, sensor_type, [device_id for (device_id,) in devices], horizon,
+        start, end, after, order, limit,
+    )
+    return archived, key
 
 # Helper function to get current user's ID (can be used in other routes)
 def get_current_user_id(response: Response) -> int:
@@ -546,159 +614,319 @@ async def get_devices(request: Request):
     user_id = await authenticate(request)
     if not user_id:
         raise HTTPException(status_code=401, detail="Not authenticated")
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
+    devices = await fetchall('''
+        SELECT * FROM devices WHERE user_id = %s
+    ''', (user_id,), dictionary=True)
+    return [{"mac_address": device["device_id"]} for device in devices]
 
-    try:
-        cursor.execute('''
-            SELECT * FROM devices WHERE user_id = %s
-        ''', (user_id,))
-        devices = cursor.fetchall()
-        return [{"mac_address": device["device_id"]} for device in devices]
-    finally:
-        cursor.close()
-        conn.close()
-
-
-@app.post("/signup")
-def signup(
-    name: str = Form(...),
-    email: str = Form(...),
-    password: str = Form(...),
-    location: str = Form(...),
-    PID: str = Form(...)
 
+@app.post("/api/{sensor_type}")
+async def insert_sensor_data(
+    request: Request,
+    sensor_type: str,
+    data: SensorData,    
 ):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    # Check if the email already exists
-    cursor.execute('''
-        SELECT id FROM users WHERE email = ?
-    ''', (email,))
-    existing_user = cursor.fetchone()
-    
-    if existing_user:
-        raise HTTPException(status_code=400, detail="Email already registered")
-    
-    # Hash the password
-    hashed_password = hash_password(password)
-    
-    # Insert the new user
-    cursor.execute('''
-        INSERT INTO users (name, email, hashed_password, location, PID)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (name, email, hashed_password, location, PID))
-    conn.commit()
-    
-    # After successful registration, redirect to login with success message
-    return RedirectResponse(
-        url="/login?message=Successfully+Registered!!!",
-        status_code=303
-    )
+    user_id = await authenticate(request)
+    if user_id is None:
+        return RedirectResponse(url="/login", status_code=302)
+    """Insert new sensor data."""
+    if sensor_type not in ["temperature", "humidity", "light"]:
+        raise HTTPException(status_code=404, detail="Invalid sensor type")
+
+    # Verify device belongs to user
+    device = await fetchone('''
+        SELECT device_id FROM devices 
+        WHERE user_id = %s AND device_id = %s
+    ''', (user_id, data.device_id))
+    if not device:
+        raise HTTPException(status_code=403, detail="Device not authorized")
 
-async def get_user_by_email(email: str) -> Optional[dict]:
-    """Retrieve user from database by username."""
-    connection = None
-    cursor = None
-    try:
-        connection = get_db_connection()
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM users WHERE email = %s", (email,))
-        return cursor.fetchone()
-    finally:
-        if cursor:
-            cursor.close()
-        if connection and connection.is_connected():
-            connection.close()
-
-async def create_session(user_id: int, session_id: str) -> bool:
-    """Create a new session in the database."""
-    connection = None
-    cursor = None
     try:
-        connection = get_db_connection()
-        cursor = connection.cursor()
-        cursor.execute(
-            "INSERT INTO sessions (id, user_id) VALUES (%s, %s)", (session_id, user_id)
-        )
-        connection.commit()
-        return True
-    finally:
-        if cursor:
-            cursor.close()
-        if connection and connection.is_connected():
-            connection.close()
-
-@app.post("/login")
-async def login(
-    email: str = Form(...),
-    password: str = Form(...),
-    response: Response = None
+        timestamp = parse_timestamp(data.timestamp) if data.timestamp else datetime.now()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid timestamp")
+    reading_id = await insert_readings(sensor_type, [(data.value, data.unit, timestamp, data.device_id)])
+    return {"id": reading_id}
+
+# Largest number of readings accepted by one batch request
+SENSOR_BATCH_MAX = int(os.getenv("SENSOR_BATCH_MAX", "5000"))
+
+@app.post("/api/{sensor_type}/batch")
+async def insert_sensor_data_batch(
+    request: Request,
+    sensor_type: str,
+    readings: List[Dict[str, Any]],
+):
+    """Insert many sensor readings, possibly for several devices, in one transaction."""
+    user_id = await authenticate(request)
+    if user_id is None:
+        return RedirectResponse(url="/login", status_code=302)
+    if sensor_type not in ["temperature", "humidity", "light"]:
+        raise HTTPException(status_code=404, detail="Invalid sensor type")
+    if len(readings) > SENSOR_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {SENSOR_BATCH_MAX} readings per batch")
+
+    # Validate each item on its own so one bad reading does not reject the batch
+    results = []
+    parsed = []
+    for index, item in enumerate(readings):
+        try:
+            parsed.append((index, SensorData(**item)))
+        except ValidationError as e:
+            results.append({"index": index, "status": "rejected", "detail": e.errors()[0]["msg"]})
+
+    # Check ownership once per distinct device
+    device_ids = sorted({reading.device_id for _, reading in parsed if reading.device_id})
+    owned = set()
+    if device_ids:
+        placeholders = ", ".join(["%s"] * len(device_ids))
+        rows = await fetchall(f'''
+            SELECT device_id FROM devices
+            WHERE user_id = %s AND device_id IN ({placeholders})
+        ''', [user_id, *device_ids])
+        owned = {row[0] for row in rows}
+
+    now = datetime.now()
+    rows = []
+    for index, reading in parsed:
+        if reading.device_id not in owned:
+            results.append({"index": index, "status": "rejected", "detail": "Device not authorized"})
+            continue
+        try:
+            timestamp = parse_timestamp(reading.timestamp) if reading.timestamp else now
+        except ValueError:
+            results.append({"index": index, "status": "rejected", "detail": "Invalid timestamp"})
+            continue
+        rows.append((reading.value, reading.unit, timestamp, reading.device_id))
+        results.append({"index": index, "status": "inserted"})
+
+    if rows:
+        await insert_readings(sensor_type, rows)
+
+    results.sort(key=lambda result: result["index"])
+    return {"inserted": len(rows), "rejected": len(readings) - len(rows), "results": results}
+
+# Bulk import settings
+#   IMPORT_CHUNK_ROWS  readings committed per transaction by an import
+#   IMPORT_MAX_ERRORS  rejected lines listed individually in an import's summary
+#   IMPORT_DEVICE_CACHE  device ownership lookups an import remembers
+IMPORT_CHUNK_ROWS = int(os.getenv("IMPORT_CHUNK_ROWS", "1000"))
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "100"))
+IMPORT_DEVICE_CACHE = int(os.getenv("IMPORT_DEVICE_CACHE", "1000"))
+IMPORT_FORMATS = {media_type: name for name, media_type in streaming.MEDIA_TYPES.items()}
+
+@app.post("/api/{sensor_type}/import")
+async def import_sensor_data(
+    request: Request,
+    sensor_type: str,
+    input_format: Optional[str] = Query(None, alias="format"),
+    import_id: Optional[str] = None,
 ):
+    """Import readings from a CSV or NDJSON upload of any size.
+
+    The body is parsed line by line as it arrives, in the format given by
+    format= or the Content-Type. CSV needs a header row naming the fields;
+    like NDJSON objects, rows hold value, unit, device_id (or mac_address,
+    as the old temperature table did) and optionally timestamp. Rows are
+    checked like /batch ones and every IMPORT_CHUNK_ROWS accepted readings
+    commit in one transaction, after which the import's progress is saved
+    for GET /api/imports/{import_id}; pass a UUID of your own as import_id
+    to follow it from the start. Committed chunks stay if the upload fails
+    part way, and lines_read says where to resume. Imported readings are not
+    pushed to live streams.
+    """
+    user_id = await authenticate(request)
+    if user_id is None:
+        return RedirectResponse(url="/login", status_code=302)
+    if sensor_type not in ["temperature", "humidity", "light"]:
+        raise HTTPException(status_code=404, detail="Invalid sensor type")
+    if input_format is None:
+        input_format = IMPORT_FORMATS.get(request.headers.get("content-type", "").split(";")[0].strip())
+    if input_format not in ("csv", "ndjson"):
+        raise HTTPException(status_code=415, detail="Upload text/csv or application/x-ndjson, or pass format=csv or format=ndjson")
+    if import_id is None:
+        import_id = str(uuid.uuid4())
+    else:
+        try:
+            import_id = str(uuid.UUID(import_id))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="import_id must be a UUID")
+
+    now = datetime.now()
     try:
-        # Hash the password for comparison
-        hashed_password = hash_password(password)
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        user = await get_user_by_email(email)
-        username = user["username"]
-        print(username)
-        if not user or user["password"] != password:
-        # You could redirect back to login with an error message or display an error page.
-            return HTMLResponse(content="Invalid username or password", status_code=401)
-        # Check if user exists and password matches
-        cursor.execute('''
-            SELECT id, email FROM users WHERE email = ? AND hashed_password = ?
-        ''', (email, hashed_password))
-        user = cursor.fetchone()
-        session_id = str(uuid.uuid4())
-        await create_session(username, session_id)
-        response = RedirectResponse(url=f"/dashboard", status_code=302)
-        response.set_cookie(key="session_id", value=session_id, httponly=True, max_age = 3600)
-        return response
-        
-
-        
+        await execute("""
+            INSERT INTO sensor_imports (id, user_id, sensor_type, status, started_at, updated_at)
+            VALUES (%s, %s, %s, 'running', %s, %s)
+        """, (import_id, user_id, sensor_type, now, now))
+    except mysql.connector.errors.IntegrityError:
+        raise HTTPException(status_code=409, detail="import_id is already in use")
+
+    progress = {"bytes_read": 0, "lines_read": 0, "inserted": 0, "rejected": 0}
+    errors = []
+
+    async def body():
+        async for data in request.stream():
+            progress["bytes_read"] += len(data)
+            yield data
+
+    def reject(line, detail):
+        progress["rejected"] += 1
+        if len(errors) < IMPORT_MAX_ERRORS:
+            errors.append({"line": line, "detail": detail})
+
+    async def save(status, error=None):
+        await execute("""
+            UPDATE sensor_imports
+            SET status = %s, bytes_read = %s, lines_read = %s, inserted = %s, rejected = %s,
+                error = %s, updated_at = %s
+            WHERE id = %s
+        """, (status, progress["bytes_read"], progress["lines_read"], progress["inserted"],
+              progress["rejected"], error, datetime.now(), import_id))
+
+    async def commit(rows, line):
+        if rows:
+            await run_db(write_readings, sensor_type, rows)
+            progress["inserted"] += len(rows)
+        progress["lines_read"] = line
+
+    # Ownership lookups of the most recently seen devices, least recent first;
+    # an upload naming endless device ids cannot grow it past IMPORT_DEVICE_CACHE
+    owned = OrderedDict()
+    rows = []
+    line = 0
+    status, error = "done", None
+    try:
+        async for line, record, problem in streaming.decode(body(), input_format):
+            if problem is not None:
+                reject(line, problem)
+                continue
+            if "device_id" not in record and "mac_address" in record:
+                record["device_id"] = record.pop("mac_address")
+            try:
+                reading = SensorData(**record)
+            except ValidationError as e:
+                reject(line, e.errors()[0]["msg"])
+                continue
+            if reading.device_id in owned:
+                owned.move_to_end(reading.device_id)
+                allowed = owned[reading.device_id]
+            else:
+                allowed = reading.device_id is not None and await fetchone(
+                    queries.OWNED_DEVICE, (user_id, reading.device_id),
+                ) is not None
+                owned[reading.device_id] = allowed
+                if len(owned) > IMPORT_DEVICE_CACHE:
+                    owned.popitem(last=False)
+            if not allowed:
+                reject(line, "Device not authorized")
+                continue
+            try:
+                timestamp = parse_timestamp(reading.timestamp) if reading.timestamp else now
+            except ValueError:
+                reject(line, "Invalid timestamp")
+                continue
+            rows.append((reading.value, reading.unit, timestamp, reading.device_id))
+            if len(rows) >= IMPORT_CHUNK_ROWS:
+                await commit(rows, line)
+                rows = []
+                await save("running")
+        await commit(rows, line)
+    except streaming.MalformedUpload as e:
+        status, error = "failed", str(e)
+    except ClientDisconnect:
+        status, error = "failed", "Upload interrupted"
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        await save("failed", f"Database error: {e}"[:255])
+        raise
+    await save(status, error)
 
+    summary = {"id": import_id, "status": status, **progress, "error": error, "errors": errors}
+    return JSONResponse(content=summary, status_code=200 if status == "done" else 400)
 
-@app.post("/api/{sensor_type}")
-async def insert_sensor_data(
+@app.get("/api/imports/{import_id}")
+async def get_import(request: Request, import_id: str):
+    """Progress of one of the user's imports."""
+    user_id = await authenticate(request)
+    if user_id is None:
+        return RedirectResponse(url="/login", status_code=302)
+    row = await fetchone("""
+        SELECT id, sensor_type, status, bytes_read, lines_read, inserted, rejected, error, started_at, updated_at
+        FROM sensor_imports WHERE id = %s AND user_id = %s
+    """, (import_id, user_id), dictionary=True)
+    if not row:
+        raise HTTPException(status_code=404, detail="Import not found")
+    return streaming.format_row(row)
+
+@app.get("/api/{sensor_type}/export")
+async def export_sensor_data(
     request: Request,
     sensor_type: str,
-    data: SensorData,    
+    output_format: str = Query("csv", alias="format"),
+    device: Optional[str] = None,
+    start_date: Optional[str] = Query(None, alias="start-date"),
+    end_date: Optional[str] = Query(None, alias="end-date"),
+    gzip: bool = False,
 ):
+    """Download the user's readings as CSV or NDJSON, optionally gzip-compressed.
+
+    Rows go out device by device in timestamp order, read from an
+    unbuffered cursor a chunk at a time (and from the Parquet archive a day
+    at a time), so memory use does not grow with the export and the first
+    rows arrive straight away. device limits the export to one of the
+    user's devices.
+    """
     user_id = await authenticate(request)
     if user_id is None:
         return RedirectResponse(url="/login", status_code=302)
-    """Insert new sensor data."""
     if sensor_type not in ["temperature", "humidity", "light"]:
         raise HTTPException(status_code=404, detail="Invalid sensor type")
-
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
+    if output_format not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
     try:
-        # Verify device belongs to user
-        cursor.execute('''
-            SELECT mac_address FROM devices 
-            WHERE user_id = %s AND mac_address = %s
-        ''', (user_id, data.device_id))
-        if not cursor.fetchone():
+        start = parse_timestamp(start_date) if start_date else None
+        end = parse_timestamp(end_date) if end_date else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be ISO 8601")
+
+    if device is not None:
+        owned = await fetchone(queries.OWNED_DEVICE, (user_id, device))
+        if not owned:
             raise HTTPException(status_code=403, detail="Device not authorized")
-
-        timestamp = data.timestamp if data.timestamp else datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        query = f"""
-            INSERT INTO {sensor_type} (value, unit, timestamp, device_id)
-            VALUES (%s, %s, %s, %s)
-        """
-        cursor.execute(query, (data.value, data.unit, timestamp, data.device_id))
-        conn.commit()
-        return {"id": cursor.lastrowid}
-    finally:
-        cursor.close()
-        conn.close()
+        device_ids = [device]
+    else:
+        devices = await fetchall(
+            "SELECT device_id FROM devices WHERE user_id = %s ORDER BY device_id", (user_id,),
+        )
+        device_ids = [device_id for (device_id,) in devices]
+
+    body = streaming.encode(export_rows(sensor_type, device_ids, start, end), output_format)
+    filename = f"{sensor_type}.{output_format}"
+    media_type = streaming.MEDIA_TYPES[output_format]
+    if gzip:
+        body = streaming.gzipped(body)
+        filename += ".gz"
+        media_type = "application/gzip"
+    return streaming.ClosingStreamingResponse(body, media_type=media_type, headers={
+        "Content-Disposition": f'attachment; filename="{filename}"',
+    })
+
+
+async def export_rows(sensor_type, device_ids, start, end):
+    """Yields chunks of each device's readings from start to end, oldest first."""
+    horizon = await archive.horizon_start(sensor_type)
+    for device_id in device_ids:
+        for path in archive.archived_paths(sensor_type, device_id, horizon, start, end):
+            table = await asyncio.to_thread(archive.read_files, [path], start, end)
+            table = table.sort_by([("timestamp", "ascending"), ("id", "ascending")])
+            for rows in archive.table_chunks(table):
+                yield rows
+
+        # (device_id, timestamp) index order, so nothing has to be sorted first
+        query, params = queries.device_rows(sensor_type, device_id, horizon, start, end)
+        # Closed even when the export is abandoned part way, returning the connection
+        async with aclosing(stream_rows(query, params)) as live:
+            async for rows in live:
+                yield rows
 
 @app.get("/api/{sensor_type}/{id}")
 async def get_sensor_data(
@@ -713,25 +941,17 @@ async def get_sensor_data(
     if sensor_type not in ["temperature", "humidity", "light"]:
         raise HTTPException(status_code=404, detail="Invalid sensor type")
 
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-
-    try:
-        query = f"""
-            SELECT s.* FROM {sensor_type} s
-            JOIN devices d ON s.device_id = d.mac_address
-            WHERE s.id = %s AND d.user_id = %s
-        """
-        cursor.execute(query, (id, user_id))
-        data = cursor.fetchone()
+    query = f"""
+        SELECT s.* FROM {sensor_type} s
+        JOIN devices d ON s.device_id = d.device_id
+        WHERE s.id = %s AND d.user_id = %s
+    """
+    data = await fetchone(query, (id, user_id), dictionary=True)
 
-        if not data:
-            raise HTTPException(status_code=404, detail="Data not found")
+    if not data:
+        raise HTTPException(status_code=404, detail="Data not found")
 
-        return data
-    finally:
-        cursor.close()
-        conn.close()
+    return data
 
 @app.put("/api/{sensor_type}/{id}")
 async def update_sensor_data(
@@ -747,48 +967,35 @@ async def update_sensor_data(
     if sensor_type not in ["temperature", "humidity", "light"]:
         raise HTTPException(status_code=404, detail="Invalid sensor type")
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    # Verify device belongs to user
+    device = await fetchone('''
+        SELECT device_id FROM devices 
+        WHERE user_id = %s AND device_id = %s
+    ''', (user_id, data.device_id))
+    if not device:
+        raise HTTPException(status_code=403, detail="Device not authorized")
+
+    changes = {}
+
+    if data.value is not None:
+        changes["value"] = data.value
+    if data.unit:
+        changes["unit"] = data.unit
+    if data.timestamp:
+        changes["timestamp"] = data.timestamp
 
+    if not changes:
+        raise HTTPException(status_code=400, detail="No fields to update")
+
+    # Runs in one transaction with queuing the affected rollup buckets for repair
     try:
-        # Verify device belongs to user
-        cursor.execute('''
-            SELECT mac_address FROM devices 
-            WHERE user_id = %s AND mac_address = %s
-        ''', (user_id, data.device_id))
-        if not cursor.fetchone():
-            raise HTTPException(status_code=403, detail="Device not authorized")
+        updated = await update_reading(sensor_type, id, user_id, changes)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid timestamp")
+    if not updated:
+        raise HTTPException(status_code=404, detail="Data not found")
 
-        updates = []
-        params = []
-
-        if data.value is not None:
-            updates.append("value = %s")
-            params.append(data.value)
-        if data.unit:
-            updates.append("unit = %s")
-            params.append(data.unit)
-        if data.timestamp:
-            updates.append("timestamp = %s")
-            params.append(data.timestamp)
-
-        if not updates:
-            raise HTTPException(status_code=400, detail="No fields to update")
-
-        params.extend([id, user_id])
-        query = f"""
-            UPDATE {sensor_type} s
-            JOIN devices d ON s.device_id = d.mac_address
-            SET {', '.join(updates)}
-            WHERE s.id = %s AND d.user_id = %s
-        """
-        cursor.execute(query, params)
-        conn.commit()
-
-        return {"message": "Updated successfully"}
-    finally:
-        cursor.close()
-        conn.close()
+    return {"message": "Updated successfully"}
 
 # @app.get("/get_devices")
 # async def get_devices():
@@ -802,47 +1009,88 @@ async def update_sensor_data(
 #         raise HTTPException(status_code=500, detail=f"Database error: {e}")
     
 @app.get("/get_temp/{mac_address}")
-async def get_temp(mac_address: str):
+async def get_temp(request: Request, mac_address: str, since_id: Optional[int] = None):
+    """Temperature readings for a MAC address, oldest first.
+
+    With since_id, only readings with a larger id are returned. The ETag
+    names the newest reading, so a poll sending it back in If-None-Match
+    gets an empty 304 until something new arrives.
+    """
     try:
-        conn = get_db_connection()
-        # Using a dictionary cursor so that we get results as dicts.
-        cursor = conn.cursor(dictionary=True)
-        sql = "SELECT id, temperature, unit, mac_address FROM temperature WHERE mac_address = %s"
-        cursor.execute(sql, (mac_address,))
-        records = cursor.fetchall()
-        if not records:
+        latest = (await fetchone("SELECT MAX(id) FROM temperature WHERE device_id = %s", (mac_address,)))[0]
+        etag = f'W/"{latest or 0}"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+
+        # Rows come back as dicts.
+        records = await fetchall(queries.TEMPERATURE_SINCE, (mac_address, since_id or 0, latest or 0), dictionary=True)
+        if not records and since_id is None:
             raise HTTPException(status_code=404, detail="No temperature data found for the given MAC address.")
-        return {"data": records}
+        data = [streaming.format_row(record) for record in records]
+        return JSONResponse(content={"data": data}, headers={"ETag": etag})
     except mysql.connector.Error as e:
         import traceback
         print("Database Error:", traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Database error: {e}")
-    finally:
-        if conn.is_connected():
-            cursor.close()
-            conn.close()
+
+@app.get("/stream/{mac_address}")
+async def stream_readings(request: Request, mac_address: str, sensor_type: str = "temperature"):
+    """Server-Sent Events carrying each reading of a device as soon as it is committed.
+
+    Readings come from the in-process broker, so an open stream costs no
+    database reads, but it only carries readings this worker stored (none
+    from other workers or the bridge's direct mode). Clients should keep
+    catching up through /get_temp with since_id alongside it, and after
+    being disconnected for falling too far behind.
+    """
+    user_id = await authenticate(request)
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    if sensor_type not in ["temperature", "humidity", "light"]:
+        raise HTTPException(status_code=404, detail="Invalid sensor type")
+    device = await fetchone('''
+        SELECT device_id FROM devices
+        WHERE user_id = %s AND device_id = %s
+    ''', (user_id, mac_address))
+    if not device:
+        raise HTTPException(status_code=403, detail="Device not authorized")
+
+    subscription = readings_broker.subscribe((sensor_type, mac_address))
+
+    async def events():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    reading = await asyncio.wait_for(subscription.get(), STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if reading is None:
+                    return
+                yield f"id: {reading['id']}\nevent: reading\ndata: {json.dumps(reading)}\n\n"
+        finally:
+            subscription.close()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.post("/add_temp")
 async def add_temp(data: TemperatureData):
+    # Access the fields from the model
+    temp = str(data.value)
+    print(temp + " " + data.unit + " " + data.mac_address)
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        # Access the fields from the model
-        temp = str(data.value)
-        print(temp + " " + data.unit + " " + data.mac_address)
-        sql = "INSERT INTO temperature (temperature, units, mac_address) VALUES (%s, %s, %s)"
-        values = (str(data.value), data.unit, data.mac_address)
-        cursor.execute(sql, values)
-        conn.commit() 
-        return {"message": "Temperature data added successfully."}
-    except mysql.connector.Error as e:
-        import traceback
-        print("Database Error:", traceback.format_exc())
-        raise HTTPException(status_code=500, detail=f"Database error: {e}")
-    finally:
-        if conn.is_connected():
-            cursor.close()
-            conn.close()
+        timestamp = parse_timestamp(data.timestamp) if data.timestamp else datetime.now()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid timestamp")
+    # Written to the database by the ingest buffer's background flusher
+    if not temperature_buffer.offer((data.value, data.unit, timestamp, data.mac_address)):
+        raise HTTPException(status_code=429, detail="Ingest buffer full, retry later", headers={"Retry-After": "1"})
+    return {"message": "Temperature data added successfully."}
 
 @app.delete("/api/{sensor_type}/{id}")
 async def delete_sensor_data(
@@ -857,22 +1105,10 @@ async def delete_sensor_data(
     if sensor_type not in ["temperature", "humidity", "light"]:
         raise HTTPException(status_code=404, detail="Invalid sensor type")
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    if not await delete_reading(sensor_type, id, user_id):
+        raise HTTPException(status_code=404, detail="Data not found")
 
-    try:
-        query = f"""
-            DELETE s FROM {sensor_type} s
-            JOIN devices d ON s.device_id = d.device_id
-            WHERE s.id = %s AND d.user_id = %s
-        """
-        cursor.execute(query, (id, user_id))
-        conn.commit()
-
-        return {"message": "Deleted successfully"}
-    finally:
-        cursor.close()
-        conn.close()
+    return {"message": "Deleted successfully"}
 
 # Weather App
 def get_loc(city: str):
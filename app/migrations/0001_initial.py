@@ -0,0 +1,75 @@
+"""Tables that create_tables() and add_to_wardrobe used to create on the fly."""
+
+
+def upgrade(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            email VARCHAR(255) UNIQUE NOT NULL,
+            hashed_password VARCHAR(255) NOT NULL,
+            PID VARCHAR(10) NOT NULL,
+            location VARCHAR(255)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sessions (
+            id VARCHAR(36) PRIMARY KEY,
+            user_id INT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+    ''')
+
+    # Deny-list for signed session tokens revoked before they expire
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS revoked_sessions (
+            jti VARCHAR(32) PRIMARY KEY,
+            expires_at DATETIME NOT NULL
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS devices (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            user_id INT NOT NULL,
+            device_id VARCHAR(255) UNIQUE NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS wardrobe (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            user_id INT NOT NULL,
+            item_name VARCHAR(255) NOT NULL,
+            item_type VARCHAR(255) NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS clothes (
+            clothing_id INT AUTO_INCREMENT PRIMARY KEY,
+            user_id INT NOT NULL,
+            clothing_name VARCHAR(255) NOT NULL,
+            clothing_color CHAR(7) NOT NULL,
+            clothing_type VARCHAR(10) NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    ''')
+
+    # A database that ran the old create_temperatures_table() keeps its
+    # temperature table here; 0002 reconciles it.
+    for sensor_type in ["temperature", "humidity", "light"]:
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {sensor_type} (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                value FLOAT NOT NULL,
+                unit VARCHAR(50) NOT NULL,
+                timestamp DATETIME NOT NULL,
+                device_id VARCHAR(255),
+                FOREIGN KEY (device_id) REFERENCES devices (device_id)
+            )
+        ''')
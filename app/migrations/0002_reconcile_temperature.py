@@ -0,0 +1,31 @@
+"""Give the temperature table one layout.
+
+create_temperatures_table() defined temperature as (temperature, unit,
+mac_address, timestamp) while create_tables() defined it like the other
+sensor tables as (value, unit, timestamp, device_id). Whichever ran first
+won. Both are brought to the sensor-table layout; the MAC address is the
+device id everywhere else, so mac_address becomes device_id.
+
+The foreign key to devices is dropped: the MQTT bridge stores readings
+from boards that have not been registered yet, which the old layout
+allowed.
+"""
+from . import column_names, foreign_keys
+
+
+def upgrade(cursor):
+    columns = column_names(cursor, "temperature")
+    if "temperature" in columns:
+        cursor.execute("ALTER TABLE temperature CHANGE COLUMN temperature value FLOAT NOT NULL")
+    if "mac_address" in columns:
+        cursor.execute("ALTER TABLE temperature CHANGE COLUMN mac_address device_id VARCHAR(255)")
+
+    for constraint in foreign_keys(cursor, "temperature", "devices"):
+        cursor.execute(f"ALTER TABLE temperature DROP FOREIGN KEY `{constraint}`")
+
+    cursor.execute("UPDATE temperature SET timestamp = CURRENT_TIMESTAMP WHERE timestamp IS NULL")
+    cursor.execute('''
+        ALTER TABLE temperature
+            MODIFY unit VARCHAR(50) NOT NULL,
+            MODIFY timestamp DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+    ''')
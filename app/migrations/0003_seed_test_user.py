@@ -0,0 +1,10 @@
+"""Seed a test user into an empty database (formerly seed_database())."""
+
+
+def upgrade(cursor):
+    cursor.execute("SELECT COUNT(*) FROM users")
+    if cursor.fetchone()[0] == 0:
+        cursor.execute('''
+            INSERT INTO users (name, email, hashed_password, location, PID)
+            VALUES (%s, %s, %s, %s, %s)
+        ''', ("Test User", "test@example.com", "test123", "Test Location", "A12345678"))
@@ -0,0 +1,26 @@
+"""Secondary indexes matching the hot query shapes.
+
+  sensor tables  (device_id, timestamp): readings per device, optionally
+                 limited to a date range (/get_temp, /api/{sensor_type})
+  devices        (user_id, device_id): a user's devices and the ownership
+                 check before every sensor read or write
+  sessions       (user_id, created_at): sessions of a user
+  clothes        (user_id, clothing_name, clothing_color, clothing_type):
+                 /clothes listing and the update/delete lookups
+"""
+from . import index_exists
+
+INDEXES = [
+    ("temperature", "idx_device_timestamp", "device_id, timestamp"),
+    ("humidity", "idx_device_timestamp", "device_id, timestamp"),
+    ("light", "idx_device_timestamp", "device_id, timestamp"),
+    ("devices", "idx_user_device", "user_id, device_id"),
+    ("sessions", "idx_user_created", "user_id, created_at"),
+    ("clothes", "idx_user_clothing", "user_id, clothing_name, clothing_color, clothing_type"),
+]
+
+
+def upgrade(cursor):
+    for table, index, columns in INDEXES:
+        if not index_exists(cursor, table, index):
+            cursor.execute(f"CREATE INDEX {index} ON {table} ({columns})")
@@ -0,0 +1,58 @@
+"""Per-minute and per-hour rollups of the sensor tables.
+
+  {sensor_type}_rollup_1m, {sensor_type}_rollup_1h
+                 min/max/sum/count of value per device and bucket, kept
+                 current by app.readings.insert_readings
+  rollup_repairs hourly buckets whose rollups must be recomputed after a
+                 raw reading was edited or deleted
+
+Existing readings are folded into the new tables; re-running replaces the
+backfilled rows rather than adding to them.
+
+The tables and bucket expression are spelled out here rather than taken
+from app.readings, so later changes there do not alter this migration.
+"""
+SENSOR_TYPES = ["temperature", "humidity", "light"]
+ROLLUPS = {"1m": 60, "1h": 3600}
+
+
+def upgrade(cursor):
+    for sensor_type in SENSOR_TYPES:
+        for suffix, seconds in ROLLUPS.items():
+            table = f"{sensor_type}_rollup_{suffix}"
+            cursor.execute(f'''
+                CREATE TABLE IF NOT EXISTS {table} (
+                    device_id VARCHAR(255) NOT NULL,
+                    bucket DATETIME NOT NULL,
+                    min_value FLOAT NOT NULL,
+                    max_value FLOAT NOT NULL,
+                    sum_value DOUBLE NOT NULL,
+                    sample_count INT NOT NULL,
+                    PRIMARY KEY (device_id, bucket)
+                )
+            ''')
+            cursor.execute(f'''
+                INSERT INTO {table} (device_id, bucket, min_value, max_value, sum_value, sample_count)
+                SELECT device_id,
+                       DATE_ADD('1970-01-01', INTERVAL
+                           FLOOR(TIMESTAMPDIFF(SECOND, '1970-01-01', timestamp) / {seconds}) * {seconds} SECOND) AS b,
+                       MIN(value), MAX(value), SUM(value), COUNT(*)
+                FROM {sensor_type}
+                WHERE device_id IS NOT NULL
+                GROUP BY device_id, b
+                ON DUPLICATE KEY UPDATE
+                    min_value = VALUES(min_value),
+                    max_value = VALUES(max_value),
+                    sum_value = VALUES(sum_value),
+                    sample_count = VALUES(sample_count)
+            ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS rollup_repairs (
+            sensor_type VARCHAR(32) NOT NULL,
+            device_id VARCHAR(255) NOT NULL,
+            bucket DATETIME NOT NULL,
+            generation INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (sensor_type, device_id, bucket)
+        )
+    ''')
@@ -0,0 +1,66 @@
+"""Partition the sensor tables by month (see app.partitions).
+
+MySQL requires every unique key of a partitioned table to contain the
+partitioning column and does not allow foreign keys on one, so the primary
+key becomes (id, timestamp) and the remaining device_id foreign keys from
+0001 are dropped; ownership is checked against devices by the queries.
+
+The partition layout is written out below as it stood when this migration
+was added; app.partitions maintains it from then on.
+"""
+from datetime import date
+
+from . import foreign_keys
+
+SENSOR_TYPES = ["temperature", "humidity", "light"]
+MONTHS_AHEAD = 3
+CATCH_ALL = "pfuture"
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def is_partitioned(cursor, table: str) -> bool:
+    cursor.execute("""
+        SELECT 1 FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+        LIMIT 1
+    """, (table,))
+    return cursor.fetchone() is not None
+
+
+def partition_by_month(cursor, table: str):
+    """Repartitions a table by month, from its oldest reading to MONTHS_AHEAD from now."""
+    cursor.execute(f"SELECT MIN(timestamp) FROM {table}")
+    oldest = cursor.fetchone()[0] or date.today()
+    month = date(oldest.year, oldest.month, 1)
+    last = add_months(date.today().replace(day=1), MONTHS_AHEAD)
+    definitions = []
+    while month <= last:
+        upper = add_months(month, 1)
+        definitions.append(f"PARTITION p{month:%Y%m} VALUES LESS THAN (TO_DAYS('{upper:%Y-%m-%d}'))")
+        month = upper
+    definitions.append(f"PARTITION {CATCH_ALL} VALUES LESS THAN MAXVALUE")
+    cursor.execute(f"ALTER TABLE {table} PARTITION BY RANGE (TO_DAYS(timestamp)) ({', '.join(definitions)})")
+
+
+def primary_key(cursor, table: str) -> list:
+    cursor.execute("""
+        SELECT COLUMN_NAME FROM information_schema.KEY_COLUMN_USAGE
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND CONSTRAINT_NAME = 'PRIMARY'
+        ORDER BY ORDINAL_POSITION
+    """, (table,))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def upgrade(cursor):
+    for sensor_type in SENSOR_TYPES:
+        for constraint in foreign_keys(cursor, sensor_type, "devices"):
+            cursor.execute(f"ALTER TABLE {sensor_type} DROP FOREIGN KEY {constraint}")
+        if is_partitioned(cursor, sensor_type):
+            continue
+        if primary_key(cursor, sensor_type) != ["id", "timestamp"]:
+            cursor.execute(f"ALTER TABLE {sensor_type} DROP PRIMARY KEY, ADD PRIMARY KEY (id, timestamp)")
+        partition_by_month(cursor, sensor_type)
@@ -0,0 +1,11 @@
+"""Index temperature by (device_id, id) for /get_temp polling.
+
+The latest id per MAC (the ETag) becomes a single index lookup, and
+since_id polls read only the new tail of a device's readings.
+"""
+from . import index_exists
+
+
+def upgrade(cursor):
+    if not index_exists(cursor, "temperature", "idx_device_id"):
+        cursor.execute("CREATE INDEX idx_device_id ON temperature (device_id, id)")
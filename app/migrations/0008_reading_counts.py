@@ -0,0 +1,27 @@
+"""Per-device reading counts for /api/{sensor_type}/count.
+
+reading_counts holds the number of rows each device has in each sensor
+table, kept current by app.readings and recounted by reconcile_counts().
+Existing readings are counted here; re-running replaces the counts.
+"""
+# The sensor tables as of this migration
+SENSOR_TYPES = ["temperature", "humidity", "light"]
+
+
+def upgrade(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reading_counts (
+            sensor_type VARCHAR(32) NOT NULL,
+            device_id VARCHAR(255) NOT NULL,
+            reading_count BIGINT NOT NULL,
+            PRIMARY KEY (sensor_type, device_id)
+        )
+    ''')
+    for sensor_type in SENSOR_TYPES:
+        cursor.execute(f'''
+            INSERT INTO reading_counts (sensor_type, device_id, reading_count)
+            SELECT %s, device_id, COUNT(*) FROM {sensor_type}
+            WHERE device_id IS NOT NULL
+            GROUP BY device_id
+            ON DUPLICATE KEY UPDATE reading_count = VALUES(reading_count)
+        ''', (sensor_type,))
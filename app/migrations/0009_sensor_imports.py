@@ -0,0 +1,26 @@
+"""Progress of bulk imports through POST /api/{sensor_type}/import.
+
+One row per upload, updated after every committed chunk, so a client can
+follow a long import from another connection and see where a failed one
+stopped.
+"""
+
+
+def upgrade(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sensor_imports (
+            id VARCHAR(36) PRIMARY KEY,
+            user_id INT NOT NULL,
+            sensor_type VARCHAR(32) NOT NULL,
+            status VARCHAR(16) NOT NULL,
+            bytes_read BIGINT NOT NULL DEFAULT 0,
+            lines_read BIGINT NOT NULL DEFAULT 0,
+            inserted BIGINT NOT NULL DEFAULT 0,
+            rejected BIGINT NOT NULL DEFAULT 0,
+            error VARCHAR(255),
+            started_at DATETIME NOT NULL,
+            updated_at DATETIME NOT NULL,
+            INDEX idx_sensor_imports_user_started (user_id, started_at),
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )
+    ''')
@@ -0,0 +1,38 @@
+"""Archive horizons move from the archiving host's disk into the database.
+
+archive_horizons holds, per sensor type, the first day that is not in the
+Parquet archive (see app.archive), so every app host splits its queries at
+the same point. The HORIZON files earlier versions wrote under ARCHIVE_DIR
+are carried over; run this migration where ARCHIVE_DIR is mounted.
+"""
+import os
+from datetime import date, datetime
+
+SENSOR_TYPES = ["temperature", "humidity", "light"]
+
+
+def file_horizons() -> list:
+    """Returns (sensor_type, horizon) of every HORIZON file left under ARCHIVE_DIR."""
+    horizons = []
+    for sensor_type in SENSOR_TYPES:
+        path = os.path.join(os.getenv("ARCHIVE_DIR", "archive"), sensor_type, "HORIZON")
+        try:
+            with open(path) as f:
+                horizon = date.fromisoformat(f.read().strip())
+        except FileNotFoundError:
+            continue
+        horizons.append((sensor_type, datetime.combine(horizon, datetime.min.time())))
+    return horizons
+
+
+def upgrade(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS archive_horizons (
+            sensor_type VARCHAR(32) PRIMARY KEY,
+            horizon DATETIME NOT NULL
+        )
+    ''')
+    for sensor_type, horizon in file_horizons():
+        cursor.execute(
+            "INSERT IGNORE INTO archive_horizons (sensor_type, horizon) VALUES (%s, %s)", (sensor_type, horizon),
+        )
@@ -0,0 +1,119 @@
+"""Versioned schema migrations.
+
+Every module in this package named NNNN_description.py defines
+upgrade(cursor). Pending migrations are applied in filename order and
+recorded in the schema_migrations table, so each one runs once per
+database. MySQL commits DDL implicitly, so migrations are written to be
+safe to re-run if one fails part way.
+
+Apply them with `python -m app.migrations`; the app also applies them at
+startup unless MIGRATE_ON_STARTUP=0. The embedded SQLite backend gets its
+schema from sqlite_schema instead.
+"""
+import importlib
+import pkgutil
+import re
+
+from ..database import DB_BACKEND, db_connection
+
+MIGRATION_NAME = re.compile(r"^\d{4}_\w+$")
+# Held while migrating so that several workers starting at once do not race
+LOCK_NAME = "schema_migrations"
+LOCK_TIMEOUT = 60
+
+
+def discover() -> list:
+    """Returns migration module names in the order they must run."""
+    return sorted(
+        module.name for module in pkgutil.iter_modules(__path__)
+        if MIGRATION_NAME.match(module.name)
+    )
+
+
+def column_names(cursor, table: str) -> set:
+    cursor.execute("""
+        SELECT COLUMN_NAME FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+    """, (table,))
+    return {row[0] for row in cursor.fetchall()}
+
+
+def index_exists(cursor, table: str, index: str) -> bool:
+    cursor.execute("""
+        SELECT 1 FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+        LIMIT 1
+    """, (table, index))
+    return cursor.fetchone() is not None
+
+
+def foreign_keys(cursor, table: str, referenced_table: str) -> list:
+    cursor.execute("""
+        SELECT DISTINCT CONSTRAINT_NAME FROM information_schema.KEY_COLUMN_USAGE
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND REFERENCED_TABLE_NAME = %s
+    """, (table, referenced_table))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def _apply_sqlite_schema() -> list:
+    from . import sqlite_schema
+
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            # The first write opens an immediate transaction, which keeps
+            # other workers out until this one has committed
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version VARCHAR(255) PRIMARY KEY,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            cursor.execute("SELECT version FROM schema_migrations")
+            done = {row[0] for row in cursor.fetchall()}
+            pending = [name for name in discover() if name not in done]
+            if pending:
+                sqlite_schema.upgrade(cursor)
+                cursor.executemany("INSERT INTO schema_migrations (version) VALUES (%s)", [(name,) for name in pending])
+            conn.commit()
+            return pending
+        finally:
+            cursor.close()
+
+
+def apply_migrations() -> list:
+    """Applies pending migrations and returns the names of those applied."""
+    if DB_BACKEND == "sqlite":
+        return _apply_sqlite_schema()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT GET_LOCK(%s, %s)", (LOCK_NAME, LOCK_TIMEOUT))
+            if cursor.fetchone()[0] != 1:
+                raise RuntimeError("Timed out waiting for the schema migration lock")
+            try:
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS schema_migrations (
+                        version VARCHAR(255) PRIMARY KEY,
+                        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+                cursor.execute("SELECT version FROM schema_migrations")
+                done = {row[0] for row in cursor.fetchall()}
+
+                applied = []
+                for name in discover():
+                    if name in done:
+                        continue
+                    print(f"Applying migration {name}")
+                    module = importlib.import_module(f"{__name__}.{name}")
+                    module.upgrade(cursor)
+                    cursor.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (name,))
+                    conn.commit()
+                    applied.append(name)
+                return applied
+            finally:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+                cursor.fetchone()
+        finally:
+            cursor.close()
@@ -0,0 +1,8 @@
+from . import apply_migrations
+
+if __name__ == "__main__":
+    applied = apply_migrations()
+    if applied:
+        print(f"Applied {len(applied)} migration(s): {', '.join(applied)}")
+    else:
+        print("Database schema is up to date")
@@ -0,0 +1,158 @@
+"""The schema of the embedded SQLite backend (DB_BACKEND=sqlite).
+
+The numbered migrations are written for MySQL. An embedded database is
+instead created at the state they leave behind, in one step, and they are
+all recorded as applied. A new migration has to update this file too, with
+statements that also bring an existing embedded database up to date.
+
+Differences from MySQL: ids are AUTOINCREMENT so they are never reused, the
+sensor tables are not partitioned, and DATETIME columns hold local-time text
+that app.sqlite_backend converts to and from datetime.
+"""
+import os
+from datetime import date, datetime
+
+from ..readings import SENSOR_TYPES, ROLLUPS, rollup_table
+
+LOCAL_NOW = "(datetime('now', 'localtime'))"
+
+
+def upgrade(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name VARCHAR(255) NOT NULL,
+            email VARCHAR(255) UNIQUE NOT NULL,
+            hashed_password VARCHAR(255) NOT NULL,
+            PID VARCHAR(10) NOT NULL,
+            location VARCHAR(255)
+        )
+    ''')
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS sessions (
+            id VARCHAR(36) PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+            created_at TIMESTAMP DEFAULT {LOCAL_NOW}
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS revoked_sessions (
+            jti VARCHAR(32) PRIMARY KEY,
+            expires_at DATETIME NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS devices (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL REFERENCES users (id),
+            device_id VARCHAR(255) UNIQUE NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS wardrobe (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL REFERENCES users (id),
+            item_name VARCHAR(255) NOT NULL,
+            item_type VARCHAR(255) NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS clothes (
+            clothing_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL REFERENCES users (id),
+            clothing_name VARCHAR(255) NOT NULL,
+            clothing_color CHAR(7) NOT NULL,
+            clothing_type VARCHAR(10) NOT NULL
+        )
+    ''')
+
+    # No foreign key to devices: the bridge stores readings of unregistered boards
+    for sensor_type in SENSOR_TYPES:
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {sensor_type} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                value FLOAT NOT NULL,
+                unit VARCHAR(50) NOT NULL,
+                timestamp DATETIME NOT NULL DEFAULT {LOCAL_NOW},
+                device_id VARCHAR(255)
+            )
+        ''')
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{sensor_type}_device_timestamp ON {sensor_type} (device_id, timestamp)")
+        for suffix in ROLLUPS:
+            cursor.execute(f'''
+                CREATE TABLE IF NOT EXISTS {rollup_table(sensor_type, suffix)} (
+                    device_id VARCHAR(255) NOT NULL,
+                    bucket DATETIME NOT NULL,
+                    min_value FLOAT NOT NULL,
+                    max_value FLOAT NOT NULL,
+                    sum_value DOUBLE NOT NULL,
+                    sample_count INT NOT NULL,
+                    PRIMARY KEY (device_id, bucket)
+                )
+            ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_temperature_device_id ON temperature (device_id, id)")
+
+    # SQLite index names are per database rather than per table
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_devices_user_device ON devices (user_id, device_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessions_user_created ON sessions (user_id, created_at)")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_clothes_user_clothing "
+        "ON clothes (user_id, clothing_name, clothing_color, clothing_type)"
+    )
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS rollup_repairs (
+            sensor_type VARCHAR(32) NOT NULL,
+            device_id VARCHAR(255) NOT NULL,
+            bucket DATETIME NOT NULL,
+            generation INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (sensor_type, device_id, bucket)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reading_counts (
+            sensor_type VARCHAR(32) NOT NULL,
+            device_id VARCHAR(255) NOT NULL,
+            reading_count BIGINT NOT NULL,
+            PRIMARY KEY (sensor_type, device_id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sensor_imports (
+            id VARCHAR(36) PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+            sensor_type VARCHAR(32) NOT NULL,
+            status VARCHAR(16) NOT NULL,
+            bytes_read BIGINT NOT NULL DEFAULT 0,
+            lines_read BIGINT NOT NULL DEFAULT 0,
+            inserted BIGINT NOT NULL DEFAULT 0,
+            rejected BIGINT NOT NULL DEFAULT 0,
+            error VARCHAR(255),
+            started_at DATETIME NOT NULL,
+            updated_at DATETIME NOT NULL
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sensor_imports_user_started ON sensor_imports (user_id, started_at)")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS archive_horizons (
+            sensor_type VARCHAR(32) PRIMARY KEY,
+            horizon DATETIME NOT NULL
+        )
+    ''')
+    # 0010 carries over the HORIZON files earlier versions kept under ARCHIVE_DIR
+    for sensor_type in SENSOR_TYPES:
+        path = os.path.join(os.getenv("ARCHIVE_DIR", "archive"), sensor_type, "HORIZON")
+        if os.path.exists(path):
+            with open(path) as f:
+                horizon = datetime.combine(date.fromisoformat(f.read().strip()), datetime.min.time())
+            cursor.execute(
+                "INSERT IGNORE INTO archive_horizons (sensor_type, horizon) VALUES (%s, %s)", (sensor_type, horizon),
+            )
+
+    # 0003_seed_test_user
+    cursor.execute("SELECT COUNT(*) FROM users")
+    if cursor.fetchone()[0] == 0:
+        cursor.execute('''
+            INSERT INTO users (name, email, hashed_password, location, PID)
+            VALUES (%s, %s, %s, %s, %s)
+        ''', ("Test User", "test@example.com", "test123", "Test Location", "A12345678"))
@@ -0,0 +1,207 @@
+"""Monthly partitions and retention for the sensor tables.
+
+Each sensor table is RANGE partitioned on TO_DAYS(timestamp), one
+partition per calendar month plus a MAXVALUE catch-all (pfuture), so date
+range filters only read the months they touch. A maintenance pass, run in
+the background by every worker but only by the one holding a named lock
+(a lock file on the embedded backend) while the others skip it:
+
+  - splits upcoming months out of pfuture, PARTITION_MONTHS_AHEAD ahead
+  - when SENSOR_RETENTION_DAYS is set, drops months that lie entirely before
+    the cutoff, then deletes the remaining expired rows in small primary-key
+    chunks with a pause in between (this is also the only purge a table
+    that is not partitioned gets)
+
+Rollup tables are left alone, so summaries outlive the raw readings;
+reading_counts is recounted for any table that lost rows.
+
+Run a single pass with `python -m app.partitions`.
+"""
+import os
+import asyncio
+from datetime import date, datetime, timedelta
+
+from .database import DB_BACKEND, fetchall, execute, named_lock, transaction
+from .readings import SENSOR_TYPES, reconcile_counts
+
+# Partition and retention settings
+#   PARTITION_MONTHS_AHEAD          empty monthly partitions kept ready
+#   SENSOR_RETENTION_DAYS           age at which readings are purged; 0 keeps
+#                                   them forever
+#   RETENTION_CHUNK_ROWS            rows removed per DELETE when purging row by row
+#   RETENTION_CHUNK_PAUSE_MS        pause between those DELETEs
+#   PARTITION_MAINTENANCE_INTERVAL  seconds between maintenance passes
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+SENSOR_RETENTION_DAYS = int(os.getenv("SENSOR_RETENTION_DAYS", "0"))
+RETENTION_CHUNK_ROWS = int(os.getenv("RETENTION_CHUNK_ROWS", "1000"))
+RETENTION_CHUNK_PAUSE_MS = int(os.getenv("RETENTION_CHUNK_PAUSE_MS", "100"))
+PARTITION_MAINTENANCE_INTERVAL = float(os.getenv("PARTITION_MAINTENANCE_INTERVAL", "3600"))
+
+CATCH_ALL = "pfuture"
+LOCK_NAME = "partition_maintenance"
+
+
+def month_start(day) -> date:
+    return date(day.year, day.month, 1)
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def next_month(month: date) -> date:
+    return add_months(month, 1)
+
+
+def months_between(first: date, last: date) -> list:
+    """Returns the first day of every month from first to last, inclusive."""
+    months = []
+    month = month_start(first)
+    while month <= last:
+        months.append(month)
+        month = next_month(month)
+    return months
+
+
+def partition_name(month: date) -> str:
+    return f"p{month:%Y%m}"
+
+
+def partition_definition(month: date) -> str:
+    return f"PARTITION {partition_name(month)} VALUES LESS THAN (TO_DAYS('{next_month(month):%Y-%m-%d}'))"
+
+
+def monthly_partitions(cursor, table: str) -> list:
+    """Returns the first day of each monthly partition of a table, oldest first."""
+    cursor.execute("""
+        SELECT PARTITION_NAME FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+    """, (table,))
+    return [
+        datetime.strptime(name, "p%Y%m").date()
+        for (name,) in cursor.fetchall()
+        if name != CATCH_ALL
+    ]
+
+
+def is_partitioned(cursor, table: str) -> bool:
+    cursor.execute("""
+        SELECT 1 FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+        LIMIT 1
+    """, (table,))
+    return cursor.fetchone() is not None
+
+
+def partition_by_month(cursor, table: str, months_ahead: int):
+    """Repartitions a table by month, from its oldest reading to months_ahead from now."""
+    cursor.execute(f"SELECT MIN(timestamp) FROM {table}")
+    oldest = cursor.fetchone()[0] or date.today()
+    last = add_months(month_start(date.today()), months_ahead)
+    definitions = [partition_definition(month) for month in months_between(oldest, last)]
+    definitions.append(f"PARTITION {CATCH_ALL} VALUES LESS THAN MAXVALUE")
+    cursor.execute(f"ALTER TABLE {table} PARTITION BY RANGE (TO_DAYS(timestamp)) ({', '.join(definitions)})")
+
+
+def add_upcoming_partitions(cursor, table: str, through: date) -> list:
+    """Splits the months up to and including through out of the catch-all partition."""
+    existing = monthly_partitions(cursor, table)
+    start = next_month(existing[-1]) if existing else month_start(date.today())
+    months = months_between(start, through)
+    if months:
+        definitions = [partition_definition(month) for month in months]
+        definitions.append(f"PARTITION {CATCH_ALL} VALUES LESS THAN MAXVALUE")
+        cursor.execute(f"ALTER TABLE {table} REORGANIZE PARTITION {CATCH_ALL} INTO ({', '.join(definitions)})")
+    return [partition_name(month) for month in months]
+
+
+def drop_expired_partitions(cursor, table: str, cutoff: datetime) -> list:
+    """Drops the monthly partitions holding only readings older than cutoff."""
+    expired = [
+        partition_name(month) for month in monthly_partitions(cursor, table)
+        if next_month(month) <= cutoff.date()
+    ]
+    if expired:
+        cursor.execute(f"ALTER TABLE {table} DROP PARTITION {', '.join(expired)}")
+    return expired
+
+
+def _rotate_partitions(cursor, cutoff):
+    through = add_months(month_start(date.today()), PARTITION_MONTHS_AHEAD)
+    changes = {}
+    for table in SENSOR_TYPES:
+        if not is_partitioned(cursor, table):
+            continue
+        changes[table] = {"added": add_upcoming_partitions(cursor, table, through)}
+        if cutoff is not None:
+            changes[table]["dropped"] = drop_expired_partitions(cursor, table, cutoff)
+    return changes
+
+
+async def purge_expired_rows(table: str, cutoff: datetime) -> int:
+    """Deletes readings older than cutoff a chunk at a time; returns how many went.
+
+    Walks each device's range of the (device_id, timestamp) index, so
+    neither the chunks nor the final check that nothing is left scan the
+    table. Devices are those in reading_counts, plus readings without one.
+    """
+    devices = await fetchall("SELECT device_id FROM reading_counts WHERE sensor_type = %s", (table,))
+    deleted = 0
+    for device_id in [None] + [device_id for (device_id,) in devices]:
+        if device_id is None:
+            condition, params = "device_id IS NULL", []
+        else:
+            condition, params = "device_id = %s", [device_id]
+        while True:
+            rows = await fetchall(
+                f"SELECT id FROM {table} WHERE {condition} AND timestamp < %s ORDER BY timestamp LIMIT %s",
+                params + [cutoff, RETENTION_CHUNK_ROWS],
+            )
+            if not rows:
+                break
+            placeholders = ", ".join(["%s"] * len(rows))
+            result = await execute(
+                f"DELETE FROM {table} WHERE id IN ({placeholders}) AND timestamp < %s",
+                [row[0] for row in rows] + [cutoff],
+            )
+            deleted += result.rowcount
+            await asyncio.sleep(RETENTION_CHUNK_PAUSE_MS / 1000)
+    return deleted
+
+
+async def maintain_sensor_tables() -> dict:
+    """Runs one maintenance pass and reports what it changed per table."""
+    cutoff = None
+    if SENSOR_RETENTION_DAYS > 0:
+        cutoff = datetime.now() - timedelta(days=SENSOR_RETENTION_DAYS)
+    async with named_lock(LOCK_NAME) as locked:
+        if not locked:
+            # Another worker is already on it
+            return {}
+        # The embedded backend has no partitions; retention purges row by row there
+        changes = await transaction(_rotate_partitions, cutoff) if DB_BACKEND == "mysql" else {}
+        if cutoff is not None:
+            for table in SENSOR_TYPES:
+                change = changes.setdefault(table, {})
+                change["purged_rows"] = await purge_expired_rows(table, cutoff)
+                if change["purged_rows"] or change.get("dropped"):
+                    # Retention bypasses app.readings, so recount what it removed
+                    await reconcile_counts([table])
+        return changes
+
+
+async def partition_maintenance_loop():
+    """Background task running a maintenance pass every PARTITION_MAINTENANCE_INTERVAL seconds."""
+    while True:
+        try:
+            await maintain_sensor_tables()
+        except Exception as e:
+            print(f"Partition maintenance failed: {e}")
+        await asyncio.sleep(PARTITION_MAINTENANCE_INTERVAL)
+
+
+if __name__ == "__main__":
+    for table, change in asyncio.run(maintain_sensor_tables()).items():
+        print(f"{table}: {change}")
@@ -0,0 +1,90 @@
+import os
+import asyncio
+from collections import defaultdict
+
+# Live stream settings
+#   STREAM_QUEUE_SIZE  messages buffered per subscriber; one that falls this
+#                      far behind is disconnected rather than slowing others
+#   STREAM_KEEPALIVE   seconds of silence before a keep-alive comment is sent
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "100"))
+STREAM_KEEPALIVE = float(os.getenv("STREAM_KEEPALIVE", "15"))
+
+
+class Subscription:
+    """A subscriber's bounded queue of messages for one topic."""
+
+    def __init__(self, broker, topic, max_queue: int):
+        self.topic = topic
+        self.evicted = False
+        self._broker = broker
+        self._queue = asyncio.Queue(max_queue)
+
+    def _deliver(self, message) -> bool:
+        try:
+            self._queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def _evict(self):
+        # Drop the backlog and leave a single None to end the subscriber's loop
+        self.evicted = True
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._queue.put_nowait(None)
+
+    async def get(self):
+        """Returns the next message, or None once the subscription was evicted."""
+        return await self._queue.get()
+
+    def close(self):
+        self._broker.unsubscribe(self)
+
+
+class Broker:
+    """In-process fan-out of messages to the subscribers of a topic.
+
+    Only subscribers in the worker that published see a message; each
+    worker runs its own broker. Streams are therefore a fast path, not a
+    complete feed: clients catch up through /get_temp?since_id= as well.
+    """
+
+    def __init__(self, max_queue: int):
+        self._max_queue = max_queue
+        self._topics = defaultdict(set)
+        self._stats = {"published": 0, "delivered": 0, "evicted": 0}
+
+    def subscribe(self, topic) -> Subscription:
+        subscription = Subscription(self, topic, self._max_queue)
+        self._topics[topic].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._topics.get(subscription.topic)
+        if subscribers is None:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._topics[subscription.topic]
+
+    def publish(self, topic, message):
+        """Queues a message for every subscriber; ones with a full queue are evicted."""
+        self._stats["published"] += 1
+        for subscription in list(self._topics.get(topic, ())):
+            if subscription._deliver(message):
+                self._stats["delivered"] += 1
+            else:
+                subscription._evict()
+                self.unsubscribe(subscription)
+                self._stats["evicted"] += 1
+
+    def stats(self) -> dict:
+        return {
+            "topics": len(self._topics),
+            "subscribers": sum(len(subscribers) for subscribers in self._topics.values()),
+            "max_queue": self._max_queue,
+            **self._stats,
+        }
+
+
+readings_broker = Broker(STREAM_QUEUE_SIZE)
@@ -0,0 +1,133 @@
+"""SQL behind the hot read endpoints.
+
+The handlers in app.main take their queries from here, and
+tests/test_query_plans.py runs EXPLAIN on the very same strings, so a query
+that stops using its index fails the tests instead of slowing a dashboard.
+Builders return (sql, params).
+"""
+from .readings import bucket_sql, rollup_table
+
+OWNED_DEVICE = "SELECT device_id FROM devices WHERE user_id = %s AND device_id = %s"
+
+USER_DEVICES = "SELECT device_id FROM devices WHERE user_id = %s"
+
+USER_SESSION = "SELECT id FROM sessions WHERE user_id = %s"
+
+USER_CLOTHES = "SELECT * FROM clothes WHERE user_id = %s"
+
+DELETE_CLOTHING = """
+    DELETE FROM clothes
+    WHERE user_id = %s
+      AND clothing_name = %s
+      AND clothing_color = %s
+      AND clothing_type = %s
+"""
+
+# Summed from the per-device counters kept by app.readings
+SENSOR_COUNT = """
+    SELECT CAST(COALESCE(SUM(c.reading_count), 0) AS SIGNED) FROM reading_counts c
+    JOIN devices d ON c.device_id = d.device_id
+    WHERE d.user_id = %s AND c.sensor_type = %s
+"""
+
+TEMPERATURE_SINCE = """
+    SELECT id, value AS temperature, unit, device_id AS mac_address, timestamp
+    FROM temperature
+    WHERE device_id = %s AND id > %s AND id <= %s
+    ORDER BY id
+"""
+
+
+def sensor_rows(sensor_type, user_id, horizon, start, end, order_by, after_id, after_at, limit, paginated):
+    """The live rows of a GET /api/{sensor_type} request; rows before horizon are archived.
+
+    start, end and after_at are datetimes (or None).
+    """
+    query = f"""
+        SELECT s.* FROM {sensor_type} s
+        JOIN devices d ON s.device_id = d.device_id
+        WHERE d.user_id = %s
+    """
+    params = [user_id]
+
+    if horizon is not None:
+        query += " AND s.timestamp >= %s"
+        params.append(horizon)
+
+    if start is not None:
+        query += " AND s.timestamp >= %s"
+        params.append(start)
+
+    if end is not None:
+        query += " AND s.timestamp <= %s"
+        params.append(end)
+
+    # Keyset pagination: continue strictly after the last row of the previous page
+    if after_at is not None:
+        query += " AND (s.timestamp > %s OR (s.timestamp = %s AND s.id > %s))"
+        params.extend([after_at, after_at, after_id])
+    elif after_id is not None:
+        query += " AND s.id > %s"
+        params.append(after_id)
+
+    if paginated:
+        query += " ORDER BY s.timestamp ASC, s.id ASC" if order_by == "timestamp" else " ORDER BY s.id ASC"
+    elif order_by in ["value", "timestamp"]:
+        query += f" ORDER BY s.{order_by} ASC"
+
+    if limit is not None:
+        query += " LIMIT %s"
+        params.append(limit)
+    return query, params
+
+
+def rollup_aggregate(sensor_type, source, seconds, user_id, since, until):
+    """[min, max, sum, count] per device and bucket, from the rollup buckets in [since, until)."""
+    query = f"""
+        SELECT r.device_id, {bucket_sql("r.bucket", seconds)} AS bucket,
+               MIN(r.min_value), MAX(r.max_value), SUM(r.sum_value), SUM(r.sample_count)
+        FROM {rollup_table(sensor_type, source)} r
+        JOIN devices d ON r.device_id = d.device_id
+        WHERE d.user_id = %s
+    """
+    params = [user_id]
+    if since is not None:
+        query += " AND r.bucket >= %s"
+        params.append(since)
+    if until is not None:
+        query += " AND r.bucket < %s"
+        params.append(until)
+    query += " GROUP BY r.device_id, bucket"
+    return query, params
+
+
+def raw_aggregate(sensor_type, seconds, user_id, since, until, horizon):
+    """[min, max, sum, count] per device and bucket, from the live readings in [since, until)."""
+    query = f"""
+        SELECT s.device_id, {bucket_sql("s.timestamp", seconds)} AS bucket,
+               MIN(s.value), MAX(s.value), SUM(s.value), COUNT(*)
+        FROM {sensor_type} s
+        JOIN devices d ON s.device_id = d.device_id
+        WHERE d.user_id = %s AND s.timestamp >= %s AND s.timestamp < %s
+    """
+    params = [user_id, since, until]
+    if horizon is not None:
+        query += " AND s.timestamp >= %s"
+        params.append(horizon)
+    query += " GROUP BY s.device_id, bucket"
+    return query, params
+
+
+def device_rows(sensor_type, device_id, horizon, start, end):
+    """A device's live readings from start to end, in (device_id, timestamp) index order."""
+    query = f"SELECT * FROM {sensor_type} WHERE device_id = %s"
+    params = [device_id]
+    for bound in (horizon, start):
+        if bound is not None:
+            query += " AND timestamp >= %s"
+            params.append(bound)
+    if end is not None:
+        query += " AND timestamp <= %s"
+        params.append(end)
+    query += " ORDER BY timestamp, id"
+    return query, params
@@ -0,0 +1,340 @@
+import os
+import asyncio
+from datetime import datetime, timedelta
+
+from .database import DB_BACKEND, fetchall, transaction, run_transaction
+from .pubsub import readings_broker
+from .streaming import TIMESTAMP_FORMAT
+
+SENSOR_TYPES = ["temperature", "humidity", "light"]
+
+# Rollup tables kept per sensor type, named {sensor_type}_rollup_{suffix},
+# mapped to the width of their buckets in seconds
+ROLLUPS = {"1m": 60, "1h": 3600}
+
+# Seconds between passes of the background job that recomputes rollup
+# buckets invalidated by edits to raw readings
+ROLLUP_REPAIR_INTERVAL = float(os.getenv("ROLLUP_REPAIR_INTERVAL", "10"))
+
+# Seconds between recounts of every device's readings, which correct any
+# drift in reading_counts (e.g. after retention dropped a partition)
+COUNT_RECONCILE_INTERVAL = float(os.getenv("COUNT_RECONCILE_INTERVAL", "3600"))
+
+# Buckets are counted from this naive DATETIME, the same origin the SQL
+# bucket expressions use, so Python and MySQL agree on bucket boundaries.
+EPOCH = datetime(1970, 1, 1)
+REPAIR_WIDTH = ROLLUPS["1h"]
+
+
+def rollup_table(sensor_type: str, suffix: str) -> str:
+    return f"{sensor_type}_rollup_{suffix}"
+
+
+def bucket_sql(column: str, seconds: int) -> str:
+    """SQL expression flooring a DATETIME column to a bucket of the given width."""
+    if DB_BACKEND == "sqlite":
+        # julianday() counts naive times as UTC, so this is seconds since EPOCH
+        seconds_since = f"CAST(ROUND((julianday({column}) - 2440587.5) * 86400) AS INTEGER)"
+        return f"datetime({seconds_since} / {int(seconds)} * {int(seconds)}, 'unixepoch')"
+    return (
+        f"DATE_ADD('1970-01-01', INTERVAL "
+        f"FLOOR(TIMESTAMPDIFF(SECOND, '1970-01-01', {column}) / {int(seconds)}) * {int(seconds)} SECOND)"
+    )
+
+
+def bucket_start(timestamp: datetime, seconds: int) -> datetime:
+    elapsed = int((timestamp - EPOCH).total_seconds())
+    return EPOCH + timedelta(seconds=elapsed - elapsed % seconds)
+
+
+def parse_timestamp(value) -> datetime:
+    """Parses a reading's timestamp to the whole second stored in the DATETIME column.
+
+    Raises ValueError for text that is not an ISO 8601 date or date-time.
+    """
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value))
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value.replace(microsecond=0)
+
+
+def _rollup_rows(rows, seconds):
+    """Collapses (value, unit, timestamp, device_id) rows into one row per device and bucket.
+
+    Sorted by key, so concurrent batches lock rollup rows in the same order.
+    """
+    buckets = {}
+    for value, _unit, timestamp, device_id in rows:
+        key = (device_id, bucket_start(timestamp, seconds))
+        bucket = buckets.get(key)
+        if bucket is None:
+            buckets[key] = [value, value, value, 1]
+        else:
+            bucket[0] = min(bucket[0], value)
+            bucket[1] = max(bucket[1], value)
+            bucket[2] += value
+            bucket[3] += 1
+    return [(device_id, start, *totals) for (device_id, start), totals in sorted(buckets.items())]
+
+
+def _insert_readings(cursor, sensor_type, rows):
+    cursor.executemany(f"""
+        INSERT INTO {sensor_type} (value, unit, timestamp, device_id)
+        VALUES (%s, %s, %s, %s)
+    """, rows)
+    first_id = cursor.lastrowid
+    for suffix, seconds in ROLLUPS.items():
+        cursor.executemany(f"""
+            INSERT INTO {rollup_table(sensor_type, suffix)}
+                (device_id, bucket, min_value, max_value, sum_value, sample_count)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                min_value = LEAST(min_value, VALUES(min_value)),
+                max_value = GREATEST(max_value, VALUES(max_value)),
+                sum_value = sum_value + VALUES(sum_value),
+                sample_count = sample_count + VALUES(sample_count)
+        """, _rollup_rows(rows, seconds))
+    counts = {}
+    for _value, _unit, _timestamp, device_id in rows:
+        counts[device_id] = counts.get(device_id, 0) + 1
+    _add_counts(cursor, sensor_type, counts)
+    return first_id
+
+
+def _add_counts(cursor, sensor_type, counts):
+    """Adds per-device deltas to reading_counts."""
+    cursor.executemany("""
+        INSERT INTO reading_counts (sensor_type, device_id, reading_count)
+        VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE reading_count = reading_count + VALUES(reading_count)
+    """, [(sensor_type, device_id, count) for device_id, count in sorted(counts.items())])
+
+
+async def insert_readings(sensor_type: str, rows) -> int:
+    """Inserts (value, unit, timestamp, device_id) rows and folds them into the rollups.
+
+    The raw rows and the rollup updates commit together, after which the
+    readings are published to live subscribers. Returns the id of the first
+    inserted row.
+    """
+    rows = _normalize(rows)
+    first_id = await transaction(_insert_readings, sensor_type, rows)
+    publish_readings(sensor_type, rows, first_id)
+    return first_id
+
+
+def write_readings(sensor_type: str, rows) -> int:
+    """Blocking form of insert_readings for processes without an event loop.
+
+    Readings written this way are not published, since live subscribers
+    live in the web workers.
+    """
+    return run_transaction(_insert_readings, sensor_type, _normalize(rows))
+
+
+def _normalize(rows):
+    return [
+        (float(value), unit, parse_timestamp(timestamp), device_id)
+        for value, unit, timestamp, device_id in rows
+    ]
+
+
+def publish_readings(sensor_type: str, rows, first_id: int):
+    """Pushes committed readings to live subscribers of their device.
+
+    A multi-row INSERT allocates consecutive auto-increment ids, so the
+    row ids follow from the first one.
+    """
+    for offset, (value, unit, timestamp, device_id) in enumerate(rows):
+        readings_broker.publish((sensor_type, device_id), {
+            "id": first_id + offset,
+            "value": value,
+            "unit": unit,
+            "timestamp": timestamp.strftime(TIMESTAMP_FORMAT),
+            "device_id": device_id,
+        })
+
+
+def mark_dirty(cursor, sensor_type: str, device_id: str, timestamps):
+    """Queues the rollup buckets covering these timestamps for recomputation.
+
+    Must run in the same transaction as the edit to the raw rows. Bumping
+    generation on an already queued bucket tells a repair that is running
+    concurrently that it has to go round again.
+    """
+    starts = {bucket_start(parse_timestamp(ts), REPAIR_WIDTH) for ts in timestamps}
+    cursor.executemany("""
+        INSERT INTO rollup_repairs (sensor_type, device_id, bucket)
+        VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE generation = generation + 1
+    """, [(sensor_type, device_id, start) for start in sorted(starts)])
+
+
+def _locate_reading(cursor, sensor_type, reading_id, user_id):
+    cursor.execute(f"""
+        SELECT s.device_id, s.timestamp FROM {sensor_type} s
+        JOIN devices d ON s.device_id = d.device_id
+        WHERE s.id = %s AND d.user_id = %s
+        FOR UPDATE
+    """, (reading_id, user_id))
+    return cursor.fetchone()
+
+
+def _update_reading(cursor, sensor_type, reading_id, user_id, changes):
+    row = _locate_reading(cursor, sensor_type, reading_id, user_id)
+    if row is None:
+        return False
+    device_id, old_timestamp = row
+    assignments = ", ".join(f"{column} = %s" for column in changes)
+    cursor.execute(
+        f"UPDATE {sensor_type} SET {assignments} WHERE id = %s",
+        [*changes.values(), reading_id],
+    )
+    mark_dirty(cursor, sensor_type, device_id, [old_timestamp, changes.get("timestamp", old_timestamp)])
+    return True
+
+
+def _delete_reading(cursor, sensor_type, reading_id, user_id):
+    row = _locate_reading(cursor, sensor_type, reading_id, user_id)
+    if row is None:
+        return False
+    device_id, timestamp = row
+    cursor.execute(f"DELETE FROM {sensor_type} WHERE id = %s", (reading_id,))
+    mark_dirty(cursor, sensor_type, device_id, [timestamp])
+    _add_counts(cursor, sensor_type, {device_id: -1})
+    return True
+
+
+async def update_reading(sensor_type: str, reading_id: int, user_id: int, changes: dict) -> bool:
+    """Applies column changes to one of the user's readings and queues its rollups for repair.
+
+    Returns False when the reading does not exist or belongs to another user.
+    """
+    if "timestamp" in changes:
+        changes = {**changes, "timestamp": parse_timestamp(changes["timestamp"])}
+    return await transaction(_update_reading, sensor_type, reading_id, user_id, changes)
+
+
+async def delete_reading(sensor_type: str, reading_id: int, user_id: int) -> bool:
+    """Deletes one of the user's readings, queues its rollups for repair and updates its count."""
+    return await transaction(_delete_reading, sensor_type, reading_id, user_id)
+
+
+def _repair_bucket(cursor, sensor_type, device_id, start, generation):
+    from .archive import horizon_from
+
+    end = start + timedelta(seconds=REPAIR_WIDTH)
+    horizon = horizon_from(cursor, sensor_type)
+    if horizon is not None and start < horizon:
+        # The bucket's raw rows are archived; recounting the table would drop them
+        _dequeue_repair(cursor, sensor_type, device_id, start, generation)
+        return
+    # Lock the rollup rows (and the gaps between them) first: an ingest that
+    # has already updated them is waited for, and one that has not yet will
+    # wait for us and apply its delta on top of the recomputed totals.
+    for suffix in ROLLUPS:
+        cursor.execute(f"""
+            SELECT bucket FROM {rollup_table(sensor_type, suffix)}
+            WHERE device_id = %s AND bucket >= %s AND bucket < %s
+            FOR UPDATE
+        """, (device_id, start, end))
+        cursor.fetchall()
+    for suffix, seconds in ROLLUPS.items():
+        table = rollup_table(sensor_type, suffix)
+        cursor.execute(f"""
+            SELECT device_id, {bucket_sql("timestamp", seconds)} AS bucket,
+                   MIN(value), MAX(value), SUM(value), COUNT(*)
+            FROM {sensor_type}
+            WHERE device_id = %s AND timestamp >= %s AND timestamp < %s
+            GROUP BY device_id, bucket
+        """, (device_id, start, end))
+        totals = cursor.fetchall()
+        cursor.execute(
+            f"DELETE FROM {table} WHERE device_id = %s AND bucket >= %s AND bucket < %s",
+            (device_id, start, end),
+        )
+        if totals:
+            cursor.executemany(f"""
+                INSERT INTO {table} (device_id, bucket, min_value, max_value, sum_value, sample_count)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            """, totals)
+    _dequeue_repair(cursor, sensor_type, device_id, start, generation)
+
+
+def _dequeue_repair(cursor, sensor_type, device_id, start, generation):
+    cursor.execute("""
+        DELETE FROM rollup_repairs
+        WHERE sensor_type = %s AND device_id = %s AND bucket = %s AND generation = %s
+    """, (sensor_type, device_id, start, generation))
+
+
+async def repair_rollups(limit: int = 100) -> int:
+    """Recomputes queued rollup buckets from the raw rows; returns how many were repaired."""
+    queued = await fetchall(
+        "SELECT sensor_type, device_id, bucket, generation FROM rollup_repairs ORDER BY bucket LIMIT %s",
+        (limit,),
+    )
+    for sensor_type, device_id, start, generation in queued:
+        if sensor_type in SENSOR_TYPES:
+            await transaction(_repair_bucket, sensor_type, device_id, start, generation)
+    return len(queued)
+
+
+async def rollup_repair_loop():
+    """Background task draining the repair queue every ROLLUP_REPAIR_INTERVAL seconds."""
+    while True:
+        try:
+            await repair_rollups()
+        except Exception as e:
+            print(f"Rollup repair failed: {e}")
+        await asyncio.sleep(ROLLUP_REPAIR_INTERVAL)
+
+
+def _reconcile_count(cursor, sensor_type, device_id):
+    from .archive import archived_rows, horizon_from
+
+    # Same ordering as _repair_bucket: lock the counter, then count from a
+    # snapshot, so inserts in flight are counted exactly once.
+    cursor.execute(
+        "SELECT reading_count FROM reading_counts WHERE sensor_type = %s AND device_id = %s FOR UPDATE",
+        (sensor_type, device_id),
+    )
+    row = cursor.fetchone()
+    cursor.execute(f"SELECT COUNT(*) FROM {sensor_type} WHERE device_id = %s", (device_id,))
+    actual = cursor.fetchone()[0] + archived_rows(sensor_type, device_id, horizon_from(cursor, sensor_type))
+    if row is not None and row[0] == actual:
+        return False
+    cursor.execute("""
+        INSERT INTO reading_counts (sensor_type, device_id, reading_count)
+        VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE reading_count = VALUES(reading_count)
+    """, (sensor_type, device_id, actual))
+    return True
+
+
+async def reconcile_counts(sensor_types=SENSOR_TYPES) -> int:
+    """Recounts every device's readings and fixes reading_counts; returns how many rows were off."""
+    corrected = 0
+    for sensor_type in sensor_types:
+        devices = await fetchall(f"""
+            SELECT DISTINCT device_id FROM {sensor_type} WHERE device_id IS NOT NULL
+            UNION
+            SELECT device_id FROM reading_counts WHERE sensor_type = %s
+        """, (sensor_type,))
+        for (device_id,) in devices:
+            if await transaction(_reconcile_count, sensor_type, device_id):
+                corrected += 1
+    return corrected
+
+
+async def count_reconcile_loop():
+    """Background task reconciling reading_counts every COUNT_RECONCILE_INTERVAL seconds."""
+    while True:
+        await asyncio.sleep(COUNT_RECONCILE_INTERVAL)
+        try:
+            corrected = await reconcile_counts()
+            if corrected:
+                print(f"Reconciled {corrected} drifted reading counts")
+        except Exception as e:
+            print(f"Count reconciliation failed: {e}")
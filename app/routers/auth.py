@@ -1,7 +1,8 @@
 from fastapi import APIRouter, HTTPException, Response, Form, Request, Depends, Cookie
 from fastapi.responses import RedirectResponse, HTMLResponse, JSONResponse, FileResponse
 from fastapi.templating import Jinja2Templates
-from ..database import get_db_connection
+from ..database import fetchone, execute
+from ..sessions import authenticate, start_session, end_session, SESSION_MAX_AGE
 from ..dependencies import hash_password
 import os
 import uuid
@@ -27,23 +28,18 @@ async def signup(
     location: str = Form(...),
     PID: str = Form(...)
 ):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
     try:
         # Check if email exists
-        cursor.execute('SELECT id FROM users WHERE email = %s', (email,))
-        if cursor.fetchone():
+        if await fetchone('SELECT id FROM users WHERE email = %s', (email,)):
             raise HTTPException(status_code=400, detail="Email already registered")
 
         # Hash password and insert user
         hashed_password = hash_password(password)
         
-        cursor.execute('''
+        await execute('''
             INSERT INTO users (name, email, hashed_password, location, PID)
             VALUES (%s, %s, %s, %s, %s)
         ''', (name, email, hashed_password, location, PID))
-        conn.commit()
 
         return RedirectResponse(
             url="/login",
@@ -53,48 +49,22 @@ async def signup(
         import traceback
         print("Database Error:", traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Database error: {e}")
-    finally:
-        cursor.close()
-        conn.close()
 
 async def get_user_by_email(email: str) -> Optional[dict]:
     """Retrieve user from database by username."""
-    connection = None
-    cursor = None
-    try:
-        connection = get_db_connection()
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM users WHERE email = %s", (email,))
-        return cursor.fetchone()
-    finally:
-        if cursor:
-            cursor.close()
-        if connection and connection.is_connected():
-            connection.close()
+    return await fetchone("SELECT * FROM users WHERE email = %s", (email,), dictionary=True)
 
 @router.get("/user_info")
 async def getuserInformation(request: Request):
     from datetime import datetime
-    session_id = request.cookies.get("session_id")
-    connection = get_db_connection()
-    cursor = connection.cursor()
     try:
-        # Use the correct column name: sessions.id instead of session_id
-        cursor.execute(
-            '''
-            SELECT user_id FROM sessions WHERE id = %s
-            ''', (session_id,)
-        )
-        user_id_row = cursor.fetchone()
-        if not user_id_row: 
+        user_id = await authenticate(request)
+        if user_id is None:
             raise HTTPException(status_code=404, detail="user not found")
-        # Extract the user_id (assuming it's the first element in the tuple)
-        user_id = user_id_row[0]
         
-        cursor.execute(
+        user = await fetchone(
             "SELECT * FROM users WHERE id = %s", (user_id,)
         )
-        user = cursor.fetchone()
         if not user:
             raise HTTPException(status_code=404, detail="user not found")
         
@@ -111,29 +81,8 @@ async def getuserInformation(request: Request):
         import traceback
         print("Database Error:", traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Database error: {e}")
-    finally:
-        cursor.close()
-        connection.close()
 
 
-async def create_session(user_id: int, session_id: str) -> bool:
-    """Create a new session in the database."""
-    connection = None
-    cursor = None
-    try:
-        connection = get_db_connection()
-        cursor = connection.cursor()
-        cursor.execute(
-            "INSERT INTO sessions (id, user_id) VALUES (%s, %s)", (session_id, user_id)
-        )
-        connection.commit()
-        return True
-    finally:
-        if cursor:
-            cursor.close()
-        if connection and connection.is_connected():
-            connection.close()
-
 @router.post("/login")
 async def login(
     email: str = Form(...),
@@ -143,8 +92,6 @@ async def login(
     try:
         # Hash the provided password for comparison
         hashed_password = hash_password(password)
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
         
         # Retrieve user by email
         user = await get_user_by_email(email)
@@ -163,28 +110,23 @@ async def login(
             return HTMLResponse(content="Invalid username or password", status_code=401)
         
         # Optionally, you can perform a SELECT query to double-check (not strictly necessary here)
-        cursor.execute(
+        user_record = await fetchone(
             "SELECT id, email FROM users WHERE email = %s AND hashed_password = %s",
             (email, hashed_password)
         )
-        user_record = cursor.fetchone()
         if not user_record:
             return HTMLResponse(content="Invalid username or password", status_code=401)
         
         # Create a new session for the user
-        session_id = str(uuid.uuid4())
-        await create_session(user_id, session_id)
+        session_id = await start_session(user_id)
         response = RedirectResponse(url="/dashboard", status_code=302)
-        response.set_cookie(key="session_id", value=session_id, httponly=True, max_age=3600)
+        response.set_cookie(key="session_id", value=session_id, httponly=True, max_age=SESSION_MAX_AGE)
         return response
 
     except Exception as e:
         import traceback
         print("Database Error:", traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Database error: {e}")
-    finally:
-        cursor.close()
-        conn.close()
 
 
 def hash_password(password: str) -> str:
@@ -205,28 +147,12 @@ async def read_dashboard(request: Request):
     
     return FileResponse(dashboard_path)
 
-async def delete_session(session_id: str) -> bool:
-    """Delete a session from the database."""
-    connection = None
-    cursor = None
-    try:
-        connection = get_db_connection()
-        cursor = connection.cursor()
-        cursor.execute("DELETE FROM sessions WHERE id = %s", (session_id,))
-        connection.commit()
-        return True
-    finally:
-        if cursor:
-            cursor.close()
-        if connection and connection.is_connected():
-            connection.close()
-
 @router.post("/logout")
 async def logout(request: Request):
     session_id = request.cookies.get("session_id")
     response = RedirectResponse(url="/login", status_code=302)
     if session_id:
-        await delete_session(session_id)
+        await end_session(session_id)
         # Delete the session cookie
         response.delete_cookie("session_id")
     return response
@@ -0,0 +1,262 @@
+import os
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+from fastapi import Request
+
+from .database import fetchone, fetchall, execute
+
+# Session settings
+#   SESSION_MODE            "db" stores a random id in the sessions table and
+#                           looks it up; "signed" puts an HMAC-signed token
+#                           carrying user_id and expiry in the cookie
+#   SESSION_SECRET          HMAC key for signed tokens, shared by all workers
+#   SESSION_MAX_AGE         seconds a session stays valid
+#   REVOCATION_SYNC_INTERVAL  seconds between deny-list refreshes
+SESSION_MODE = os.getenv("SESSION_MODE", "db")
+SESSION_SECRET = os.getenv("SESSION_SECRET", "")
+SESSION_MAX_AGE = int(os.getenv("SESSION_MAX_AGE", "3600"))
+REVOCATION_SYNC_INTERVAL = float(os.getenv("REVOCATION_SYNC_INTERVAL", "30"))
+
+if SESSION_MODE not in ("db", "signed"):
+    raise RuntimeError(f"Unknown SESSION_MODE {SESSION_MODE!r}, expected 'db' or 'signed'")
+if SESSION_MODE == "signed" and not SESSION_SECRET:
+    raise RuntimeError("SESSION_SECRET must be set when SESSION_MODE=signed")
+
+# Session cache settings
+#   SESSION_CACHE_SIZE  session ids remembered per worker
+#   SESSION_CACHE_TTL   seconds before a cached session is checked again; this
+#                       bounds how long a logout on another worker goes unseen
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "10000"))
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "60"))
+
+
+class SessionCache:
+    """Bounded LRU cache mapping session_id to user_id, with a time-to-live."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._entries = OrderedDict()  # session_id -> (user_id, expires_at)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, session_id: str) -> Optional[int]:
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._entries[session_id]
+                self._misses += 1
+                return None
+            self._entries.move_to_end(session_id)
+            self._hits += 1
+            return entry[0]
+
+    def set(self, session_id: str, user_id: int):
+        with self._lock:
+            self._entries[session_id] = (user_id, time.monotonic() + self._ttl)
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, session_id: str):
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._entries),
+                "max_size": self._max_size,
+                "ttl": self._ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+session_cache = SessionCache(SESSION_CACHE_SIZE, SESSION_CACHE_TTL)
+
+
+async def resolve_session(session_id: str) -> Optional[int]:
+    """Returns the user_id owning a session, or None if the session is unknown."""
+    user_id = session_cache.get(session_id)
+    if user_id is not None:
+        return user_id
+    row = await fetchone("SELECT user_id FROM sessions WHERE id = %s", (session_id,))
+    if not row:
+        return None
+    session_cache.set(session_id, row[0])
+    return row[0]
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _signature(payload: str) -> str:
+    digest = hmac.new(SESSION_SECRET.encode(), payload.encode(), hashlib.sha256).digest()
+    return _b64encode(digest)
+
+
+def sign_token(user_id: int) -> str:
+    """Builds a signed session token for a user."""
+    claims = {"uid": user_id, "exp": int(time.time()) + SESSION_MAX_AGE, "jti": uuid.uuid4().hex}
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+    return f"{payload}.{_signature(payload)}"
+
+
+def _token_claims(token: str) -> Optional[dict]:
+    """Returns the claims of a correctly signed token, expired or not."""
+    payload, _, signature = token.partition(".")
+    if not signature or not hmac.compare_digest(signature, _signature(payload)):
+        return None
+    try:
+        return json.loads(_b64decode(payload))
+    except ValueError:
+        return None
+
+
+class RevocationList:
+    """Token ids revoked before expiry, mirrored from the revoked_sessions table."""
+
+    def __init__(self):
+        self._revoked = {}  # jti -> unix expiry
+        self._lock = threading.Lock()
+        self.last_sync = 0.0
+
+    def add(self, jti: str, expires_at: int):
+        with self._lock:
+            self._revoked[jti] = expires_at
+
+    def contains(self, jti: str) -> bool:
+        with self._lock:
+            return jti in self._revoked
+
+    def replace(self, revoked: dict):
+        """Swaps in a reloaded deny-list.
+
+        Local entries that have not expired yet are kept: a token revoked
+        here after the reload's SELECT ran is not in it, and dropping it
+        would accept the token again until the next sync.
+        """
+        now = time.time()
+        with self._lock:
+            for jti, expires_at in self._revoked.items():
+                if expires_at >= now:
+                    revoked.setdefault(jti, expires_at)
+            self._revoked = revoked
+        self.last_sync = now
+
+    def __len__(self):
+        with self._lock:
+            return len(self._revoked)
+
+
+revocations = RevocationList()
+
+
+def verify_token(token: str) -> Optional[int]:
+    """Returns the user_id of a valid, unexpired and unrevoked token."""
+    claims = _token_claims(token)
+    if not claims or claims.get("exp", 0) < time.time():
+        return None
+    if revocations.contains(claims.get("jti", "")):
+        return None
+    return claims.get("uid")
+
+
+async def revoke_token(token: str):
+    """Adds a token to the deny-list until it would have expired anyway."""
+    claims = _token_claims(token)
+    if not claims:
+        return
+    revocations.add(claims["jti"], claims["exp"])
+    await execute(
+        "INSERT IGNORE INTO revoked_sessions (jti, expires_at) VALUES (%s, %s)",
+        (claims["jti"], datetime.fromtimestamp(claims["exp"])),
+    )
+
+
+async def sync_revocations():
+    """Reloads the deny-list so logouts on other workers take effect here."""
+    await execute("DELETE FROM revoked_sessions WHERE expires_at < NOW()")
+    rows = await fetchall("SELECT jti, expires_at FROM revoked_sessions")
+    revocations.replace({jti: int(expires_at.timestamp()) for jti, expires_at in rows})
+
+
+async def revocation_sync_loop():
+    """Background task refreshing the deny-list every REVOCATION_SYNC_INTERVAL seconds."""
+    while True:
+        try:
+            await sync_revocations()
+        except Exception as e:
+            print(f"Revocation sync failed: {e}")
+        await asyncio.sleep(REVOCATION_SYNC_INTERVAL)
+
+
+async def authenticate(request: Request) -> Optional[int]:
+    """Returns the logged-in user's id, or None when the request has no valid session."""
+    session_id = request.cookies.get("session_id")
+    if not session_id:
+        return None
+    if SESSION_MODE == "signed":
+        return verify_token(session_id)
+    return await resolve_session(session_id)
+
+
+async def start_session(user_id: int) -> str:
+    """Starts a session for a user and returns the value for the session_id cookie."""
+    if SESSION_MODE == "signed":
+        return sign_token(user_id)
+    session_id = str(uuid.uuid4())
+    await create_session(user_id, session_id)
+    return session_id
+
+
+async def end_session(session_id: str):
+    """Ends the session behind a session_id cookie."""
+    if SESSION_MODE == "signed":
+        await revoke_token(session_id)
+    else:
+        await delete_session(session_id)
+
+
+async def create_session(user_id: int, session_id: str) -> bool:
+    """Create a new session in the database."""
+    await execute(
+        "INSERT INTO sessions (id, user_id) VALUES (%s, %s)", (session_id, user_id)
+    )
+    session_cache.set(session_id, user_id)
+    return True
+
+
+async def delete_session(session_id: str) -> bool:
+    """Delete a session from the database."""
+    await execute("DELETE FROM sessions WHERE id = %s", (session_id,))
+    session_cache.invalidate(session_id)
+    return True
+
+
+def session_cache_stats() -> dict:
+    """Returns session cache hit/miss counters for the /metrics endpoint."""
+    stats = session_cache.stats()
+    stats["mode"] = SESSION_MODE
+    stats["revoked_tokens"] = len(revocations)
+    return stats
@@ -0,0 +1,190 @@
+"""Embedded SQLite storage, selected with DB_BACKEND=sqlite.
+
+Connections opened here stand in for mysql.connector ones behind the shared
+ConnectionPool: cursors take the same MySQL-flavoured SQL and parameters,
+return tuples or dicts, and raise mysql.connector error classes, so the
+routers and app.readings run unchanged. Statements are rewritten once per
+distinct query text:
+
+  %s                            ?
+  ON DUPLICATE KEY UPDATE       ON CONFLICT DO UPDATE SET, VALUES(c) -> excluded.c
+  INSERT IGNORE                 INSERT OR IGNORE
+  LEAST / GREATEST              scalar MIN / MAX
+  CAST(... AS SIGNED)           CAST(... AS INTEGER)
+  NOW()                         local time, like the naive DATETIMEs stored
+  DATE_SUB(x, INTERVAL n SECOND)
+  ... FOR UPDATE                dropped; the statement opens a write transaction
+
+The database file runs in WAL mode, so readers never block the single
+writer. A transaction starts with BEGIN IMMEDIATE at its first write or
+FOR UPDATE read, which serializes read-modify-write sequences the way the
+row locks do on MySQL; plain reads outside a transaction autocommit.
+
+DATETIME columns are stored as 'YYYY-MM-DD HH:MM:SS' text and read back as
+datetime. datetime and date parameters are bound in that form (a date as its
+midnight, as MySQL compares one with a DATETIME), so comparisons behave as
+MySQL's do; callers pass times as datetime, never as text, and strings are
+bound unchanged. Needs SQLite 3.35 or newer.
+"""
+import re
+import sqlite3
+from datetime import date, datetime
+from functools import lru_cache
+
+import mysql.connector
+
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(sep=" "))
+sqlite3.register_adapter(date, lambda value: f"{value.isoformat()} 00:00:00")
+sqlite3.register_converter("DATETIME", lambda raw: datetime.fromisoformat(raw.decode()))
+sqlite3.register_converter("TIMESTAMP", lambda raw: datetime.fromisoformat(raw.decode()))
+
+WRITE_STATEMENT = re.compile(r"^\s*(INSERT|UPDATE|DELETE|REPLACE|CREATE|DROP|ALTER)\b", re.IGNORECASE)
+REWRITES = [
+    (re.compile(r"\bON DUPLICATE KEY UPDATE\b", re.IGNORECASE), "ON CONFLICT DO UPDATE SET"),
+    (re.compile(r"\bVALUES\((\w+)\)", re.IGNORECASE), r"excluded.\1"),
+    (re.compile(r"\bINSERT IGNORE\b", re.IGNORECASE), "INSERT OR IGNORE"),
+    (re.compile(r"\bLEAST\(", re.IGNORECASE), "MIN("),
+    (re.compile(r"\bGREATEST\(", re.IGNORECASE), "MAX("),
+    (re.compile(r"\bAS SIGNED\b", re.IGNORECASE), "AS INTEGER"),
+    (re.compile(r"\bNOW\(\)", re.IGNORECASE), "datetime('now', 'localtime')"),
+    (re.compile(r"\bDATE_SUB\((.+?), INTERVAL (.+?) SECOND\)", re.IGNORECASE), r"datetime(\1, '-' || (\2) || ' seconds')"),
+    (re.compile(r"%s"), "?"),
+]
+PLAIN_INSERT = re.compile(r"^\s*INSERT\s+INTO\b", re.IGNORECASE)
+FOR_UPDATE = re.compile(r"\s+FOR UPDATE\s*$", re.IGNORECASE)
+
+ERRORS = [
+    (sqlite3.IntegrityError, mysql.connector.errors.IntegrityError),
+    (sqlite3.OperationalError, mysql.connector.errors.OperationalError),
+    (sqlite3.ProgrammingError, mysql.connector.errors.ProgrammingError),
+    (sqlite3.Error, mysql.connector.errors.DatabaseError),
+]
+
+
+@lru_cache(maxsize=1024)
+def translate(query: str):
+    """Returns (SQLite statement, whether it must run in a write transaction)."""
+    locking = FOR_UPDATE.search(query) is not None
+    query = FOR_UPDATE.sub("", query)
+    for pattern, replacement in REWRITES:
+        query = pattern.sub(replacement, query)
+    return query, locking or WRITE_STATEMENT.match(query) is not None
+
+
+def _params(params):
+    return list(params or ())
+
+
+def _mysql_error(error):
+    for sqlite_class, mysql_class in ERRORS:
+        if isinstance(error, sqlite_class):
+            return mysql_class(msg=str(error))
+    return error
+
+
+class Cursor:
+    """A mysql.connector-style cursor over a sqlite3 one."""
+
+    def __init__(self, connection, dictionary):
+        self._connection = connection
+        self._cursor = connection._raw.cursor()
+        self._dictionary = dictionary
+        self.lastrowid = None
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def execute(self, query, params=()):
+        statement, write = translate(query)
+        try:
+            if write:
+                self._connection._begin()
+            self._cursor.execute(statement, _params(params))
+        except sqlite3.Error as e:
+            raise _mysql_error(e) from e
+        self.lastrowid = self._cursor.lastrowid
+
+    def executemany(self, query, seq_params):
+        statement, write = translate(query)
+        seq_params = [_params(params) for params in seq_params]
+        try:
+            if write:
+                self._connection._begin()
+            self._cursor.executemany(statement, seq_params)
+            self.lastrowid = None
+            if seq_params and PLAIN_INSERT.match(statement) and "ON CONFLICT" not in statement and self._cursor.rowcount > 0:
+                # Like a MySQL multi-row INSERT, report the first id; the write
+                # lock held since BEGIN IMMEDIATE keeps the batch's ids consecutive
+                last = self._connection._raw.execute("SELECT last_insert_rowid()").fetchone()[0]
+                self.lastrowid = last - self._cursor.rowcount + 1
+        except sqlite3.Error as e:
+            raise _mysql_error(e) from e
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return {column[0]: value for column, value in zip(self._cursor.description, row)}
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchmany(self, size=1):
+        return [self._row(row) for row in self._cursor.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def close(self):
+        self._cursor.close()
+
+
+class Connection:
+    """A mysql.connector-style connection to the database file."""
+
+    def __init__(self, path, busy_timeout, synchronous):
+        # Transactions are opened explicitly in _begin()
+        self._raw = sqlite3.connect(
+            path, isolation_level=None, check_same_thread=False, detect_types=sqlite3.PARSE_DECLTYPES,
+        )
+        self._raw.execute("PRAGMA journal_mode=WAL")
+        self._raw.execute(f"PRAGMA synchronous={synchronous}")
+        self._raw.execute(f"PRAGMA busy_timeout={int(busy_timeout * 1000)}")
+        self._raw.execute("PRAGMA foreign_keys=ON")
+
+    @property
+    def in_transaction(self):
+        return self._raw.in_transaction
+
+    def _begin(self):
+        if not self._raw.in_transaction:
+            self._raw.execute("BEGIN IMMEDIATE")
+
+    def cursor(self, dictionary=False, buffered=None):
+        # sqlite3 cursors step through results lazily, so buffered makes no difference
+        return Cursor(self, dictionary)
+
+    def commit(self):
+        if self._raw.in_transaction:
+            self._raw.execute("COMMIT")
+
+    def rollback(self):
+        if self._raw.in_transaction:
+            self._raw.execute("ROLLBACK")
+
+    def ping(self, reconnect=False):
+        try:
+            self._raw.execute("SELECT 1")
+        except sqlite3.Error as e:
+            raise _mysql_error(e) from e
+
+    def close(self):
+        self._raw.close()
+
+
+def connect(path, busy_timeout, synchronous="NORMAL") -> Connection:
+    return Connection(path, busy_timeout, synchronous)
@@ -0,0 +1,170 @@
+import codecs
+import csv
+import io
+import json
+import os
+import zlib
+from contextlib import aclosing
+from datetime import datetime
+
+from starlette.responses import StreamingResponse
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+# zlib level for gzip-compressed exports: 1 is fastest, 9 smallest
+EXPORT_GZIP_LEVEL = int(os.getenv("EXPORT_GZIP_LEVEL", "6"))
+
+# Longest line accepted from an upload, in characters; only one partial
+# line is ever held while decoding
+MAX_LINE_LENGTH = int(os.getenv("IMPORT_MAX_LINE_LENGTH", "65536"))
+
+
+class MalformedUpload(ValueError):
+    """An upload that cannot be read any further."""
+
+
+def format_row(row: dict) -> dict:
+    """Renders datetimes the way the JSON endpoints always have."""
+    return {
+        key: value.strftime(TIMESTAMP_FORMAT) if isinstance(value, datetime) else value
+        for key, value in row.items()
+    }
+
+
+async def ndjson_lines(chunks):
+    """Turns chunks of dict rows into newline-delimited JSON text."""
+    async with aclosing(chunks):
+        async for rows in chunks:
+            yield "".join(json.dumps(format_row(row)) + "\n" for row in rows)
+
+
+async def csv_lines(chunks):
+    """Turns chunks of dict rows into CSV text, header first."""
+    buffer = io.StringIO()
+    writer = None
+    async with aclosing(chunks):
+        async for rows in chunks:
+            for row in rows:
+                if writer is None:
+                    writer = csv.DictWriter(buffer, fieldnames=list(row.keys()))
+                    writer.writeheader()
+                writer.writerow(format_row(row))
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+
+def encode(chunks, output_format: str):
+    """Returns an async iterator of text in the requested streaming format."""
+    if output_format == "csv":
+        return csv_lines(chunks)
+    return ndjson_lines(chunks)
+
+
+async def gzipped(texts):
+    """Compresses an async iterator of text into gzip bytes as it goes."""
+    compressor = zlib.compressobj(EXPORT_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    async with aclosing(texts):
+        async for text in texts:
+            data = compressor.compress(text.encode())
+            if data:
+                yield data
+    yield compressor.flush()
+
+
+class ClosingStreamingResponse(StreamingResponse):
+    """A StreamingResponse that closes its body iterator however the response ends.
+
+    Starlette leaves the iterator suspended when the client goes away, and a
+    database cursor streaming into it would keep its pooled connection until
+    garbage collection. Closing it runs the generators' cleanup right away;
+    each one above closes the iterator it reads from.
+    """
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
+
+
+async def text_lines(chunks):
+    """Turns an async iterator of UTF-8 bytes into (line number, line) pairs."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    number = 0
+    async for data in chunks:
+        try:
+            pending += decoder.decode(data)
+        except UnicodeDecodeError as e:
+            # e.object holds the chunk, so count the lines it ends before the bad byte
+            bad_line = number + 1 + e.object[:e.start].count(b"\n")
+            raise MalformedUpload(f"Line {bad_line} is not UTF-8 text")
+        *complete, pending = pending.split("\n")
+        for line in complete:
+            number += 1
+            yield number, line.rstrip("\r")
+        if len(pending) > MAX_LINE_LENGTH:
+            raise MalformedUpload(f"Line {number + 1} is longer than {MAX_LINE_LENGTH} characters")
+    try:
+        pending += decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        raise MalformedUpload(f"Line {number + 1} is not UTF-8 text")
+    if pending:
+        yield number + 1, pending.rstrip("\r")
+
+
+async def ndjson_records(lines):
+    """Yields (line number, record, problem) for every non-blank NDJSON line."""
+    async for number, line in lines:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield number, None, "Invalid JSON"
+            continue
+        if not isinstance(record, dict):
+            yield number, None, "Expected a JSON object"
+            continue
+        yield number, record, None
+
+
+async def csv_records(lines):
+    """Yields (line number, record, problem) for every CSV row after the header.
+
+    Each row has to fit on one line. Empty fields are left out of the record.
+    """
+    header = None
+    async for number, line in lines:
+        if not line.strip():
+            continue
+        try:
+            fields = next(csv.reader([line]))
+        except csv.Error:
+            yield number, None, "Invalid CSV"
+            continue
+        if header is None:
+            header = [name.strip() for name in fields]
+            continue
+        if len(fields) != len(header):
+            yield number, None, f"Expected {len(header)} fields, got {len(fields)}"
+            continue
+        yield number, {name: value for name, value in zip(header, fields) if value != ""}, None
+
+
+def decode(chunks, input_format: str):
+    """Returns an async iterator of (line number, record, problem) from uploaded bytes.
+
+    Raises MalformedUpload, while iterating, for text that cannot be split
+    into lines.
+    """
+    lines = text_lines(chunks)
+    if input_format == "csv":
+        return csv_records(lines)
+    return ndjson_records(lines)
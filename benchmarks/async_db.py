@@ -0,0 +1,75 @@
+"""Fast-query latency while slow queries are in flight.
+
+Runs the same workload twice on one event loop against the configured
+MySQL database:
+
+  blocking  queries run directly on the event loop (how handlers used to work)
+  async     queries are awaited through app.database.fetchone
+
+Latency is measured from when a fast query was scheduled to arrive, so time
+spent queued behind a blocked loop is included.
+
+Usage: python -m benchmarks.async_db [--slow 10] [--fast 200] [--sleep 0.5] [--window 2]
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from app.database import db_cursor, fetchone
+
+
+async def blocking_fetchone(query, params=()):
+    with db_cursor() as cursor:
+        cursor.execute(query, params)
+        return cursor.fetchone()
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run(mode, slow, fast, sleep_s, window):
+    query = fetchone if mode == "async" else blocking_fetchone
+    start = time.perf_counter()
+    latencies = []
+
+    async def fast_query(delay):
+        await asyncio.sleep(delay)
+        await query("SELECT 1")
+        latencies.append(time.perf_counter() - (start + delay))
+
+    async def slow_query(delay):
+        await asyncio.sleep(delay)
+        await query("SELECT SLEEP(%s)", (sleep_s,))
+
+    rng = random.Random(42)
+    tasks = [slow_query(rng.uniform(0, window)) for _ in range(slow)]
+    tasks += [fast_query(rng.uniform(0, window)) for _ in range(fast)]
+    await asyncio.gather(*tasks)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--slow", type=int, default=10, help="slow queries per run")
+    parser.add_argument("--fast", type=int, default=200, help="fast queries per run")
+    parser.add_argument("--sleep", type=float, default=0.5, help="seconds each slow query takes")
+    parser.add_argument("--window", type=float, default=2.0, help="seconds over which queries arrive")
+    args = parser.parse_args()
+
+    print(f"{'mode':<10}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for mode in ("blocking", "async"):
+        latencies = asyncio.run(run(mode, args.slow, args.fast, args.sleep, args.window))
+        print(
+            f"{mode:<10}"
+            f"{percentile(latencies, 50) * 1000:>10.1f}"
+            f"{percentile(latencies, 99) * 1000:>10.1f}"
+            f"{max(latencies) * 1000:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
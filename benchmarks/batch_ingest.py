@@ -0,0 +1,72 @@
+"""Sensor ingest throughput: one POST per reading versus the batch endpoint.
+
+Drives the app over ASGI against the configured MySQL database.
+
+  single  POST /api/{sensor_type} once per reading, --concurrency at a time
+  batch   POST /api/{sensor_type}/batch with --batch-size readings per request
+
+Usage: python -m benchmarks.batch_ingest [--readings 5000] [--batch-size 500] [--devices 4]
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.common import logged_in_client
+
+
+def make_readings(count, device_ids):
+    return [
+        {"value": 20 + (i % 100) / 10, "unit": "celsius", "device_id": device_ids[i % len(device_ids)]}
+        for i in range(count)
+    ]
+
+
+async def single(client, sensor_type, readings, concurrency):
+    queue = iter(readings)
+
+    async def worker():
+        for reading in queue:
+            response = await client.post(f"/api/{sensor_type}", json=reading)
+            response.raise_for_status()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+async def batch(client, sensor_type, readings, batch_size):
+    for start in range(0, len(readings), batch_size):
+        response = await client.post(f"/api/{sensor_type}/batch", json=readings[start:start + batch_size])
+        response.raise_for_status()
+
+
+async def run(args):
+    client, device_ids = await logged_in_client(devices=args.devices)
+    readings = make_readings(args.readings, device_ids)
+    results = {}
+    async with client:
+        start = time.perf_counter()
+        await single(client, args.sensor_type, readings, args.concurrency)
+        results["single"] = args.readings / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await batch(client, args.sensor_type, readings, args.batch_size)
+        results["batch"] = args.readings / (time.perf_counter() - start)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sensor-type", default="temperature")
+    parser.add_argument("--readings", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--devices", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print(f"{'path':<8}{'readings/s':>14}")
+    for path, rate in results.items():
+        print(f"{path:<8}{rate:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Sustained MQTT bridge throughput: HTTP forwarding versus direct writes.
+
+Feeds synthetic readings straight into Server/main.py's Bridge, as
+on_message would, and times how long it takes until all of them are stored
+in the configured MySQL database:
+
+  http    each reading is POSTed to /add_temp, which queues it in the
+          ingest buffer (served from an in-process uvicorn unless --url
+          is given)
+  direct  workers write batches of readings through app.readings
+
+Usage: python -m benchmarks.bridge_modes [--readings 20000] [--devices 50] [--workers 8]
+"""
+import argparse
+import importlib.util
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+
+import uvicorn
+
+from app.database import db_cursor
+
+BRIDGE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Server", "main.py")
+
+
+def load_bridge():
+    # Server/main.py imports its sibling modules by plain name
+    sys.path.insert(0, os.path.dirname(BRIDGE_PATH))
+    spec = importlib.util.spec_from_file_location("bridge", BRIDGE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def serve_app():
+    """Starts the app on a free local port and returns its /add_temp URL."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config("app.main:app", host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}/add_temp"
+
+
+def stored(prefix):
+    with db_cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM temperature WHERE device_id LIKE %s", (prefix + "%",))
+        return cursor.fetchone()[0]
+
+
+def measure(bridge_module, forwarder, readings, devices, workers, timeout):
+    prefix = f"BR:{uuid.uuid4().hex[:8]}:"
+    bridge = bridge_module.Bridge(forwarder, workers=workers, queue_size=readings, max_retries=5, retry_backoff=0.1)
+    bridge.start()
+    start = time.perf_counter()
+    for i in range(readings):
+        bridge.submit({"value": 20 + (i % 100) / 10, "unit": "celsius", "mac_address": f"{prefix}{i % devices:04d}"})
+    while stored(prefix) < readings:
+        if time.perf_counter() - start > timeout:
+            raise RuntimeError(f"only {stored(prefix)} of {readings} readings stored after {timeout}s")
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - start
+    bridge.stop()
+    return readings / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--readings", type=int, default=20000)
+    parser.add_argument("--devices", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--batch-window-ms", type=int, default=200)
+    parser.add_argument("--url", help="/add_temp of a running server instead of an in-process one")
+    parser.add_argument("--timeout", type=float, default=600)
+    args = parser.parse_args()
+
+    bridge = load_bridge()
+    url = args.url or serve_app()
+    forwarders = {
+        "http": bridge.HttpForwarder(url, args.workers, timeout=5),
+        "direct": bridge.DatabaseWriter(args.batch_size, args.batch_window_ms / 1000),
+    }
+
+    print(f"{'mode':<8}{'readings/s':>14}")
+    for mode, forwarder in forwarders.items():
+        rate = measure(bridge, forwarder, args.readings, args.devices, args.workers, args.timeout)
+        print(f"{mode:<8}{rate:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""MQTT bridge throughput as the number of consumer processes grows.
+
+For each consumer count, starts Server/supervisor.py against a local MQTT
+broker (the stand-in from benchmarks/mqtt_broker.py unless --broker is
+given) and an HTTP sink that accepts /add_temp without touching a database,
+publishes readings the way the devices do, and times how long it takes until
+the sink has all of them. It also checks that every device's readings
+arrived in the order they were published.
+
+The sink runs one process per core so it does not become the bottleneck;
+on a machine with fewer cores than consumers, the numbers flatten out.
+
+Usage: python -m benchmarks.bridge_scaling [--consumers 1,2,4] [--readings 20000] [--devices 200]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import paho.mqtt.client as mqtt
+
+from benchmarks.mqtt_broker import start_broker
+
+SUPERVISOR_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Server", "supervisor.py")
+# Hardcoded in Server/main.py
+READINGS_TOPIC = "apple/ece140/sensors/readings"
+
+
+class SinkServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        # Several sink processes share the port; the kernel spreads connections between them
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+
+def run_sink(port, received, stop, results):
+    arrivals = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            reading = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            arrivals.append((time.monotonic_ns(), reading["mac_address"], float(reading["value"])))
+            with received.get_lock():
+                received.value += 1
+            self.send_response(200)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, format, *args):
+            pass
+
+    server = SinkServer(("127.0.0.1", port), Handler)
+    server.timeout = 0.1
+    while not stop.is_set():
+        server.handle_request()
+    server.server_close()
+    results.put(arrivals)
+
+
+def start_sinks(processes):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    received = multiprocessing.Value("q", 0)
+    stop = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    sinks = [
+        multiprocessing.Process(target=run_sink, args=(port, received, stop, results), daemon=True)
+        for _ in range(processes)
+    ]
+    for sink in sinks:
+        sink.start()
+    return port, received, stop, results, sinks
+
+
+def stop_sinks(stop, results, sinks):
+    """Returns every arrival, as (monotonic_ns, mac_address, value), in arrival order."""
+    stop.set()
+    arrivals = []
+    for _ in sinks:
+        arrivals.extend(results.get())
+    for sink in sinks:
+        sink.join()
+    return sorted(arrivals)
+
+
+def out_of_order(arrivals):
+    last = {}
+    count = 0
+    for _, mac_address, value in arrivals:
+        if value <= last.get(mac_address, -1):
+            count += 1
+        last[mac_address] = value
+    return count
+
+
+def wait_for(condition, timeout, what):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"timed out waiting for {what}")
+        time.sleep(0.05)
+
+
+def measure(consumers, args, broker, broker_host, broker_port):
+    sink_port, received, stop, results, sinks = start_sinks(args.sinks)
+    env = dict(
+        os.environ,
+        MQTT_BROKER=broker_host,
+        MQTT_PORT=str(broker_port),
+        WEB_SERVER_URL=f"http://127.0.0.1:{sink_port}/add_temp",
+        BRIDGE_MODE="http",
+        BRIDGE_WORKERS=str(args.workers),
+        BRIDGE_QUEUE_SIZE=str(args.readings),
+        BRIDGE_SPOOL_PATH="",
+    )
+    supervisor = subprocess.Popen(
+        [sys.executable, SUPERVISOR_PATH, "--consumers", str(consumers)],
+        cwd=os.path.dirname(SUPERVISOR_PATH), env=env, stdout=subprocess.DEVNULL,
+    )
+    try:
+        if broker is not None:
+            subscribed = lambda: sum(1 for client in list(broker.clients) if client.subscriptions) >= consumers
+            wait_for(subscribed, 30, "consumers to subscribe")
+        else:
+            time.sleep(args.settle)
+
+        publisher = mqtt.Client()
+        publisher.connect(broker_host, broker_port)
+        publisher.loop_start()
+        start = time.perf_counter()
+        for i in range(args.readings):
+            payload = {"temperature": i // args.devices, "pressure": 0, "mac_address": f"SC:AL:{i % args.devices:06d}"}
+            publisher.publish(READINGS_TOPIC, json.dumps(payload))
+        wait_for(lambda: received.value >= args.readings, args.timeout, f"{args.readings} readings to arrive")
+        elapsed = time.perf_counter() - start
+        publisher.loop_stop()
+        publisher.disconnect()
+    finally:
+        supervisor.send_signal(signal.SIGTERM)
+        supervisor.wait()
+        arrivals = stop_sinks(stop, results, sinks)
+    return args.readings / elapsed, out_of_order(arrivals)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--consumers", default="1,2,4", help="comma separated consumer counts")
+    parser.add_argument("--readings", type=int, default=20000)
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=8, help="forwarding threads per consumer")
+    parser.add_argument("--sinks", type=int, default=os.cpu_count() or 1, help="HTTP sink processes")
+    parser.add_argument("--broker", help="host:port of a running broker instead of the stand-in")
+    parser.add_argument("--settle", type=float, default=3, help="seconds to let consumers subscribe to --broker")
+    parser.add_argument("--timeout", type=float, default=600)
+    args = parser.parse_args()
+
+    if args.broker:
+        broker = None
+        host, _, port = args.broker.partition(":")
+        port = int(port or 1883)
+    else:
+        broker, port = start_broker()
+        host = "127.0.0.1"
+
+    print(f"{'consumers':<11}{'readings/s':>12}{'speedup':>10}{'out of order':>14}")
+    baseline = None
+    for consumers in (int(n) for n in args.consumers.split(",")):
+        rate, disordered = measure(consumers, args, broker, host, port)
+        baseline = baseline or rate
+        print(f"{consumers:<11}{rate:>12.0f}{rate / baseline:>9.2f}x{disordered:>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+"""Helpers shared by the benchmarks that drive the app over ASGI."""
+import uuid
+
+import httpx
+
+from app.main import app
+
+
+async def logged_in_client(devices=1):
+    """Signs up a throwaway user, logs in and registers devices.
+
+    Returns the client, which carries the session cookie, and the device ids.
+    The schema must already exist in the configured database.
+    """
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+    tag = uuid.uuid4().hex[:12]
+    email = f"bench-{tag}@example.com"
+    await client.post("/signup", data={
+        "name": "Benchmark", "email": email, "password": "bench", "location": "bench", "PID": "A00000000",
+    })
+    response = await client.post("/login", data={"email": email, "password": "bench"})
+    if "session_id" not in response.cookies:
+        raise RuntimeError(f"login failed: {response.status_code} {response.text}")
+    client.cookies.set("session_id", response.cookies["session_id"])
+
+    device_ids = []
+    for index in range(devices):
+        device_id = f"BE:NC:{tag[:6]}:{index:04d}"
+        response = await client.post("/register-device", data={"mac_address": device_id})
+        response.raise_for_status()
+        device_ids.append(device_id)
+    return client, device_ids
@@ -0,0 +1,335 @@
+"""End-to-end ingest load test with a simulated ESP32 fleet.
+
+Runs the whole pipeline locally: simulated devices publish the payload that
+IOT/src/main.cpp builds to an MQTT broker (the stand-in from
+benchmarks/mqtt_broker.py unless --broker is given), Server/supervisor.py
+bridges it to the app (started with uvicorn unless --url is given), and the
+app writes it to the configured MySQL database.
+
+A scenario file describes the bridge and app setup and a list of stages, each
+with a fleet size, a publish interval per device and a duration; see
+benchmarks/scenarios/. For every stage the report gives the offered and
+sustained rate, loss, and publish-to-commit latency percentiles. Commits are
+seen by polling the temperature table every --poll-ms, which bounds the
+latency resolution.
+
+Each reading's temperature encodes its per-device sequence number so the row
+can be matched to its publish; the values stay in 0-100 degrees.
+
+Usage: python -m benchmarks.loadgen benchmarks/scenarios/smoke.json [--output results.json]
+"""
+import argparse
+import heapq
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+
+import paho.mqtt.client as mqtt
+
+from app.database import db_cursor
+from benchmarks.mqtt_broker import start_broker
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_DIR = os.path.join(REPO_ROOT, "Server")
+# Hardcoded in Server/main.py
+READINGS_TOPIC = "apple/ece140/sensors/readings"
+# Sequence numbers wrap here so temperatures stay two-decimal values below 100
+VALUE_STEPS = 10000
+# Rows committed out of id order are still picked up if they land within this many seconds
+COMMIT_SETTLE = 5.0
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(condition, timeout, what):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"timed out waiting for {what}")
+        time.sleep(0.1)
+
+
+def listening(port):
+    try:
+        socket.create_connection(("127.0.0.1", port), timeout=1).close()
+        return True
+    except OSError:
+        return False
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+def start_app(workers):
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=REPO_ROOT, stdout=subprocess.DEVNULL,
+    )
+    wait_for(lambda: listening(port), 60, "the app to start")
+    return process, f"http://127.0.0.1:{port}"
+
+
+def start_bridge(config, broker_host, broker_port, url, spool_dir):
+    env = dict(
+        os.environ,
+        MQTT_BROKER=broker_host,
+        MQTT_PORT=str(broker_port),
+        WEB_SERVER_URL=f"{url}/add_temp" if url else "",
+        BRIDGE_MODE=config.get("mode", "http"),
+        BRIDGE_WORKERS=str(config.get("workers", 8)),
+        BRIDGE_SPOOL_PATH=os.path.join(spool_dir, "bridge-spool.sqlite3"),
+    )
+    return subprocess.Popen(
+        [sys.executable, os.path.join(SERVER_DIR, "supervisor.py"), "--consumers", str(config.get("consumers", 1))],
+        cwd=SERVER_DIR, env=env, stdout=subprocess.DEVNULL,
+    )
+
+
+class Fleet:
+    """Simulated devices sharing a few MQTT connections, and what they have published."""
+
+    def __init__(self, host, port, connections, rng):
+        # Three random bytes keep this run's MAC addresses apart from real devices and earlier runs
+        self.prefix = ":".join(f"{byte:02X}" for byte in uuid.uuid4().bytes[:3]) + ":"
+        self.rng = rng
+        self.clients = []
+        for _ in range(connections):
+            client = mqtt.Client()
+            client.connect(host, port)
+            client.loop_start()
+            self.clients.append(client)
+        self.sequence = {}
+        self.pending = {}  # (mac_address, value step) -> (published_at, stage)
+        self.published = []  # per stage
+        self.lock = threading.Lock()
+
+    def mac_address(self, index):
+        return self.prefix + f"{index >> 16 & 0xFF:02X}:{index >> 8 & 0xFF:02X}:{index & 0xFF:02X}"
+
+    def publish(self, index, stage):
+        mac_address = self.mac_address(index)
+        step = self.sequence.get(index, 0) % VALUE_STEPS
+        self.sequence[index] = self.sequence.get(index, 0) + 1
+        # Same layout and precision as the firmware's String(float) concatenation
+        payload = (
+            f'{{"temperature": {step / 100:.2f}, "pressure": {self.rng.uniform(990, 1030):.2f}, '
+            f'"mac_address": "{mac_address}"}}'
+        )
+        with self.lock:
+            self.pending[(mac_address, step)] = (time.monotonic(), stage)
+            self.published[stage] += 1
+        self.clients[index % len(self.clients)].publish(READINGS_TOPIC, payload)
+
+    def committed(self, mac_address, value):
+        """Returns (published_at, stage) of the reading a committed row holds, if it is ours."""
+        with self.lock:
+            return self.pending.pop((mac_address, round(value * 100)), None)
+
+    def run_stage(self, stage, devices, interval, duration):
+        """Publishes from devices devices every interval seconds; returns the worst publish lag."""
+        with self.lock:
+            self.published.append(0)
+        start = time.monotonic()
+        end = start + duration
+        # Devices boot at random moments, so their publishes are spread over the interval
+        due = [(start + self.rng.uniform(0, interval), index) for index in range(devices)]
+        heapq.heapify(due)
+        lag = 0.0
+        while due and due[0][0] < end:
+            at, index = heapq.heappop(due)
+            now = time.monotonic()
+            if at > now:
+                time.sleep(at - now)
+            else:
+                lag = max(lag, now - at)
+            self.publish(index, stage)
+            heapq.heappush(due, (at + interval, index))
+        return lag
+
+    def close(self):
+        for client in self.clients:
+            client.loop_stop()
+            client.disconnect()
+
+
+class CommitWatcher(threading.Thread):
+    """Polls the temperature table for the fleet's rows and times their commits."""
+
+    def __init__(self, fleet, interval):
+        super().__init__(name="commit-watcher", daemon=True)
+        self.fleet = fleet
+        self.interval = interval
+        self.latencies = {}  # stage -> [seconds]
+        self.commits = {}  # stage -> [monotonic]
+        self._seen = set()
+        self._floors = deque()  # (observed_at, highest id seen)
+        self._floor = 0
+        self._stopped = threading.Event()
+
+    def poll(self):
+        with db_cursor() as cursor:
+            cursor.execute(
+                "SELECT id, device_id, value FROM temperature WHERE device_id LIKE %s AND id > %s",
+                (self.fleet.prefix + "%", self._floor),
+            )
+            rows = cursor.fetchall()
+        now = time.monotonic()
+        highest = self._floor
+        for row_id, device_id, value in rows:
+            highest = max(highest, row_id)
+            if row_id in self._seen:
+                continue
+            self._seen.add(row_id)
+            match = self.fleet.committed(device_id, value)
+            if match is not None:
+                published_at, stage = match
+                self.latencies.setdefault(stage, []).append(now - published_at)
+                self.commits.setdefault(stage, []).append(now)
+        # Rows with lower ids may still commit for a while; only skip past ids that are settled
+        self._floors.append((now, highest))
+        while self._floors and now - self._floors[0][0] > COMMIT_SETTLE:
+            self._floor = self._floors.popleft()[1]
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.poll()
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+        self.poll()
+
+
+def report(scenario, fleet, watcher, lags):
+    stages = []
+    for stage, config in enumerate(scenario["stages"]):
+        latencies = sorted(watcher.latencies.get(stage, []))
+        commits = sorted(watcher.commits.get(stage, []))
+        published = fleet.published[stage]
+        span = commits[-1] - commits[0] if len(commits) > 1 else 0
+        stages.append({
+            "devices": config["devices"],
+            "interval_s": config["interval_s"],
+            "offered_per_s": round(config["devices"] / config["interval_s"], 1),
+            "published": published,
+            "committed": len(latencies),
+            "lost": published - len(latencies),
+            "loss_pct": round(100 * (published - len(latencies)) / published, 2) if published else 0.0,
+            "sustained_per_s": round(len(commits) / span, 1) if span else None,
+            "publisher_lag_s": round(lags[stage], 3),
+            **{
+                f"latency_{name}_ms": round(value * 1000, 1) if value is not None else None
+                for name, value in (
+                    ("p50", percentile(latencies, 0.50)),
+                    ("p95", percentile(latencies, 0.95)),
+                    ("p99", percentile(latencies, 0.99)),
+                    ("max", latencies[-1] if latencies else None),
+                )
+            },
+        })
+    return stages
+
+
+def print_report(stages):
+    columns = ["devices", "offered_per_s", "sustained_per_s", "loss_pct",
+               "latency_p50_ms", "latency_p95_ms", "latency_p99_ms", "latency_max_ms"]
+    print("".join(f"{column:>17}" for column in columns))
+    for stage in stages:
+        print("".join(f"{'-' if stage[column] is None else stage[column]:>17}" for column in columns))
+    for index, stage in enumerate(stages):
+        if stage["publisher_lag_s"] > 1:
+            print(f"stage {index}: the load generator fell {stage['publisher_lag_s']}s behind; "
+                  "its offered rate was not reached")
+
+
+def run(scenario, args):
+    rng = random.Random(scenario.get("seed", 0))
+    bridge_config = scenario.get("bridge", {})
+
+    broker = None
+    if args.broker:
+        broker_host, _, port = args.broker.partition(":")
+        broker_port = int(port or 1883)
+    else:
+        broker, broker_port = start_broker()
+        broker_host = "127.0.0.1"
+
+    processes = []
+    spool_dir = tempfile.mkdtemp(prefix="loadgen-")
+    try:
+        url = args.url
+        if url is None and bridge_config.get("mode", "http") == "http":
+            app, url = start_app(scenario.get("app_workers", 1))
+            processes.append(app)
+        bridge = start_bridge(bridge_config, broker_host, broker_port, url, spool_dir)
+        processes.insert(0, bridge)
+        if broker is not None:
+            consumers = bridge_config.get("consumers", 1)
+            subscribed = lambda: sum(1 for client in list(broker.clients) if client.subscriptions) >= consumers
+            wait_for(subscribed, 60, "the bridge to subscribe")
+        else:
+            time.sleep(args.settle)
+
+        fleet = Fleet(broker_host, broker_port, scenario.get("connections", 4), rng)
+        watcher = CommitWatcher(fleet, args.poll_ms / 1000)
+        watcher.start()
+        lags = []
+        for stage, config in enumerate(scenario["stages"]):
+            print(f"stage {stage}: {config['devices']} devices every {config['interval_s']}s "
+                  f"for {config['duration_s']}s", flush=True)
+            lags.append(fleet.run_stage(stage, config["devices"], config["interval_s"], config["duration_s"]))
+        # Give the pipeline time to catch up before counting what never arrived
+        drain_until = time.monotonic() + scenario.get("drain_s", 30)
+        while fleet.pending and time.monotonic() < drain_until:
+            time.sleep(0.5)
+        watcher.stop()
+        fleet.close()
+        return report(scenario, fleet, watcher, lags)
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+        shutil.rmtree(spool_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("scenario", help="scenario JSON file")
+    parser.add_argument("--broker", help="host:port of a running broker instead of the stand-in")
+    parser.add_argument("--url", help="base URL of a running app instead of starting one")
+    parser.add_argument("--settle", type=float, default=3, help="seconds to let the bridge subscribe to --broker")
+    parser.add_argument("--poll-ms", type=int, default=50)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    with open(args.scenario) as f:
+        scenario = json.load(f)
+    print(f"{scenario.get('name', args.scenario)}: {scenario.get('description', '')}")
+    stages = run(scenario, args)
+    print_report(stages)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"scenario": scenario, "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "stages": stages},
+                      f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
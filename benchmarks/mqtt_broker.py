@@ -0,0 +1,151 @@
+"""A minimal in-process MQTT 3.1.1 broker for benchmarks.
+
+Supports what the bridge and a test publisher need: CONNECT, PUBLISH (QoS 0
+and 1, delivered to subscribers at QoS 0), SUBSCRIBE with + and # wildcards,
+UNSUBSCRIBE, PINGREQ and DISCONNECT. No retained messages, sessions, wills
+or authentication; use mosquitto for anything beyond a local benchmark.
+"""
+import asyncio
+import socket
+import threading
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+
+def topic_matches(pattern: str, topic: str) -> bool:
+    pattern_levels = pattern.split("/")
+    topic_levels = topic.split("/")
+    for i, level in enumerate(pattern_levels):
+        if level == "#":
+            return True
+        if i >= len(topic_levels) or (level != "+" and level != topic_levels[i]):
+            return False
+    return len(pattern_levels) == len(topic_levels)
+
+
+def encode_length(length: int) -> bytes:
+    encoded = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        encoded.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(encoded)
+
+
+def packet(packet_type: int, flags: int, body: bytes) -> bytes:
+    return bytes([packet_type << 4 | flags]) + encode_length(len(body)) + body
+
+
+def read_string(body: bytes, offset: int):
+    length = int.from_bytes(body[offset:offset + 2], "big")
+    return body[offset + 2:offset + 2 + length].decode(), offset + 2 + length
+
+
+class Client:
+    def __init__(self, writer):
+        self.writer = writer
+        self.subscriptions = set()
+
+
+class Broker:
+    def __init__(self):
+        self.clients = set()
+        self.received = 0
+        self.delivered = 0
+
+    async def _read_packet(self, reader):
+        header = await reader.readexactly(1)
+        length, multiplier = 0, 1
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            length += (byte & 0x7F) * multiplier
+            multiplier *= 128
+            if not byte & 0x80:
+                break
+        return header[0] >> 4, header[0] & 0x0F, await reader.readexactly(length)
+
+    async def handle(self, reader, writer):
+        client = Client(writer)
+        self.clients.add(client)
+        try:
+            while True:
+                packet_type, flags, body = await self._read_packet(reader)
+                if packet_type == CONNECT:
+                    writer.write(packet(CONNACK, 0, b"\x00\x00"))
+                elif packet_type == PUBLISH:
+                    await self._publish(client, flags, body)
+                elif packet_type == SUBSCRIBE:
+                    packet_id, offset, granted = body[:2], 2, bytearray()
+                    while offset < len(body):
+                        pattern, offset = read_string(body, offset)
+                        offset += 1  # requested QoS; everything is delivered at 0
+                        client.subscriptions.add(pattern)
+                        granted.append(0)
+                    writer.write(packet(SUBACK, 0, packet_id + bytes(granted)))
+                elif packet_type == UNSUBSCRIBE:
+                    offset = 2
+                    while offset < len(body):
+                        pattern, offset = read_string(body, offset)
+                        client.subscriptions.discard(pattern)
+                    writer.write(packet(UNSUBACK, 0, body[:2]))
+                elif packet_type == PINGREQ:
+                    writer.write(packet(PINGRESP, 0, b""))
+                elif packet_type == DISCONNECT:
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.clients.discard(client)
+            writer.close()
+
+    async def _publish(self, sender, flags, body):
+        self.received += 1
+        topic, offset = read_string(body, 0)
+        qos = flags >> 1 & 0x03
+        if qos:
+            sender.writer.write(packet(PUBACK, 0, body[offset:offset + 2]))
+            offset += 2
+        message = packet(PUBLISH, 0, body[:2 + len(topic.encode())] + body[offset:])
+        for client in list(self.clients):
+            if any(topic_matches(pattern, topic) for pattern in client.subscriptions):
+                client.writer.write(message)
+                self.delivered += 1
+                # Slow subscribers push back on the publisher instead of buffering without bound
+                await client.writer.drain()
+
+
+def start_broker(host="127.0.0.1", port=0):
+    """Runs a broker in a background thread; returns (broker, port)."""
+    broker = Broker()
+    sock = socket.socket()
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(128)
+    ready = threading.Event()
+
+    async def serve():
+        server = await asyncio.start_server(broker.handle, sock=sock)
+        ready.set()
+        async with server:
+            await server.serve_forever()
+
+    threading.Thread(target=asyncio.run, args=(serve(),), daemon=True).start()
+    ready.wait()
+    return broker, sock.getsockname()[1]
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1883)
+    args = parser.parse_args()
+    _, port = start_broker(args.host, args.port)
+    print(f"MQTT broker listening on {args.host}:{port}")
+    while True:
+        time.sleep(3600)
@@ -0,0 +1,70 @@
+"""Authenticated-request throughput for each session mode.
+
+Calls app.sessions.authenticate() with concurrent requests carrying a real
+session cookie, against the configured MySQL database:
+
+  db         every request looks the session up in the sessions table
+  db+cache   database sessions behind the per-worker LRU cache
+  signed     HMAC-signed token, verified without touching the database
+
+Usage: python -m benchmarks.session_modes [--requests 5000] [--concurrency 50]
+"""
+import argparse
+import asyncio
+import secrets
+import time
+
+from starlette.requests import Request
+
+from app import sessions
+from app.database import fetchone
+
+
+def request_with_cookie(session_id):
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(b"cookie", f"session_id={session_id}".encode())],
+    })
+
+
+async def measure(mode, requests, concurrency):
+    user = await fetchone("SELECT id FROM users ORDER BY id LIMIT 1")
+    if not user:
+        raise SystemExit("benchmark needs at least one row in users")
+
+    sessions.SESSION_MODE = "signed" if mode == "signed" else "db"
+    sessions.SESSION_SECRET = sessions.SESSION_SECRET or secrets.token_hex(32)
+    session_id = await sessions.start_session(user[0])
+    request = request_with_cookie(session_id)
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            if mode == "db":
+                sessions.session_cache.invalidate(session_id)
+            if await sessions.authenticate(request) != user[0]:
+                raise RuntimeError(f"{mode}: session did not resolve")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    await sessions.end_session(session_id)
+    return requests / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'mode':<10}{'req/s':>12}")
+    for mode in ("db", "db+cache", "signed"):
+        rate = asyncio.run(measure(mode, args.requests, args.concurrency))
+        print(f"{mode:<10}{rate:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Hot-path latency on the MySQL backend versus the embedded SQLite one.
+
+Runs cases of benchmarks.suite once per backend, each in its own process
+since the backend is chosen at import time. MySQL is the configured server;
+SQLite gets a fresh database file in a temporary directory. The wall time of
+each run, seeding included, shows what a test run on that backend costs.
+
+Usage: python -m benchmarks.storage_backends [--backends mysql,sqlite] [--scale 0.2]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+DEFAULT_CASES = "authenticate,login_flow,insert_sensor_data,add_temp,get_temp,clothes,get_all_sensor_data_10k"
+
+
+def run_suite(backend, cases, scale, directory):
+    output = os.path.join(directory, f"{backend}.json")
+    env = dict(os.environ, DB_BACKEND=backend, SQLITE_PATH=os.path.join(directory, "bench.sqlite3"))
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-m", "benchmarks.suite", "run", "--cases", cases, "--scale", str(scale), "--output", output],
+        env=env, stdout=subprocess.DEVNULL, check=True,
+    )
+    elapsed = time.perf_counter() - start
+    with open(output) as f:
+        return json.load(f)["cases"], elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", default="mysql,sqlite")
+    parser.add_argument("--cases", default=DEFAULT_CASES)
+    parser.add_argument("--scale", type=float, default=0.2, help="multiplies the suite's iteration counts")
+    args = parser.parse_args()
+
+    backends = args.backends.split(",")
+    results, wall = {}, {}
+    with tempfile.TemporaryDirectory(prefix="storage-backends-") as directory:
+        for backend in backends:
+            print(f"running {backend}...", file=sys.stderr, flush=True)
+            results[backend], wall[backend] = run_suite(backend, args.cases, args.scale, directory)
+
+    header = "".join(f"{backend + ' p50 ms':>18}{backend + ' req/s':>16}" for backend in backends)
+    print(f"{'case':<26}{header}")
+    for case in args.cases.split(","):
+        cells = "".join(
+            f"{results[backend][case]['p50_ms']:>18.3f}{results[backend][case]['throughput_per_s']:>16.1f}"
+            for backend in backends
+        )
+        print(f"{case:<26}{cells}")
+    print(f"{'wall time (s)':<26}" + "".join(f"{wall[backend]:>18.1f}{'':>16}" for backend in backends))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,383 @@
+"""Hot-path benchmark suite with stored baselines and regression checks.
+
+Drives the app in-process over ASGI, with its startup and shutdown handlers
+running as under a server, against the configured MySQL database. Point
+MYSQL_HOST, MYSQL_PORT and friends at a local server (for example
+docker run -e MYSQL_ROOT_PASSWORD=bench -e MYSQL_DATABASE=bench -p 3306:3306 mysql:8)
+rather than a shared one; startup applies the migrations, and the cases seed
+their own users, devices and readings on first use. Readings for the
+get_all_sensor_data cases are seeded once per scale and reused by later runs.
+
+Every case is timed twice: one request at a time for latency percentiles,
+then with its concurrency for throughput.
+
+  run      runs the cases; --output writes the results, --save-baseline
+           stores them as benchmarks/baselines/<baseline>.json
+  compare  compares a results file with a baseline and exits 1 when a case
+           regressed beyond its tolerance in benchmarks/baselines/tolerances.json
+  check    run followed by compare
+
+Usage: python -m benchmarks.suite run [--cases add_temp,login_flow] [--save-baseline]
+       python -m benchmarks.suite compare results.json [--baseline default]
+       python -m benchmarks.suite check [--baseline default]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, NamedTuple
+
+import httpx
+from starlette.requests import Request
+
+from app import sessions
+from app.database import fetchone
+from app.main import app
+from app.readings import insert_readings
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+TOLERANCES_PATH = os.path.join(BASELINE_DIR, "tolerances.json")
+PASSWORD = "bench"
+ROW_SCALES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+SEED_CHUNK = 10_000
+CLOTHES_ITEMS = 20
+# Metrics compared against the baseline, and whether lower is better
+METRICS = {"p50_ms": True, "p95_ms": True, "throughput_per_s": False}
+
+
+@asynccontextmanager
+async def running(application):
+    """Runs the app's startup handlers before the block and its shutdown handlers after."""
+    inbox, outbox = asyncio.Queue(), asyncio.Queue()
+    lifespan = asyncio.create_task(
+        application({"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}, inbox.get, outbox.put)
+    )
+    await inbox.put({"type": "lifespan.startup"})
+    message = await outbox.get()
+    if message["type"] != "lifespan.startup.complete":
+        raise RuntimeError(f"app startup failed: {message.get('message')}")
+    try:
+        yield
+    finally:
+        await inbox.put({"type": "lifespan.shutdown"})
+        await outbox.get()
+        await lifespan
+
+
+class Fixtures:
+    """Benchmark users, devices and data, created on first use."""
+
+    def __init__(self):
+        self._clients = {}
+
+    def new_client(self):
+        return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+
+    async def user(self, tag):
+        """Returns (client logged in as the user, email); the user is created if missing."""
+        if tag not in self._clients:
+            client = self.new_client()
+            email = f"bench-{tag}@example.com"
+            # Answers 500 once the user exists, which is fine
+            await client.post("/signup", data={
+                "name": "Benchmark", "email": email, "password": PASSWORD, "location": "bench", "PID": "A00000000",
+            })
+            response = await client.post("/login", data={"email": email, "password": PASSWORD})
+            # The client keeps the session cookie for the following requests
+            if "session_id" not in response.cookies:
+                raise RuntimeError(f"login as {email} failed: {response.status_code} {response.text}")
+            self._clients[tag] = (client, email)
+        return self._clients[tag]
+
+    async def device(self, tag, rows=0):
+        """Returns (client, device id) of a user owning a device with at least rows temperature readings."""
+        client, _ = await self.user(tag)
+        device_id = f"BE:NC:{tag.upper()}"
+        # Answers 400 once the device is registered
+        await client.post("/register-device", data={"mac_address": device_id})
+        have = (await fetchone("SELECT COUNT(*) FROM temperature WHERE device_id = %s", (device_id,)))[0]
+        if have < rows:
+            print(f"seeding {rows - have} readings for {device_id}", file=sys.stderr, flush=True)
+            start = datetime.now() - timedelta(seconds=rows)
+            for offset in range(have, rows, SEED_CHUNK):
+                await insert_readings("temperature", [
+                    (20 + (i % 100) / 10, "celsius", start + timedelta(seconds=i), device_id)
+                    for i in range(offset, min(offset + SEED_CHUNK, rows))
+                ])
+        return client, device_id
+
+    async def wardrobe(self, tag):
+        client, _ = await self.user(tag)
+        user_id = await sessions.authenticate(request_with_cookie(client.cookies["session_id"]))
+        have = (await fetchone("SELECT COUNT(*) FROM clothes WHERE user_id = %s", (user_id,)))[0]
+        for i in range(have, CLOTHES_ITEMS):
+            await client.post("/wardrobe", json={"clothingName": f"item {i}", "clothingColor": "grey", "clothingType": "shirt"})
+        return client
+
+    async def close(self):
+        for client, _ in self._clients.values():
+            await client.aclose()
+
+
+def request_with_cookie(session_id):
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(b"cookie", f"session_id={session_id}".encode())],
+    })
+
+
+def expect(response, *statuses):
+    if response.status_code not in statuses:
+        raise RuntimeError(f"{response.request.method} {response.request.url.path}: "
+                           f"{response.status_code} {response.text[:200]}")
+
+
+class Case(NamedTuple):
+    """A benchmark: setup returns the coroutine function timed once per iteration."""
+
+    setup: Callable[[Fixtures], Awaitable[Callable[[], Awaitable[None]]]]
+    iterations: int
+    concurrency: int
+
+
+async def authenticate_case(fixtures):
+    client, _ = await fixtures.user("suite")
+    request = request_with_cookie(client.cookies["session_id"])
+
+    async def call():
+        if await sessions.authenticate(request) is None:
+            raise RuntimeError("session did not resolve")
+    return call
+
+
+async def login_flow_case(fixtures):
+    _, email = await fixtures.user("suite")
+
+    async def call():
+        # A fresh client per login, like a new browser, so concurrent logins do not share cookies
+        async with fixtures.new_client() as client:
+            expect(await client.post("/login", data={"email": email, "password": PASSWORD}), 302)
+            # Log out again so the sessions table does not grow with every iteration
+            expect(await client.post("/logout"), 302)
+    return call
+
+
+async def insert_sensor_data_case(fixtures):
+    client, device_id = await fixtures.device("suite")
+
+    async def call():
+        expect(await client.post("/api/temperature", json={"value": 21.5, "unit": "celsius", "device_id": device_id}), 200)
+    return call
+
+
+async def add_temp_case(fixtures):
+    client, device_id = await fixtures.device("suite")
+
+    async def call():
+        expect(await client.post("/add_temp", json={"value": 21.5, "unit": "celsius", "mac_address": device_id}), 200)
+    return call
+
+
+def get_all_sensor_data_case(scale):
+    async def setup(fixtures):
+        client, _ = await fixtures.device(f"rows-{scale}", ROW_SCALES[scale])
+
+        async def call():
+            expect(await client.get("/api/temperature"), 200)
+        return call
+    return setup
+
+
+async def get_temp_case(fixtures):
+    client, device_id = await fixtures.device("rows-10k", ROW_SCALES["10k"])
+
+    async def call():
+        expect(await client.get(f"/get_temp/{device_id}"), 200)
+    return call
+
+
+async def clothes_case(fixtures):
+    client = await fixtures.wardrobe("suite")
+
+    async def call():
+        expect(await client.get("/clothes"), 200)
+    return call
+
+
+CASES = {
+    "authenticate": Case(authenticate_case, iterations=5000, concurrency=20),
+    "login_flow": Case(login_flow_case, iterations=500, concurrency=10),
+    "insert_sensor_data": Case(insert_sensor_data_case, iterations=1000, concurrency=10),
+    "add_temp": Case(add_temp_case, iterations=2000, concurrency=20),
+    "get_all_sensor_data_10k": Case(get_all_sensor_data_case("10k"), iterations=50, concurrency=4),
+    "get_all_sensor_data_100k": Case(get_all_sensor_data_case("100k"), iterations=10, concurrency=2),
+    "get_all_sensor_data_1m": Case(get_all_sensor_data_case("1m"), iterations=3, concurrency=1),
+    "get_temp": Case(get_temp_case, iterations=100, concurrency=4),
+    "clothes": Case(clothes_case, iterations=1000, concurrency=10),
+}
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+async def measure(call, iterations, concurrency):
+    # Warm caches and connections first
+    for _ in range(max(1, iterations // 20)):
+        await call()
+
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await call()
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+
+    remaining = iter(range(iterations))
+
+    async def worker():
+        for _ in remaining:
+            await call()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "iterations": iterations,
+        "concurrency": concurrency,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+        "throughput_per_s": round(iterations / elapsed, 1),
+    }
+
+
+async def run_cases(names, scale):
+    results = {}
+    fixtures = Fixtures()
+    async with running(app):
+        try:
+            for name in names:
+                case = CASES[name]
+                call = await case.setup(fixtures)
+                iterations = max(1, int(case.iterations * scale))
+                print(f"{name}: {iterations} iterations", file=sys.stderr, flush=True)
+                results[name] = await measure(call, iterations, case.concurrency)
+        finally:
+            await fixtures.close()
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "recorded_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "session_mode": sessions.SESSION_MODE,
+    }
+
+
+def baseline_path(name):
+    return os.path.join(BASELINE_DIR, f"{name}.json")
+
+
+def load_tolerances():
+    with open(TOLERANCES_PATH) as f:
+        return json.load(f)
+
+
+def compare(baseline, current, tolerances):
+    """Prints a comparison table and returns the regressions found, as strings."""
+    regressions = []
+    print(f"{'case':<26}{'metric':<18}{'baseline':>12}{'current':>12}{'change':>9}")
+    for name, result in current["cases"].items():
+        base = baseline["cases"].get(name)
+        if base is None:
+            print(f"{name:<26}(not in baseline)")
+            continue
+        allowed = {**tolerances["default"], **tolerances.get("cases", {}).get(name, {})}
+        for metric, lower_is_better in METRICS.items():
+            before, after = base[metric], result[metric]
+            change = (after - before) / before if before else 0.0
+            worse = change if lower_is_better else -change
+            limit = allowed["latency" if lower_is_better else "throughput"]
+            flag = ""
+            if worse > limit:
+                flag = "  REGRESSED"
+                regressions.append(f"{name} {metric}: {before} -> {after} ({change:+.0%}, allowed {limit:.0%})")
+            print(f"{name:<26}{metric:<18}{before:>12}{after:>12}{change:>+9.0%}{flag}")
+    return regressions
+
+
+def write_json(path, data):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+        f.write("\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    for command in ("run", "check"):
+        sub = commands.add_parser(command)
+        sub.add_argument("--cases", help="comma separated case names (default: all)")
+        sub.add_argument("--scale", type=float, default=1.0, help="multiplies every case's iteration count")
+        sub.add_argument("--output", help="write the results to this JSON file")
+        sub.add_argument("--baseline", default="default")
+        if command == "run":
+            sub.add_argument("--save-baseline", action="store_true")
+    sub = commands.add_parser("compare")
+    sub.add_argument("results")
+    sub.add_argument("--baseline", default="default")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        with open(args.results) as f:
+            current = json.load(f)
+    else:
+        names = args.cases.split(",") if args.cases else list(CASES)
+        unknown = [name for name in names if name not in CASES]
+        if unknown:
+            parser.error(f"unknown cases: {', '.join(unknown)}; choose from {', '.join(CASES)}")
+        current = {"environment": environment(), "cases": asyncio.run(run_cases(names, args.scale))}
+        if args.output:
+            write_json(args.output, current)
+        if args.command == "run":
+            if args.save_baseline:
+                write_json(baseline_path(args.baseline), current)
+                print(f"saved baseline {baseline_path(args.baseline)}")
+            print(json.dumps(current["cases"], indent=2))
+            return
+
+    path = baseline_path(args.baseline)
+    if not os.path.exists(path):
+        raise SystemExit(f"no baseline at {path}; record one with: python -m benchmarks.suite run --save-baseline")
+    with open(path) as f:
+        baseline = json.load(f)
+    regressions = compare(baseline, current, load_tolerances())
+    if regressions:
+        print("\nRegressions beyond tolerance:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print("\nNo regressions beyond tolerance")
+
+
+if __name__ == "__main__":
+    main()
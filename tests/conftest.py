@@ -0,0 +1,11 @@
+"""Points the app at a throwaway SQLite database unless DB_BACKEND says otherwise.
+
+Runs before any test module imports app, whose modules read their settings
+at import time.
+"""
+import os
+import tempfile
+
+os.environ.setdefault("DB_BACKEND", "sqlite")
+if os.environ["DB_BACKEND"] == "sqlite":
+    os.environ.setdefault("SQLITE_PATH", os.path.join(tempfile.mkdtemp(prefix="sensor-tests-"), "sensors.sqlite3"))
@@ -0,0 +1,87 @@
+"""Splitting an aggregate range into rollup buckets and raw edges, and summing the pieces.
+
+test_aggregate_matches_raw_readings drives GET /api/temperature/aggregate
+against the SQLite backend; the rest need no database.
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+
+from app.database import DB_BACKEND
+from app.main import add_totals, aggregate_windows, app
+from app.readings import insert_readings
+
+HOUR = 3600
+
+
+def test_windows_split_partial_buckets_into_raw_edges():
+    full, edges = aggregate_windows(datetime(2025, 1, 1, 10, 15), datetime(2025, 1, 1, 13, 29, 59), HOUR)
+    assert full == (datetime(2025, 1, 1, 11), datetime(2025, 1, 1, 13))
+    assert edges == [
+        (datetime(2025, 1, 1, 10, 15), datetime(2025, 1, 1, 11)),
+        (datetime(2025, 1, 1, 13), datetime(2025, 1, 1, 13, 30)),
+    ]
+
+
+def test_windows_aligned_range_has_no_edges():
+    full, edges = aggregate_windows(datetime(2025, 1, 1, 10), datetime(2025, 1, 1, 11, 59, 59), HOUR)
+    assert full == (datetime(2025, 1, 1, 10), datetime(2025, 1, 1, 12))
+    assert edges == []
+
+
+def test_windows_inside_one_bucket_are_all_raw():
+    start, end = datetime(2025, 1, 1, 10, 15), datetime(2025, 1, 1, 10, 45)
+    assert aggregate_windows(start, end, HOUR) == (None, [(start, end + timedelta(seconds=1))])
+
+
+def test_windows_open_ends():
+    assert aggregate_windows(None, None, HOUR) == ((None, None), [])
+    full, edges = aggregate_windows(datetime(2025, 1, 1, 10, 15), None, HOUR)
+    assert full == (datetime(2025, 1, 1, 11), None)
+    assert edges == [(datetime(2025, 1, 1, 10, 15), datetime(2025, 1, 1, 11))]
+
+
+def test_add_totals_combines_rows_of_one_bucket():
+    buckets = {}
+    add_totals(buckets, "dev", "2025-01-01 10:00:00", 2, 5, 7, 2)
+    add_totals(buckets, "dev", datetime(2025, 1, 1, 10), 1, 4, 5, 2)
+    add_totals(buckets, "other", datetime(2025, 1, 1, 10), 9, 9, 9, 1)
+    assert buckets == {
+        ("dev", datetime(2025, 1, 1, 10)): [1.0, 5.0, 12.0, 4],
+        ("other", datetime(2025, 1, 1, 10)): [9.0, 9.0, 9.0, 1],
+    }
+
+
+async def _aggregate(rows, params):
+    # Runs the startup handlers, which create the schema, and the shutdown ones
+    async with app.router.lifespan_context(app), httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        await client.post("/signup", data={
+            "name": "Test", "email": "aggregate@example.com", "password": "test", "location": "test", "PID": "A00000000",
+        })
+        await client.post("/login", data={"email": "aggregate@example.com", "password": "test"})
+        await client.post("/register-device", data={"mac_address": "AG:GR:EG:AT:E0:01"})
+        await insert_readings("temperature", [(value, "celsius", at, "AG:GR:EG:AT:E0:01") for value, at in rows])
+        response = await client.get("/api/temperature/aggregate", params=params)
+        assert response.status_code == 200, response.text
+        return response.json()
+
+
+@pytest.mark.skipif(DB_BACKEND != "sqlite", reason="writes to the test database")
+def test_aggregate_matches_raw_readings():
+    start = datetime(2025, 1, 1, 9, 50)
+    rows = [(float(i % 7), start + timedelta(minutes=7 * i)) for i in range(60)]
+    since, until = datetime(2025, 1, 1, 10, 15), datetime(2025, 1, 1, 14, 29, 59)
+    result = asyncio.run(_aggregate(rows, {
+        "bucket": "1h", "agg": "min,max,count,avg", "start-date": since.isoformat(), "end-date": until.isoformat(),
+    }))
+
+    expected = {}
+    for value, at in rows:
+        if since <= at <= until:
+            expected.setdefault(at.replace(minute=0), []).append(value)
+    assert [row["bucket"] for row in result] == [hour.strftime("%Y-%m-%d %H:%M:%S") for hour in sorted(expected)]
+    for row, values in zip(result, (expected[hour] for hour in sorted(expected))):
+        assert (row["min"], row["max"], row["count"]) == (min(values), max(values), len(values))
+        assert row["avg"] == pytest.approx(sum(values) / len(values))
@@ -0,0 +1,71 @@
+"""Merging archived Parquet rows with live rows in app.archive."""
+import asyncio
+
+import pyarrow as pa
+
+from app.archive import merge_chunks, merge_rows
+
+
+def by_value(row):
+    return row["value"], row["id"]
+
+
+def table(values):
+    return pa.Table.from_pylist([{"id": value, "value": value} for value in values])
+
+
+async def chunks_of(values, size, closed=None):
+    try:
+        for i in range(0, len(values), size):
+            yield [{"id": 100 + value, "value": value} for value in values[i:i + size]]
+    finally:
+        if closed is not None:
+            closed.append(True)
+
+
+async def collect(chunks):
+    return [chunk async for chunk in chunks]
+
+
+def test_merge_rows_puts_archived_rows_first_without_a_key():
+    assert merge_rows([{"value": 3}], [{"value": 1}]) == [{"value": 3}, {"value": 1}]
+
+
+def test_merge_rows_sorts_by_key():
+    archived = [{"id": 1, "value": 1}, {"id": 2, "value": 4}]
+    live = [{"id": 3, "value": 2}, {"id": 4, "value": 4}]
+    assert [row["id"] for row in merge_rows(archived, live, key=by_value)] == [1, 3, 2, 4]
+
+
+def test_merge_chunks_without_archive_passes_live_chunks_through():
+    result = asyncio.run(collect(merge_chunks(None, chunks_of([1, 2, 3], 2))))
+    assert [[row["value"] for row in chunk] for chunk in result] == [[1, 2], [3]]
+
+
+def test_merge_chunks_without_key_streams_archive_then_live():
+    result = asyncio.run(collect(merge_chunks(table([5, 6, 7]), chunks_of([1, 2], 2), chunk_size=2)))
+    assert [[row["value"] for row in chunk] for chunk in result] == [[5, 6], [7], [1, 2]]
+
+
+def test_merge_chunks_interleaves_by_key():
+    archived, live = [1, 3, 3, 8, 9, 10, 11], [2, 3, 4, 5]
+    result = asyncio.run(collect(merge_chunks(table(archived), chunks_of(live, 3), key=by_value, chunk_size=2)))
+    rows = [row for chunk in result for row in chunk]
+    assert [row["value"] for row in rows] == sorted(archived + live)
+    # Archived rows, with the lower ids, come before live rows of the same value
+    assert [row["id"] for row in rows if row["value"] == 3] == [3, 3, 103]
+    # Archived rows after the last live one go out chunk_size at a time
+    assert [[row["value"] for row in chunk] for chunk in result[-2:]] == [[8, 9], [10, 11]]
+
+
+def test_merge_chunks_closes_live_chunks_when_abandoned():
+    closed = []
+
+    async def first_chunk():
+        merged = merge_chunks(table([1, 2]), chunks_of([1, 2, 3, 4], 1, closed), key=by_value)
+        chunk = await anext(merged)
+        await merged.aclose()
+        return chunk
+
+    assert [row["value"] for row in asyncio.run(first_chunk())] == [1, 1]
+    assert closed == [True]
@@ -0,0 +1,81 @@
+"""WriteBehindBuffer.flush: isolating rejected rows and keeping rows on transient errors."""
+import asyncio
+
+import mysql.connector
+
+from app.ingest import WriteBehindBuffer
+
+
+class FakeWriter:
+    """Records written batches; raises for batches holding a rejected row or while failing."""
+
+    def __init__(self, rejected=(), failures=0):
+        self.rejected = set(rejected)
+        self.failures = failures
+        self.written = []
+
+    async def __call__(self, rows):
+        if self.failures:
+            self.failures -= 1
+            raise mysql.connector.errors.OperationalError("Lost connection")
+        if self.rejected.intersection(rows):
+            raise mysql.connector.errors.DataError("Out of range value")
+        self.written.append(list(rows))
+
+
+def flushed(writer, rows, flush_rows):
+    buffer = WriteBehindBuffer(writer, max_size=100, flush_interval=1, flush_rows=flush_rows)
+    for row in rows:
+        assert buffer.offer(row)
+    asyncio.run(buffer.flush())
+    return buffer
+
+
+def test_flush_writes_in_batches_of_flush_rows():
+    writer = FakeWriter()
+    buffer = flushed(writer, range(10), flush_rows=4)
+    assert writer.written == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+    assert buffer.stats()["flushed_rows"] == 10
+    assert buffer.stats()["flushes"] == 3
+
+
+def test_flush_drops_only_rejected_rows():
+    writer = FakeWriter(rejected={2, 5})
+    buffer = flushed(writer, range(8), flush_rows=8)
+    written = [row for batch in writer.written for row in batch]
+    assert written == [0, 1, 3, 4, 6, 7]
+    stats = buffer.stats()
+    assert (stats["dropped"], stats["flushed_rows"], stats["depth"]) == (2, 6, 0)
+
+
+def test_flush_keeps_unwritten_rows_in_order_on_transient_errors():
+    writer = FakeWriter(rejected={1})
+    buffer = WriteBehindBuffer(writer, max_size=100, flush_interval=1, flush_rows=4)
+    for row in range(6):
+        buffer.offer(row)
+
+    async def fail_after_first_split(rows):
+        # The batch is rejected, its first half written, then the connection drops
+        if len(writer.written) == 1 and len(rows) == 2:
+            raise mysql.connector.errors.OperationalError("Lost connection")
+        await writer(rows)
+
+    buffer._write_rows = fail_after_first_split
+    asyncio.run(buffer.flush())
+    assert writer.written == [[0]]
+    assert buffer.stats()["dropped"] == 1
+    assert buffer.stats()["failed_flushes"] == 1
+    assert buffer.stats()["depth"] == 4
+
+    buffer._write_rows = writer
+    asyncio.run(buffer.flush())
+    assert [row for batch in writer.written for row in batch] == [0, 2, 3, 4, 5]
+
+
+def test_flush_retries_everything_after_a_lost_connection():
+    writer = FakeWriter(failures=1)
+    buffer = flushed(writer, range(5), flush_rows=5)
+    assert writer.written == []
+    assert buffer.stats()["depth"] == 5
+    asyncio.run(buffer.flush())
+    assert writer.written == [[0, 1, 2, 3, 4]]
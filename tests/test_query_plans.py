@@ -0,0 +1,74 @@
+"""Fails when a hot query's plan falls back to a full table scan.
+
+Runs EXPLAIN on the queries the dashboard, sensor and wardrobe endpoints
+send, taken from app.queries, and fails if one of them reads one of its
+tables with access type ALL. The optimizer happily scans tiny tables, so
+point it at a database with representative data:
+
+    DB_BACKEND=mysql python -m pytest tests/test_query_plans.py
+
+Skipped unless DB_BACKEND is mysql and the database can be reached.
+"""
+from datetime import datetime
+
+import mysql.connector
+import pytest
+
+from app import queries
+from app.database import DB_BACKEND, db_cursor
+
+pytestmark = pytest.mark.skipif(DB_BACKEND != "mysql", reason="reads MySQL query plans")
+
+SENSOR_TYPES = ["temperature", "humidity", "light"]
+START, END = datetime(2025, 1, 1), datetime(2025, 1, 31, 23, 59, 59)
+
+
+def hot_queries(user_id, device_id):
+    """Yields (name, sql, params, tables that must not be scanned)."""
+    yield "get_temp", queries.TEMPERATURE_SINCE, (device_id, 0, 2 ** 31 - 1), {"temperature"}
+    for sensor_type in SENSOR_TYPES:
+        for name, order_by, paginated in [("", None, False), ("[page]", "timestamp", True)]:
+            sql, params = queries.sensor_rows(
+                sensor_type, user_id, None, START, END, order_by, None, None, 101 if paginated else None, paginated,
+            )
+            yield f"get_all_sensor_data[{sensor_type}]{name}", sql, params, {"s", "d"}
+        yield f"get_sensor_count[{sensor_type}]", queries.SENSOR_COUNT, (user_id, sensor_type), {"c", "d"}
+        for source, seconds in [("1m", 300), ("1h", 86400)]:
+            sql, params = queries.rollup_aggregate(sensor_type, source, seconds, user_id, START, END)
+            yield f"get_sensor_aggregate[{sensor_type}, {source}]", sql, params, {"r", "d"}
+        sql, params = queries.raw_aggregate(sensor_type, 3600, user_id, START, END, None)
+        yield f"get_sensor_aggregate[{sensor_type}, raw]", sql, params, {"s", "d"}
+        sql, params = queries.device_rows(sensor_type, device_id, None, START, END)
+        yield f"export_sensor_data[{sensor_type}]", sql, params, {sensor_type}
+    yield "device_ownership", queries.OWNED_DEVICE, (user_id, device_id), {"devices"}
+    yield "user_devices", queries.USER_DEVICES, (user_id,), {"devices"}
+    yield "sessions_by_user", queries.USER_SESSION, (user_id,), {"sessions"}
+    yield "get_clothes", queries.USER_CLOTHES, (user_id,), {"clothes"}
+    yield "delete_clothing", queries.DELETE_CLOTHING, (user_id, "shirt", "#000000", "top"), {"clothes"}
+
+
+@pytest.fixture(scope="module")
+def cursor():
+    try:
+        context = db_cursor(dictionary=True)
+        cursor = context.__enter__()
+    except mysql.connector.Error as e:
+        pytest.skip(f"MySQL is not reachable: {e}")
+    try:
+        yield cursor
+    finally:
+        context.__exit__(None, None, None)
+
+
+def test_hot_queries_use_an_index(cursor):
+    cursor.execute("SELECT d.user_id, d.device_id FROM devices d LIMIT 1")
+    row = cursor.fetchone()
+    user_id, device_id = (row["user_id"], row["device_id"]) if row else (1, "00:00:00:00:00:00")
+
+    failures = []
+    for name, sql, params, tables in hot_queries(user_id, device_id):
+        cursor.execute("EXPLAIN " + sql, params)
+        for step in cursor.fetchall():
+            if step["table"] in tables and step["type"] == "ALL":
+                failures.append(f"{name}: full scan of {step['table']} (~{step['rows']} rows)")
+    assert not failures, "\n".join(failures)
@@ -0,0 +1,58 @@
+"""Splitting uploads into lines and CSV records in app.streaming."""
+import asyncio
+
+import pytest
+
+from app import streaming
+from app.streaming import MalformedUpload, csv_records, text_lines
+
+
+async def chunks(*parts):
+    for part in parts:
+        yield part
+
+
+async def lines(*texts):
+    for number, text in enumerate(texts, 1):
+        yield number, text
+
+
+async def collect(iterator):
+    return [item async for item in iterator]
+
+
+def test_text_lines_joins_lines_split_across_chunks():
+    result = asyncio.run(collect(text_lines(chunks(b"\xef\xbb\xbfa,b\r\n1,", b"2\n\n3,4"))))
+    assert result == [(1, "a,b"), (2, "1,2"), (3, ""), (4, "3,4")]
+
+
+def test_text_lines_decodes_characters_split_across_chunks():
+    degree = "°C".encode()
+    result = asyncio.run(collect(text_lines(chunks(b"21.5 " + degree[:1], degree[1:] + b"\n"))))
+    assert result == [(1, "21.5 °C")]
+
+
+def test_text_lines_rejects_invalid_utf8():
+    with pytest.raises(MalformedUpload, match="Line 2 is not UTF-8"):
+        asyncio.run(collect(text_lines(chunks(b"ok\n\xff\n"))))
+
+
+def test_text_lines_rejects_overlong_lines(monkeypatch):
+    monkeypatch.setattr(streaming, "MAX_LINE_LENGTH", 8)
+    with pytest.raises(MalformedUpload, match="Line 2 is longer than 8"):
+        asyncio.run(collect(text_lines(chunks(b"short\n", b"0123456789"))))
+
+
+def test_csv_records_map_rows_to_the_header():
+    result = asyncio.run(collect(csv_records(lines(
+        " value , unit,timestamp", "21.5,celsius,", "", '"1,5",celsius,2025-01-01 00:00:00',
+    ))))
+    assert result == [
+        (2, {"value": "21.5", "unit": "celsius"}, None),
+        (4, {"value": "1,5", "unit": "celsius", "timestamp": "2025-01-01 00:00:00"}, None),
+    ]
+
+
+def test_csv_records_report_rows_of_the_wrong_width():
+    result = asyncio.run(collect(csv_records(lines("value,unit", "21.5", "21.5,celsius"))))
+    assert result == [(2, None, "Expected 2 fields, got 1"), (3, {"value": "21.5", "unit": "celsius"}, None)]